@@ -0,0 +1,448 @@
+import asyncio
+import base64
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from tools.log import get_logger
+from tools.shared_state import get_shared_redis, worker_count
+from tools.uploads import ImageData, SpooledUpload
+
+logger = get_logger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """A queued orchestrator run and the progress events it has produced so far."""
+
+    def __init__(self, image_bytes: Optional[ImageData], text: Optional[str], mode: str, filename: Optional[str]) -> None:
+        self.id = uuid.uuid4().hex
+        self.image_bytes = image_bytes
+        self.text = text
+        self.mode = mode
+        self.filename = filename
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._subscribers: List[asyncio.Queue] = []
+        # Extra destination for published events, e.g. a shared event stream
+        self.sink: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    def release(self) -> None:
+        """Drop the payload, removing a spooled upload from disk."""
+        if isinstance(self.image_bytes, SpooledUpload):
+            self.image_bytes.close()
+        self.image_bytes = None
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        event = {"job_id": self.id, "time": time.time(), **event}
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+        if self.sink is not None:
+            self.sink(event)
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every event so far, then new ones until the job finishes."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event["event"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "mode": self.mode,
+            "filename": self.filename,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": self.events,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    In-process job queue drained by a pool of worker tasks.
+
+    ``submit`` rejects new jobs with ``QueueFullError`` once ``JOB_QUEUE_SIZE``
+    jobs are waiting. Finished jobs are kept for ``JOB_RESULT_TTL_SECONDS`` and
+    at most ``JOB_MAX_RETAINED`` of them are retained, oldest dropped first.
+    On ``stop`` new jobs are refused and queued and running ones get
+    ``JOB_DRAIN_SECONDS`` to finish before they are cancelled.
+    """
+
+    def __init__(
+        self,
+        orchestrator: Any,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        max_retained: Optional[int] = None,
+        result_ttl: Optional[float] = None,
+        drain_timeout: Optional[float] = None,
+    ) -> None:
+        self.orchestrator = orchestrator
+        self.workers = workers if workers is not None else int(os.environ.get("JOB_WORKERS", "4"))
+        self.queue_size = queue_size if queue_size is not None else int(os.environ.get("JOB_QUEUE_SIZE", "100"))
+        self.max_retained = max_retained if max_retained is not None else int(os.environ.get("JOB_MAX_RETAINED", "1000"))
+        self.result_ttl = result_ttl if result_ttl is not None else float(os.environ.get("JOB_RESULT_TTL_SECONDS", "3600"))
+        self.drain_timeout = (
+            drain_timeout if drain_timeout is not None else float(os.environ.get("JOB_DRAIN_SECONDS", "30"))
+        )
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._worker(n)) for n in range(self.workers)]
+        logger.info("job_manager_started", workers=self.workers, queue_size=self.queue_size, shared=False)
+
+    async def _drained(self) -> None:
+        await self._queue.join()
+
+    async def stop(self) -> None:
+        self._closing = True
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._drained(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("job_drain_timeout", timeout=self.drain_timeout, queued=self.queued)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait().release()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def local_stats(self) -> Dict[str, Any]:
+        """This process's counters, read synchronously at metrics scrape time."""
+        return {"queued": self.queued, "retained": len(self.jobs), **self.stats}
+
+    async def summary(self) -> Dict[str, Any]:
+        return {**self.local_stats(), "shared": False}
+
+    def _check_open(self) -> None:
+        if self._queue is None:
+            raise RuntimeError("JobManager has not been started.")
+        if self._closing:
+            self.stats["rejected"] += 1
+            raise QueueFullError("Job queue is shutting down.")
+
+    async def submit(
+        self,
+        image_bytes: Optional[ImageData] = None,
+        text: Optional[str] = None,
+        mode: str = "staged",
+        filename: Optional[str] = None,
+    ) -> Job:
+        self._check_open()
+        job = Job(image_bytes, text, mode, filename)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise QueueFullError(f"Job queue is full ({self.queue_size} jobs waiting).")
+        self.stats["submitted"] += 1
+        self.jobs[job.id] = job
+        job.publish({"event": "queued"})
+        self._prune()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def subscribe(self, job: Job) -> AsyncIterator[Dict[str, Any]]:
+        return job.subscribe()
+
+    def _prune(self) -> None:
+        now = time.time()
+        finished = [job for job in self.jobs.values() if job.status in TERMINAL_STATUSES]
+        excess = len(finished) - self.max_retained
+        for job in finished:
+            if excess > 0 or now - job.finished_at > self.result_ttl:
+                del self.jobs[job.id]
+                excess -= 1
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        try:
+            await self._execute(job)
+        finally:
+            self.stats["completed" if job.status == "completed" else "failed"] += 1
+            self._prune()
+
+    async def _execute(self, job: Job) -> None:
+        """Run the job's pipeline and record the outcome on the job."""
+        job.status = "running"
+        job.started_at = time.time()
+        job.publish({"event": "running"})
+        try:
+            job.result = await self.orchestrator.run(
+                image_bytes=job.image_bytes, text=job.text, mode=job.mode, listener=job.publish,
+                correlation_id=job.id, filename=job.filename,
+            )
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "Job cancelled during shutdown"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e).splitlines()[0] if str(e) else type(e).__name__
+        finally:
+            # Drop the payload as soon as it is no longer needed
+            job.release()
+            job.finished_at = time.time()
+            job.publish({"event": job.status, "error": job.error} if job.error else {"event": job.status})
+
+
+# Push a job unless the shared queue is full; returns the new length or -1
+_SUBMIT_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[1]) then return -1 end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return redis.call('LPUSH', KEYS[1], ARGV[4])
+"""
+
+
+def _encode_job(job: Job) -> str:
+    record = {k: v for k, v in job.to_dict().items() if k != "events"}
+    record["text"] = job.text
+    if isinstance(job.image_bytes, SpooledUpload):
+        upload = job.image_bytes
+        record["upload"] = {
+            "path": upload.path, "size": upload.size, "sha256": upload.sha256,
+            "head": base64.b64encode(upload.head).decode("ascii"),
+        }
+    return json.dumps(record)
+
+
+def _decode_job(raw: bytes) -> Job:
+    record = json.loads(raw)
+    upload = record.get("upload")
+    image = None
+    if upload:
+        image = SpooledUpload(upload["path"], upload["size"], upload["sha256"], base64.b64decode(upload["head"]))
+    job = Job(image, record["text"], record["mode"], record["filename"])
+    job.id = record["job_id"]
+    for field in ("status", "created_at", "started_at", "finished_at", "result", "error"):
+        setattr(job, field, record[field])
+    return job
+
+
+class RedisJobManager(JobManager):
+    """
+    Job queue shared by every worker process through Redis.
+
+    Jobs are pushed onto a Redis list and popped by whichever worker has a
+    free slot. Each job's record (status, result) and its progress events
+    (a Redis stream) are stored under the job id, so any worker can answer
+    ``GET /jobs/{id}`` or stream its events. Uploads stay spooled on disk and
+    travel by path, so workers must share ``UPLOAD_SPOOL_DIR`` (as workers on
+    one host do). Records expire ``JOB_RESULT_TTL_SECONDS`` after their last
+    update; ``JOB_MAX_RETAINED`` does not apply. On ``stop`` a worker stops
+    taking jobs and finishes its running ones; queued jobs stay in Redis for
+    the other workers.
+    """
+
+    PREFIX = "formjobs"
+
+    def __init__(self, orchestrator: Any, redis: Any, **kwargs: Any) -> None:
+        super().__init__(orchestrator, **kwargs)
+        self.redis = redis
+        self.queue_key = f"{self.PREFIX}:queue"
+        self.stats_key = f"{self.PREFIX}:stats"
+        self._submit = redis.register_script(_SUBMIT_SCRIPT)
+        self._queued = 0
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.PREFIX}:job:{job_id}"
+
+    def _events_key(self, job_id: str) -> str:
+        return f"{self.PREFIX}:events:{job_id}"
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._closing = False
+        self._tasks = [asyncio.ensure_future(self._worker(n)) for n in range(self.workers)]
+        logger.info("job_manager_started", workers=self.workers, queue_size=self.queue_size, shared=True)
+
+    async def _drained(self) -> None:
+        # Workers exit once closing; only the jobs they hold need to finish
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @property
+    def queued(self) -> int:
+        # Last length seen by this worker; ``summary`` asks Redis
+        return self._queued
+
+    async def summary(self) -> Dict[str, Any]:
+        queued = await self.redis.llen(self.queue_key)
+        totals = await self.redis.hgetall(self.stats_key)
+        return {
+            "queued": queued,
+            **{key: 0 for key in self.stats},
+            **{key.decode(): int(value) for key, value in totals.items()},
+            "shared": True,
+        }
+
+    async def _count(self, key: str) -> None:
+        self.stats[key] += 1
+        await self.redis.hincrby(self.stats_key, key, 1)
+
+    async def _publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        events_key = self._events_key(job_id)
+        await self.redis.xadd(events_key, {"event": json.dumps(event)})
+        await self.redis.expire(events_key, int(self.result_ttl))
+
+    async def _save(self, job: Job) -> None:
+        await self.redis.set(self._job_key(job.id), _encode_job(job), ex=int(self.result_ttl))
+
+    async def submit(
+        self,
+        image_bytes: Optional[ImageData] = None,
+        text: Optional[str] = None,
+        mode: str = "staged",
+        filename: Optional[str] = None,
+    ) -> Job:
+        if self._closing:
+            self.stats["rejected"] += 1
+            raise QueueFullError("Job queue is shutting down.")
+        job = Job(image_bytes, text, mode, filename)
+        length = await self._submit(
+            keys=[self.queue_key, self._job_key(job.id)],
+            args=[self.queue_size, _encode_job(job), int(self.result_ttl), job.id],
+        )
+        if length < 0:
+            await self._count("rejected")
+            raise QueueFullError(f"Job queue is full ({self.queue_size} jobs waiting).")
+        self._queued = length
+        await self._count("submitted")
+        event = {"job_id": job.id, "time": time.time(), "event": "queued"}
+        job.events.append(event)
+        await self._publish(job.id, event)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        raw = await self.redis.get(self._job_key(job_id))
+        if raw is None:
+            return None
+        job = _decode_job(raw)
+        entries = await self.redis.xrange(self._events_key(job_id))
+        job.events = [json.loads(fields[b"event"]) for _, fields in entries]
+        return job
+
+    async def subscribe(self, job: Job) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every event so far, then new ones (from any worker) until the job finishes."""
+        events_key, last = self._events_key(job.id), "0"
+        while True:
+            reply = await self.redis.xread({events_key: last}, count=100, block=5000)
+            if not reply:
+                if not await self.redis.exists(self._job_key(job.id)):
+                    return
+                continue
+            for _, entries in reply:
+                for entry_id, fields in entries:
+                    last = entry_id
+                    event = json.loads(fields[b"event"])
+                    yield event
+                    if event["event"] in TERMINAL_STATUSES:
+                        return
+
+    async def _worker(self, n: int) -> None:
+        while not self._closing:
+            try:
+                popped = await self.redis.brpop(self.queue_key, timeout=1)
+                if popped is None:
+                    continue
+                self._queued = await self.redis.llen(self.queue_key)
+                raw = await self.redis.get(self._job_key(popped[1].decode()))
+            except Exception as e:
+                logger.warning("job_queue_redis_error", error=str(e))
+                await asyncio.sleep(1)
+                continue
+            if raw is None:
+                continue  # expired while queued
+            await self._run(_decode_job(raw))
+
+    async def _run(self, job: Job) -> None:
+        # Events are written to the stream in order by one task per job
+        pending: asyncio.Queue = asyncio.Queue()
+        job.sink = pending.put_nowait
+
+        async def forward() -> None:
+            while True:
+                event = await pending.get()
+                if event is None:
+                    return
+                if event["event"] == "running":
+                    await self._save(job)
+                await self._publish(job.id, event)
+
+        forwarder = asyncio.ensure_future(forward())
+        try:
+            await self._execute(job)
+        finally:
+            pending.put_nowait(None)
+            try:
+                await self._count("completed" if job.status == "completed" else "failed")
+                await self._save(job)
+                await forwarder
+            except Exception as e:
+                forwarder.cancel()
+                logger.warning("job_queue_redis_error", job_id=job.id, error=str(e))
+
+
+def create_job_manager(orchestrator: Any) -> JobManager:
+    """
+    A job queue shared between workers through Redis when ``REDIS_URL`` is
+    set, otherwise one in this process. Without Redis, jobs are only visible
+    to the worker that accepted them, so with ``WEB_CONCURRENCY`` above 1
+    status requests can land on a worker that does not know the job.
+    """
+    redis = get_shared_redis()
+    if redis is not None:
+        return RedisJobManager(orchestrator, redis)
+    if worker_count() > 1:
+        logger.warning("jobs_not_shared", workers=worker_count(), reason="REDIS_URL not set")
+    return JobManager(orchestrator)
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+from tools.log import get_logger
+
+logger = get_logger(__name__)
+
+AGENT_INIT_MODES = ("background", "eager", "lazy")
+
+
+class LazyOrchestrator:
+    """
+    Stands in for ``OrchestratorAgent`` until it is needed, so a worker starts
+    serving before ADK and the tools (OpenCV, PDF rendering, ...) are imported.
+
+    ``AGENT_INIT`` picks when the agent is built: ``background`` (default)
+    starts building it in a thread at startup without waiting, ``eager``
+    builds it before startup completes, and ``lazy`` waits for the first
+    pipeline run. Runs arriving while it is being built wait for it; a
+    failed build is retried by the next run.
+    """
+
+    def __init__(self, init: Optional[str] = None) -> None:
+        self.init = init or os.environ.get("AGENT_INIT", "background")
+        if self.init not in AGENT_INIT_MODES:
+            raise ValueError(f"Unknown AGENT_INIT '{self.init}'. Expected one of {AGENT_INIT_MODES}.")
+        self._agent: Optional[Any] = None
+        self._loading: Optional[asyncio.Future] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._agent is not None
+
+    @staticmethod
+    def _build() -> Any:
+        start = time.perf_counter()
+        from agents.orchestrator import OrchestratorAgent
+        agent = OrchestratorAgent()
+        logger.info("orchestrator_initialized", duration=round(time.perf_counter() - start, 3))
+        return agent
+
+    def _loaded(self, future: asyncio.Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            if not future.cancelled():
+                logger.error("orchestrator_init_failed", error=repr(future.exception()))
+            self._loading = None
+        else:
+            self._agent = future.result()
+
+    def load(self) -> asyncio.Future:
+        """Start building the agent in a worker thread unless already started."""
+        if self._loading is None:
+            self._loading = asyncio.get_running_loop().run_in_executor(None, self._build)
+            self._loading.add_done_callback(self._loaded)
+        return self._loading
+
+    async def get(self) -> Any:
+        if self._agent is None:
+            # Shielded: a cancelled request must not fail the build for everyone else
+            self._agent = await asyncio.shield(self.load())
+        return self._agent
+
+    async def start(self) -> None:
+        if self.init == "eager":
+            await self.get()
+        elif self.init == "background":
+            self.load()
+
+    async def run(self, **kwargs: Any) -> Dict[str, Any]:
+        agent = await self.get()
+        return await agent.run(**kwargs)
@@ -1,10 +1,10 @@
 from google.adk import Agent
-from tools.vision_tools import VisionTools
+from tools.ocr_tools import OCRTool
 
 class OCRAgent(Agent):
     def __init__(self):
-        vision_tool = VisionTools()
+        ocr_tool = OCRTool()
         super().__init__(
             name="OCRAgent",
-            tools=[vision_tool]
+            tools=[ocr_tool]
         )
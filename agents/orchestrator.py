@@ -1,8 +1,28 @@
 from google.adk import Agent
-from typing import Optional, Dict, List, Any
-from tools.vision_tools import VisionTools
-from tools.text_tools import NERTool, ClassifierTool, RouterTool
+from typing import Optional, Dict, List, Any, Awaitable, Callable
+from tools.ocr_tools import OCRTool
+from tools.text_tools import NERTool, ClassifierTool, RouterTool, FusedExtractionTool, FusedParseError, FORM_TYPES
+from tools.cache import get_result_cache, content_hash, normalize_text, cache_version
+from tools.gemini_client import get_gemini_client
+from tools.governance import UpstreamUnavailableError
+from tools.pdf_tools import PdfDocument, is_pdf
+from tools.uploads import ImageData, SpooledUpload, data_hash
+from tools.fast_path import fast_path_enabled, get_fast_path_classifier, get_department_table
+from tools.metrics import PIPELINE_DURATION, PIPELINES_IN_PROGRESS
+from tools.log import correlation_scope, get_logger
+from tools.log_store import get_log_store
+from agents.pipeline import (
+    PIPELINE_MODES, Stage, StageGraph, StageListener, coalescing_enabled, get_single_flight, get_stage_limiter,
+)
+from agents.pages import PageAssembler
+import asyncio
+import copy
+import os
+import time
 import traceback
+import uuid
+
+logger = get_logger(__name__)
 
 class OrchestratorAgent(Agent):
     def __init__(self):
@@ -11,52 +31,431 @@ class OrchestratorAgent(Agent):
             name="OrchestratorAgent",
             # Add tools to the agent so they're accessible and properly managed
             tools=[
-                VisionTools(),
+                OCRTool(),
                 NERTool(),
                 ClassifierTool(),
-                RouterTool()
+                RouterTool(),
+                FusedExtractionTool()
             ]
         )
-        print(f"Orchestrator initialized with tools: {[tool.name for tool in self.tools]}")
-
-    async def run(self, image_bytes: Optional[bytes] = None, text: Optional[str] = None):
-        agent_workflow = ["Orchestrator"]
-        
-        try:            
-            if image_bytes:
-                # 1. OCR processing
-                print(f"Starting OCR processing with tool: {self.tools[0].name}")
-                text = await self.tools[0].call(image_bytes=image_bytes)
-                print(f"OCR processing completed. Extracted text length: {len(text)}")
-                agent_workflow.append("OCRAgent")
-            elif not text:
+        logger.debug("orchestrator_initialized", tools=[tool.name for tool in self.tools])
+
+    def build_stages(self, with_ocr: bool, pdf: bool = False) -> StageGraph:
+        """
+        Build the dependency graph of pipeline stages.
+
+        NER and classification only need the text, so they run concurrently;
+        routing waits for the form type. For multi-page PDFs NER and
+        classification start straight away and consume pages as OCR
+        completes them instead of waiting for the whole document.
+        """
+        if with_ocr and pdf:
+            return StageGraph([
+                Stage("ocr", "OCRAgent", self._ocr_pdf),
+                Stage("ner", "NERAgent", self._ner_pdf),
+                Stage("classify", "ClassifierAgent", self._classify_pdf),
+                Stage("route", "RouterAgent", self._route, depends_on=("classify",)),
+            ])
+        text_dep = ("ocr",) if with_ocr else ()
+        stages = []
+        if with_ocr:
+            stages.append(Stage("ocr", "OCRAgent", self._ocr))
+        stages += [
+            Stage("ner", "NERAgent", self._ner, depends_on=text_dep),
+            Stage("classify", "ClassifierAgent", self._classify, depends_on=text_dep),
+            Stage("route", "RouterAgent", self._route, depends_on=text_dep + ("classify",)),
+        ]
+        return StageGraph(stages)
+
+    def build_fused_stages(self, with_ocr: bool, pdf: bool = False) -> StageGraph:
+        """Build the graph for fused mode: one extraction request after OCR."""
+        text_dep = ("ocr",) if with_ocr else ()
+        stages = []
+        if with_ocr:
+            stages.append(Stage("ocr", "OCRAgent", self._ocr_pdf if pdf else self._ocr))
+        stages.append(Stage("fused", "FusedExtractionAgent", self._fused, depends_on=text_dep))
+        return StageGraph(stages)
+
+    @staticmethod
+    def _text(ctx: Dict[str, Any]) -> str:
+        return ctx.get("ocr") or ctx["text"]
+
+    @staticmethod
+    async def _cached(
+        stage: str, tool: Any, key: str, compute: Callable[[], Awaitable[Any]], *version_parts: str
+    ) -> Any:
+        """
+        Look up a stage result by content key. The key is versioned with the
+        tool's signature (its prompt version and budget, or OCR settings), the
+        form type list, the model name and any extra ``version_parts`` so that
+        changing any of them invalidates previously cached results.
+        """
+        version = cache_version(tool.signature(), ", ".join(FORM_TYPES), get_gemini_client().model, *version_parts)
+
+        async def limited() -> Any:
+            # Only cache misses reach Gemini, so only they take a stage slot
+            async with get_stage_limiter().slot(stage):
+                return await compute()
+
+        return await get_result_cache().get_or_compute(stage, f"{version}:{key}", limited)
+
+    def _text_key(self, ctx: Dict[str, Any]) -> str:
+        if "text_key" not in ctx:
+            ctx["text_key"] = content_hash(normalize_text(self._text(ctx)))
+        return ctx["text_key"]
+
+    async def _ocr(self, ctx: Dict[str, Any]) -> str:
+        page = await self._cached(
+            "ocr", self.tools[0], data_hash(ctx["image_bytes"]),
+            lambda: self.tools[0].call(image_bytes=ctx["image_bytes"]),
+        )
+        ctx["ocr_pages"] = [{"page": 1, **{k: v for k, v in page.items() if k != "text"}}]
+        logger.debug("ocr_completed", backend=page["backend"], text_length=len(page["text"]))
+        return page["text"]
+
+    async def _ocr_pdf(self, ctx: Dict[str, Any]) -> str:
+        """
+        OCR a PDF page by page with at most ``PDF_PAGE_CONCURRENCY`` pages
+        rendered and in flight at once, handing each page's text to the
+        page assembler as soon as it is read.
+        """
+        document: PdfDocument = ctx["pdf"]
+        pages: PageAssembler = ctx["pages"]
+        tool = self.tools[0]
+        doc_key = data_hash(ctx["image_bytes"])
+        concurrency = int(os.environ.get("PDF_PAGE_CONCURRENCY", "4"))
+        results: Dict[int, Dict[str, Any]] = {}
+        next_page = iter(range(document.page_count))
+        logger.debug("pdf_ocr_started", pages=document.page_count, tool=tool.name)
+
+        async def read_page(index: int) -> Dict[str, Any]:
+            return await tool.call(image_bytes=await document.arender_page(index))
+
+        async def worker() -> None:
+            # Workers share one page iterator, so pages start in order and
+            # no more than ``concurrency`` rendered pages exist at a time
+            for index in next_page:
+                page = await self._cached(
+                    "ocr", tool, f"{doc_key}:p{index}", lambda: read_page(index), f"dpi={document.dpi}",
+                )
+                results[index] = {"page": index + 1, **{k: v for k, v in page.items() if k != "text"}}
+                await pages.add(index, page["text"])
+                if ctx.get("listener") is not None:
+                    ctx["listener"]({"event": "page_completed", "page": index + 1, "pages": document.page_count})
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(concurrency, document.page_count))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException as e:
+            for task in workers:
+                task.cancel()
+            await pages.fail(e)
+            raise
+        ctx["ocr_pages"] = [results[i] for i in sorted(results)]
+        logger.debug("pdf_ocr_completed", pages=document.page_count, text_length=len(pages.text))
+        return pages.text
+
+    async def _ner_pdf(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run NER on each run of ``PDF_NER_CHUNK_PAGES`` pages as soon as OCR
+        has produced it, then merge the entities in page order (the first
+        value seen for a field wins).
+        """
+        chunk_pages = int(os.environ.get("PDF_NER_CHUNK_PAGES", "4"))
+
+        async def extract(chunk_text: str, form_type: Optional[str]) -> Dict[str, Any]:
+            return await self._cached(
+                "ner", self.tools[1], f"{content_hash(normalize_text(chunk_text))}:{content_hash(form_type or '')}",
+                lambda: self.tools[1].call(text=chunk_text, form_type=form_type),
+            )
+
+        tasks = []
+        form_type = None
+        try:
+            async for _, chunk_text in ctx["pages"].chunks(chunk_pages):
+                if not tasks:
+                    # Later chunks are continuation pages; the first carries the title
+                    form_type = self._schema_form_type(chunk_text)
+                tasks.append(asyncio.ensure_future(extract(chunk_text, form_type)))
+            chunk_entities = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        entities: Dict[str, Any] = {}
+        for chunk in chunk_entities:
+            for key, value in chunk.items():
+                entities.setdefault(key, value)
+        logger.debug("ner_completed", fields=sorted(entities))
+        return entities
+
+    async def _classify_pdf(self, ctx: Dict[str, Any]) -> str:
+        """Classify from the leading ``PDF_HEADER_PAGES`` pages, which carry the form title."""
+        header_text = await ctx["pages"].prefix(int(os.environ.get("PDF_HEADER_PAGES", "1")))
+        ctx["header_text"] = header_text
+        return await self._classify_text(ctx, header_text, content_hash(normalize_text(header_text)))
+
+    async def _classify_text(self, ctx: Dict[str, Any], text: str, key: str) -> str:
+        """
+        Answer from the local fast-path classifier when it is confident enough,
+        otherwise ask Gemini. The decision path is recorded in ``ctx["decisions"]``.
+        """
+        if fast_path_enabled():
+            classifier = get_fast_path_classifier()
+            form_type, confidence = classifier.classify(text)
+            if confidence >= classifier.threshold:
+                logger.debug("classified", method="fast-path", form_type=form_type, confidence=confidence)
+                ctx["decisions"]["classify"] = {"method": "fast-path", "confidence": confidence}
+                return form_type
+        form_type = await self._cached(
+            "classify", self.tools[2], key,
+            lambda: self.tools[2].call(text=text),
+        )
+        ctx["decisions"]["classify"] = {"method": "llm", "confidence": None}
+        logger.debug("classified", method="llm", form_type=form_type)
+        return form_type
+
+    @staticmethod
+    def _schema_form_type(text: str) -> Optional[str]:
+        """
+        The fast-path classifier's guess at the form type, which picks the
+        field schema NER asks for without waiting for the classify stage.
+        ``None`` (a generic schema) when the fast path is disabled or below
+        ``NER_SCHEMA_MIN_CONFIDENCE``.
+        """
+        if not fast_path_enabled():
+            return None
+        form_type, confidence = get_fast_path_classifier().classify(text)
+        if confidence < float(os.environ.get("NER_SCHEMA_MIN_CONFIDENCE", "0.3")):
+            return None
+        return form_type
+
+    async def _ner(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        form_type = self._schema_form_type(self._text(ctx))
+        entities = await self._cached(
+            "ner", self.tools[1], f"{self._text_key(ctx)}:{content_hash(form_type or '')}",
+            lambda: self.tools[1].call(text=self._text(ctx), form_type=form_type),
+        )
+        logger.debug("ner_completed", fields=sorted(entities))
+        return entities
+
+    async def _classify(self, ctx: Dict[str, Any]) -> str:
+        return await self._classify_text(ctx, self._text(ctx), self._text_key(ctx))
+
+    async def _route(self, ctx: Dict[str, Any]) -> str:
+        if fast_path_enabled():
+            department = get_department_table().lookup(ctx["classify"])
+            if department is not None:
+                # The table is exact for a known form type, so routing is as
+                # certain as the classification it depends on
+                logger.debug("routed", method="department-table", department=department)
+                confidence = ctx["decisions"].get("classify", {}).get("confidence")
+                ctx["decisions"]["route"] = {"method": "department-table", "confidence": confidence}
+                return department
+        # PDFs are routed from the header pages so routing need not wait for every page
+        text = ctx.get("header_text") or self._text(ctx)
+        suggested_route = await self._cached(
+            "route", self.tools[3], f"{content_hash(normalize_text(text))}:{content_hash(ctx['classify'])}",
+            lambda: self.tools[3].call(text=text, form_type=ctx["classify"]),
+        )
+        ctx["decisions"]["route"] = {"method": "llm", "confidence": None}
+        logger.debug("routed", method="llm", department=suggested_route)
+        return suggested_route
+
+    async def _fused(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._cached(
+            "fused", self.tools[4], self._text_key(ctx),
+            lambda: self.tools[4].call(text=self._text(ctx)),
+        )
+
+    @staticmethod
+    def _workflow(graph: StageGraph, ctx: Dict[str, Any], names: Optional[List[str]] = None) -> List[str]:
+        """Agent names for ``names`` (default: every stage), tagging OCR with the backend(s) used."""
+        entries = []
+        for name in names if names is not None else graph.order:
+            agent = graph.stages[name].agent
+            if name == "ocr" and ctx.get("ocr_pages"):
+                backends = sorted({page["backend"] for page in ctx["ocr_pages"]})
+                agent = f"{agent} ({', '.join(backends)})"
+            entries.append(agent)
+        return entries
+
+    async def run(
+        self,
+        image_bytes: Optional[ImageData] = None,
+        text: Optional[str] = None,
+        mode: str = "staged",
+        listener: Optional[StageListener] = None,
+        correlation_id: Optional[str] = None,
+        filename: Optional[str] = None,
+    ):
+        """
+        Process a form image or text. ``image_bytes`` may be a
+        ``SpooledUpload``, which is then read from disk as stages need it.
+
+        ``mode`` selects the pipeline: ``"staged"`` runs NER, classification
+        and routing as separate requests; ``"fused"`` asks for all three in a
+        single request and falls back to the staged pipeline if the response
+        does not validate. ``listener`` receives stage started/completed
+        events as the pipeline progresses. Concurrent runs of the same input
+        and mode share one execution (see ``_run_coalesced``). Log events
+        from the pipeline and its tools carry ``correlation_id`` (or the id
+        bound by the caller, or a fresh one). Every run, successful or not,
+        is recorded in the processing log store under ``filename``.
+        """
+        started_at = time.time()
+        start = time.perf_counter()
+        status = "error"
+        result = None
+        error: Optional[BaseException] = None
+        with correlation_scope(correlation_id) as correlation_id:
+            logger.info(
+                "pipeline_started", mode=mode,
+                input="image" if image_bytes else "text",
+                input_length=len(image_bytes) if image_bytes else len(text or ""),
+            )
+            try:
+                with PIPELINES_IN_PROGRESS.track_inprogress():
+                    result = await self._run_coalesced(image_bytes, text, mode, listener)
+                status = "fallback" if result["fallback"] else "ok"
+                logger.info(
+                    "pipeline_completed", mode=result["pipeline_mode"], status=status,
+                    form_type=result["form_type"], department=result["suggested_route"],
+                    duration=round(time.perf_counter() - start, 4),
+                )
+                return result
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                PIPELINE_DURATION.labels(mode if mode in PIPELINE_MODES else "invalid", status).observe(duration)
+                get_log_store().record({
+                    "id": uuid.uuid4().hex,
+                    "timestamp": started_at,
+                    "correlation_id": correlation_id,
+                    "filename": filename,
+                    "input_type": "image" if image_bytes else "text",
+                    "mode": result["pipeline_mode"] if result else mode,
+                    "form_type": result["form_type"] if result else None,
+                    "department": result["suggested_route"] if result else None,
+                    "status": "completed" if result else "failed" if isinstance(error, Exception) else "cancelled",
+                    "fallback": bool(result and result["fallback"]),
+                    "processing_time": round(duration, 4),
+                    "stage_timings": {t["stage"]: t["duration"] for t in result["stage_timings"]} if result else {},
+                    # Only the exception type: messages can quote document content
+                    "error": type(error).__name__ if error is not None else None,
+                })
+
+    async def _run_coalesced(
+        self,
+        image_bytes: Optional[ImageData],
+        text: Optional[str],
+        mode: str,
+        listener: Optional[StageListener],
+    ):
+        """
+        ``_run``, shared with identical runs already in flight: a double
+        submission or a client retry of the same image bytes or text in the
+        same mode waits for the first one's result (its own copy) instead of
+        calling Gemini again. Disabled with ``PIPELINE_COALESCE=false``.
+        """
+        if not coalescing_enabled() or not (image_bytes or text):
+            return await self._run(image_bytes, text, mode, listener)
+        key = f"{mode}:image:{data_hash(image_bytes)}" if image_bytes else f"{mode}:text:{content_hash(text)}"
+        return await get_single_flight().do(
+            key, lambda broadcast: self._run_shared(image_bytes, text, mode, broadcast), listener, share=copy.deepcopy
+        )
+
+    async def _run_shared(
+        self,
+        image_bytes: Optional[ImageData],
+        text: Optional[str],
+        mode: str,
+        listener: Optional[StageListener],
+    ):
+        if not isinstance(image_bytes, SpooledUpload):
+            return await self._run(image_bytes, text, mode, listener)
+        # The run can outlive the request that started it, whose upload is
+        # closed when that request ends, so it reads its own link to the file.
+        # Taken in the task's first step, before the starting caller can
+        # handle a cancellation and close its upload.
+        upload = image_bytes.link()
+        try:
+            return await self._run(upload, text, mode, listener)
+        finally:
+            upload.close()
+
+    async def _run(
+        self,
+        image_bytes: Optional[ImageData],
+        text: Optional[str],
+        mode: str,
+        listener: Optional[StageListener],
+    ):
+        document: Optional[PdfDocument] = None
+        try:
+            if not image_bytes and not text:
                 raise ValueError("Either image_bytes or text must be provided.")
+            if mode not in PIPELINE_MODES:
+                raise ValueError(f"Unknown pipeline mode '{mode}'. Expected one of {PIPELINE_MODES}.")
+
+            ctx: Dict[str, Any] = {"image_bytes": image_bytes, "text": text, "listener": listener, "decisions": {}}
+            pdf = bool(image_bytes) and is_pdf(image_bytes)
+            if pdf:
+                document = ctx["pdf"] = await PdfDocument.open(image_bytes)
+                ctx["pages"] = PageAssembler(document.page_count)
+            stage_timings: List[Dict[str, Any]] = []
+            agent_workflow = ["Orchestrator"]
+            fallback = False
+
+            if mode == "fused":
+                graph = self.build_fused_stages(with_ocr=bool(image_bytes), pdf=pdf)
+                try:
+                    await graph.run(ctx, stage_timings, listener)
+                    agent_workflow += self._workflow(graph, ctx)
+                    return {
+                        "form_type": ctx["fused"]["form_type"],
+                        "extracted_fields": ctx["fused"]["fields"],
+                        "suggested_route": ctx["fused"]["department"],
+                        "agent_workflow": agent_workflow,
+                        "stage_timings": stage_timings,
+                        "pipeline_mode": "fused",
+                        "fallback": False,
+                        "decisions": {stage: {"method": "llm-fused", "confidence": None} for stage in ("classify", "route")},
+                        "ocr_text": self._text(ctx),
+                        "ocr_pages": ctx.get("ocr_pages", [])
+                    }
+                except FusedParseError as e:
+                    logger.warning("fused_fallback", error=str(e))
+                    fallback = True
+                    agent_workflow += self._workflow(
+                        graph, ctx, [name for name in graph.order if name != "fused" and name in ctx]
+                    )
+
+            # Reuse OCR output from a failed fused attempt rather than calling Vision again
+            graph = self.build_stages(with_ocr=bool(image_bytes) and "ocr" not in ctx, pdf=pdf)
+            await graph.run(ctx, stage_timings, listener)
 
-            # 2. NER processing
-            print(f"Starting NER processing with tool: {self.tools[1].name}")
-            entities = await self.tools[1].call(text=text)
-            print(f"NER processing completed. Extracted entities: {entities}")
-            agent_workflow.append("NERAgent")
-
-            # 3. Classifier processing
-            print(f"Starting classification with tool: {self.tools[2].name}")
-            form_type = await self.tools[2].call(text=text)
-            print(f"Classification completed. Form type: {form_type}")
-            agent_workflow.append("ClassifierAgent")            # 4. Router processing
-            print(f"Starting routing with tool: {self.tools[3].name}")
-            suggested_route = await self.tools[3].call(text=text, form_type=form_type)
-            print(f"Routing completed. Suggested route: {suggested_route}")
-            agent_workflow.append("RouterAgent")
-            
+            agent_workflow += self._workflow(graph, ctx)
             return {
-                "form_type": form_type,
-                "extracted_fields": entities,
-                "suggested_route": suggested_route,
+                "form_type": ctx["classify"],
+                "extracted_fields": ctx["ner"],
+                "suggested_route": ctx["route"],
                 "agent_workflow": agent_workflow,
-                "ocr_text": text  # Include the extracted or provided text
+                "stage_timings": stage_timings,
+                "pipeline_mode": "staged",
+                "fallback": fallback,
+                "decisions": ctx["decisions"],
+                "ocr_text": self._text(ctx),  # Include the extracted or provided text
+                "ocr_pages": ctx.get("ocr_pages", [])
             }
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             error_trace = traceback.format_exc()
-            print(f"Error in OrchestratorAgent.run: {str(e)}")
-            print(f"Traceback: {error_trace}")
+            logger.exception("pipeline_failed")
             raise Exception(f"Error in OrchestratorAgent.run: {str(e)}\n{error_trace}")
+        finally:
+            if document is not None:
+                document.close()
@@ -0,0 +1,62 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+
+class PageAssembler:
+    """
+    Collects per-page OCR text that arrives out of order and lets downstream
+    stages consume the document in page order as soon as a contiguous run of
+    pages is available.
+    """
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self._texts: Dict[int, str] = {}
+        self._ready = 0  # number of contiguous pages available from the start
+        self._error: Optional[BaseException] = None
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # Created on first use so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def add(self, index: int, text: str) -> None:
+        async with self.condition:
+            self._texts[index] = text
+            while self._ready in self._texts:
+                self._ready += 1
+            self.condition.notify_all()
+
+    async def fail(self, error: BaseException) -> None:
+        async with self.condition:
+            self._error = error
+            self.condition.notify_all()
+
+    def _join(self, start: int, end: int) -> str:
+        return "\n\n".join(self._texts[i] for i in range(start, end))
+
+    async def _wait_for(self, count: int) -> None:
+        count = min(count, self.total)
+        async with self.condition:
+            await self.condition.wait_for(lambda: self._ready >= count or self._error is not None)
+        if self._ready < count:
+            raise RuntimeError(f"Page OCR failed: {self._error}") from self._error
+
+    async def prefix(self, pages: int) -> str:
+        """Text of the first ``pages`` pages, once they are all available."""
+        await self._wait_for(pages)
+        return self._join(0, min(pages, self.total))
+
+    async def chunks(self, size: int) -> AsyncIterator[Tuple[int, str]]:
+        """Yield ``(first_page_index, text)`` for each run of ``size`` pages, in order."""
+        for start in range(0, self.total, size):
+            end = min(start + size, self.total)
+            await self._wait_for(end)
+            yield start, self._join(start, end)
+
+    @property
+    def text(self) -> str:
+        return self._join(0, self._ready)
@@ -0,0 +1,274 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+from structlog.contextvars import get_contextvars
+from tools.gemini_client import stage_usage
+from tools.log import get_logger
+from tools.metrics import PIPELINES_COALESCED, STAGE_DURATION, STAGE_FAILURES, STAGE_TOKENS, STAGES_IN_PROGRESS
+
+# Defined here rather than in agents.orchestrator so the API can validate a
+# mode without importing the orchestrator and its tools
+PIPELINE_MODES = ("staged", "fused")
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+StageListener = Callable[[Dict[str, Any]], None]
+T = TypeVar("T")
+
+logger = get_logger(__name__)
+
+
+class Stage:
+    """
+    A single step of the orchestrator pipeline.
+
+    ``func`` receives the shared context dict (holding the pipeline inputs and
+    the results of every finished stage, keyed by stage name) and returns this
+    stage's result. ``depends_on`` lists the stages that must finish first.
+    """
+
+    def __init__(self, name: str, agent: str, func: StageFunc, depends_on: Iterable[str] = ()) -> None:
+        self.name = name
+        self.agent = agent
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+
+class StageGraph:
+    """
+    Runs a set of stages as a dependency graph, starting every stage as soon as
+    all of its dependencies have completed so that independent stages overlap.
+    """
+
+    def __init__(self, stages: List[Stage]) -> None:
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        for stage in stages:
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage graph has a cycle through '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.order:
+            visit(name)
+
+    async def run(
+        self,
+        context: Dict[str, Any],
+        timings: Optional[List[Dict[str, Any]]] = None,
+        listener: Optional[StageListener] = None,
+    ) -> Dict[str, Any]:
+        """
+        Execute all stages, storing each result in ``context[stage.name]``.
+
+        Per-stage timings (offset from the start of the run and duration, in
+        seconds) and the Gemini tokens each stage used are appended to
+        ``timings`` in completion order. If given,
+        ``listener`` is called with a ``stage_started`` event when a stage
+        starts and with its timing entry as a ``stage_completed`` event when it
+        finishes. If any stage fails the remaining ones are cancelled and the
+        error is re-raised.
+        """
+        if timings is None:
+            timings = []
+        started_at = time.perf_counter()
+        pending = list(self.order)
+        running: Dict[asyncio.Task, str] = {}
+        finished = set()
+
+        async def run_stage(stage: Stage) -> Any:
+            stage_start = time.perf_counter()
+            if listener is not None:
+                listener({"event": "stage_started", "stage": stage.name, "agent": stage.agent})
+            logger.debug("stage_started", stage=stage.name)
+            try:
+                with stage_usage() as usage, STAGES_IN_PROGRESS.labels(stage.name).track_inprogress():
+                    result = await stage.func(context)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                STAGE_FAILURES.labels(stage.name).inc()
+                logger.warning("stage_failed", stage=stage.name, duration=round(time.perf_counter() - stage_start, 4))
+                raise
+            STAGE_DURATION.labels(stage.name).observe(time.perf_counter() - stage_start)
+            STAGE_TOKENS.labels(stage.name, "prompt").inc(usage["prompt_tokens"])
+            STAGE_TOKENS.labels(stage.name, "output").inc(usage["output_tokens"])
+            timing = {
+                "stage": stage.name,
+                "agent": stage.agent,
+                "start": round(stage_start - started_at, 4),
+                "duration": round(time.perf_counter() - stage_start, 4),
+                **usage,
+            }
+            timings.append(timing)
+            logger.debug("stage_completed", stage=stage.name, duration=timing["duration"], **usage)
+            if listener is not None:
+                listener({"event": "stage_completed", **timing})
+            return result
+
+        try:
+            while pending or running:
+                for name in list(pending):
+                    if all(dep in finished for dep in self.stages[name].depends_on):
+                        pending.remove(name)
+                        task = asyncio.ensure_future(run_stage(self.stages[name]))
+                        running[task] = name
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    context[name] = task.result()
+                    finished.add(name)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return context
+
+
+class StageLimiter:
+    """
+    Per-stage semaphores that cap how many upstream calls of each stage may be
+    in flight at once across all concurrently running pipelines.
+
+    Limits come from ``STAGE_CONCURRENCY_<STAGE>`` environment variables
+    (e.g. ``STAGE_CONCURRENCY_OCR=4``), falling back to
+    ``STAGE_CONCURRENCY_DEFAULT``. A limit of 0 means unlimited.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default: Optional[int] = None) -> None:
+        self.limits = dict(limits or {})
+        self.default = default if default is not None else int(os.environ.get("STAGE_CONCURRENCY_DEFAULT", "0"))
+        self._semaphores: Dict[str, Optional[asyncio.Semaphore]] = {}
+
+    def limit_for(self, stage: str) -> int:
+        if stage in self.limits:
+            return self.limits[stage]
+        return int(os.environ.get(f"STAGE_CONCURRENCY_{stage.upper()}", self.default))
+
+    @asynccontextmanager
+    async def slot(self, stage: str) -> AsyncIterator[None]:
+        if stage not in self._semaphores:
+            limit = self.limit_for(stage)
+            self._semaphores[stage] = asyncio.Semaphore(limit) if limit > 0 else None
+        semaphore = self._semaphores[stage]
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+
+
+_limiter: Optional[StageLimiter] = None
+
+
+def get_stage_limiter() -> StageLimiter:
+    """Return the process-wide stage limiter, creating it on first use."""
+    global _limiter
+    if _limiter is None:
+        _limiter = StageLimiter()
+    return _limiter
+
+
+class _Flight:
+    """One in-flight execution and the callers waiting on it."""
+
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.listeners: List[StageListener] = []
+        self.correlation_id = get_contextvars().get("correlation_id")
+
+    def broadcast(self, event: Dict[str, Any]) -> None:
+        for listener in list(self.listeners):
+            listener(event)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one execution.
+
+    The first caller for a key starts the execution in its own task; callers
+    arriving while it runs wait on that task and receive its result or its
+    exception. A caller that is cancelled only stops waiting: the execution
+    carries on for the others, and is cancelled once no caller is left.
+    Stage events from the execution go to the listeners of every caller still
+    waiting (a caller that joins late misses the earlier ones).
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(
+        self,
+        key: str,
+        start: Callable[[StageListener], Awaitable[T]],
+        listener: Optional[StageListener] = None,
+        share: Optional[Callable[[T], T]] = None,
+    ) -> T:
+        """
+        Return the result of ``start(listener)`` for ``key``, joining the
+        execution already in flight for it if there is one. Callers that
+        joined get ``share(result)``, e.g. a copy they are free to modify.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(start(flight.broadcast))
+            flight.task.add_done_callback(lambda _: self._release(key, flight))
+        else:
+            PIPELINES_COALESCED.inc()
+            logger.info("pipeline_coalesced", leader=flight.correlation_id, waiters=flight.waiters + 1)
+        flight.waiters += 1
+        if listener is not None:
+            flight.listeners.append(listener)
+        try:
+            # Shielded: cancelling one caller must not cancel the run the others wait on
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if listener is not None:
+                flight.listeners.remove(listener)
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller has gone; later callers start afresh rather than join a cancelled run
+                self._release(key, flight)
+                flight.task.cancel()
+        return result if leader or share is None else share(result)
+
+    def _release(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def coalescing_enabled() -> bool:
+    return os.environ.get("PIPELINE_COALESCE", "true").lower() == "true"
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide pipeline single-flight group, creating it on first use."""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
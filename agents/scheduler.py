@@ -0,0 +1,118 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from tools.log import correlation_scope
+from tools.uploads import ImageData, SpooledUpload
+
+
+class BatchItem:
+    """
+    One document in a batch. Image items carry a ``load`` coroutine function so
+    uploads are only read (or spooled) when the item is scheduled, not all up front.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        name: str,
+        text: Optional[str] = None,
+        load: Optional[Callable[[], Awaitable[ImageData]]] = None,
+    ) -> None:
+        self.index = index
+        self.name = name
+        self.text = text
+        self.load = load
+        self.status = "queued"
+        self.duration: Optional[float] = None
+
+
+class BatchScheduler:
+    """
+    Runs many documents through ``OrchestratorAgent.run`` concurrently.
+
+    A single global semaphore caps how many documents are processed at once
+    across every batch in the process (``BATCH_MAX_CONCURRENCY``); per-stage
+    limits on the Gemini calls themselves are applied by the orchestrator.
+    """
+
+    def __init__(self, orchestrator: Any, max_concurrency: Optional[int] = None) -> None:
+        self.orchestrator = orchestrator
+        self.max_concurrency = (
+            max_concurrency if max_concurrency is not None else int(os.environ.get("BATCH_MAX_CONCURRENCY", "8"))
+        )
+        # Created on first use so it binds to the running event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"batches": 0, "completed": 0, "failed": 0, "in_flight": 0}
+
+    async def _process(self, item: BatchItem, mode: str) -> Tuple[BatchItem, Dict[str, Any]]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            item.status = "running"
+            self.stats["in_flight"] += 1
+            start = time.perf_counter()
+            try:
+                # Items share the batch request's correlation id and are told apart by index
+                with correlation_scope(batch_item=item.index):
+                    if item.load is not None:
+                        image = await item.load()
+                        try:
+                            result = await self.orchestrator.run(image_bytes=image, mode=mode, filename=item.name)
+                        finally:
+                            if isinstance(image, SpooledUpload):
+                                image.close()
+                    else:
+                        result = await self.orchestrator.run(text=item.text, mode=mode)
+                item.status = "completed"
+                self.stats["completed"] += 1
+                return item, {"result": result}
+            except Exception as e:
+                item.status = "failed"
+                self.stats["failed"] += 1
+                # Orchestrator errors embed a full traceback; the first line is enough per item
+                return item, {"error": str(e).splitlines()[0] if str(e) else type(e).__name__}
+            finally:
+                self.stats["in_flight"] -= 1
+                item.duration = round(time.perf_counter() - start, 4)
+
+    async def run(self, items: List[BatchItem], mode: str = "staged") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process ``items`` and yield one event per item as it completes, followed
+        by a summary event with aggregate throughput. Outstanding items are
+        cancelled if the consumer stops iterating early.
+        """
+        batch_id = uuid.uuid4().hex
+        self.stats["batches"] += 1
+        started_at = time.perf_counter()
+        tasks = [asyncio.ensure_future(self._process(item, mode)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item, outcome = await next_done
+                yield {
+                    "type": "item",
+                    "batch_id": batch_id,
+                    "index": item.index,
+                    "name": item.name,
+                    "status": item.status,
+                    "duration": item.duration,
+                    **outcome,
+                }
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        elapsed = time.perf_counter() - started_at
+        completed = sum(1 for item in items if item.status == "completed")
+        yield {
+            "type": "summary",
+            "batch_id": batch_id,
+            "total": len(items),
+            "completed": completed,
+            "failed": len(items) - completed,
+            "elapsed": round(elapsed, 4),
+            "throughput_per_sec": round(len(items) / elapsed, 4) if elapsed > 0 else None,
+            "max_concurrency": self.max_concurrency,
+        }
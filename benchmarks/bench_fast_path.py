@@ -0,0 +1,72 @@
+"""
+Measure the fast-path classifier's hit rate, accuracy and latency on the sample corpus.
+
+A "hit" is a document answered locally (confidence at or above the threshold);
+everything else would fall back to Gemini. Results are reported for a sweep of
+thresholds so the cut-off can be tuned.
+
+    python -m benchmarks.bench_fast_path --repeat 200 --output fast_path.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.samples import SAMPLE_TEXTS
+from tools.fast_path import FastPathClassifier, get_department_table
+
+THRESHOLDS = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+def main(repeat: int, output: str) -> None:
+    start = time.perf_counter()
+    classifier = FastPathClassifier()
+    build_seconds = time.perf_counter() - start
+
+    predictions = {}
+    latencies = []
+    for label, text in SAMPLE_TEXTS.items():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            predictions[label] = classifier.classify(text)
+            latencies.append(time.perf_counter() - start)
+
+    departments = get_department_table()
+    print(f"{'label':<22} {'predicted':<22} {'confidence':>10}  department")
+    for label, (form_type, confidence) in predictions.items():
+        print(f"{label:<22} {form_type:<22} {confidence:>10.3f}  {departments.lookup(form_type)}")
+
+    sweep = []
+    for threshold in THRESHOLDS:
+        hits = [(label, p) for label, p in predictions.items() if p[1] >= threshold]
+        correct = sum(1 for label, (form_type, _) in hits if form_type == label)
+        sweep.append({
+            "threshold": threshold,
+            "hit_rate": len(hits) / len(predictions),
+            "hit_accuracy": correct / len(hits) if hits else None,
+        })
+    print(f"\n{'threshold':>9} {'hit rate':>9} {'accuracy':>9}")
+    for row in sweep:
+        accuracy = f"{row['hit_accuracy']:.2f}" if row["hit_accuracy"] is not None else "-"
+        print(f"{row['threshold']:>9.2f} {row['hit_rate']:>9.2f} {accuracy:>9}")
+
+    latency = {
+        "build_ms": build_seconds * 1000,
+        "classify_p50_us": statistics.median(latencies) * 1e6,
+        "classify_max_us": max(latencies) * 1e6,
+    }
+    print(
+        f"\nBuild: {latency['build_ms']:.1f} ms, classify p50: {latency['classify_p50_us']:.0f} us, "
+        f"max: {latency['classify_max_us']:.0f} us (configured threshold {classifier.threshold})"
+    )
+    if output:
+        with open(output, "w") as f:
+            json.dump({"predictions": predictions, "sweep": sweep, "latency": latency}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="classifications per sample for latency")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+    main(args.repeat, args.output)
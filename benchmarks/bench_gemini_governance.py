@@ -0,0 +1,181 @@
+"""
+Exercise Gemini call governance (rate limiting, retries, circuit breaker)
+against the local stub server with injected failures.
+
+Each scenario offers a steady stream of requests (``--rate`` per second, at
+most ``--concurrency`` in flight) through ``GeminiClient`` twice: once with governance disabled (single attempt, no rate limit, no
+breaker) and once with the settings from the environment, except for the
+breaker reset timeout, which is shortened so recovery from the simulated
+outage fits in the run.
+
+    python -m benchmarks.bench_gemini_governance --requests 200 --rate 10 --output governance.json
+
+Afterwards it checks that a half-open trial call cancelled while waiting for
+a rate-limit token frees the breaker for the next call, and that an ordinary
+call ending while the trial runs does not let a second trial through; it
+exits non-zero if either fails.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from benchmarks.stub_gemini import StubGemini
+from tools.gemini_client import GeminiClient
+from tools.governance import CallGovernor, CircuitBreaker, CircuitOpenError, UpstreamUnavailableError
+
+PAYLOAD = {"contents": [{"parts": [{"text": "Classify the following document text: FIR"}]}]}
+
+SCENARIOS = {
+    "flaky": {"error_rate": 0.2, "error_statuses": (429, 503), "retry_after": 0.2},
+    "over_quota": {"quota_rpm": 300, "retry_after": 1.0},
+    "outage": {"outage_start": 2.0, "outage_seconds": 3.0},
+}
+
+
+def ungoverned() -> CallGovernor:
+    return CallGovernor(rate_per_minute=0, max_attempts=1, failure_threshold=10 ** 9)
+
+
+async def run_scenario(
+    name: str, governed: bool, requests: int, rate: float, concurrency: int, port: int, breaker_reset: float
+) -> dict:
+    stub = StubGemini(seed=7, **SCENARIOS[name])
+    base_url = await stub.start(port=port)
+    governor = CallGovernor(reset_timeout=breaker_reset) if governed else ungoverned()
+    client = GeminiClient(base_url=base_url, api_key="stub", governor=governor)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    outcomes = {"ok": 0, "unavailable": 0, "short_circuited": 0, "error": 0}
+
+    async def one(index: int) -> None:
+        await asyncio.sleep(index / rate)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await client.generate_content(PAYLOAD)
+                outcomes["ok"] += 1
+            except CircuitOpenError:
+                outcomes["short_circuited"] += 1
+            except UpstreamUnavailableError:
+                outcomes["unavailable"] += 1
+            except Exception:
+                outcomes["error"] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(i) for i in range(requests)))
+    finally:
+        await client.close()
+        await stub.stop()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "scenario": name,
+        "governed": governed,
+        "requests": requests,
+        "success_rate": outcomes["ok"] / requests,
+        "outcomes": outcomes,
+        "upstream_requests": stub.stats["requests"],
+        "upstream_errors": stub.stats["errors"],
+        "latency_p50": statistics.median(latencies),
+        "latency_p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "wall_seconds": wall,
+        "governance": client.governor.stats(),
+    }
+
+
+async def check_cancelled_trial(port: int) -> bool:
+    """
+    Open the breaker with an outage, let it half-open, cancel the trial call
+    while it waits for a token, then check the next call still goes through.
+    """
+    stub = StubGemini(seed=7, outage_start=0.0, outage_seconds=0.3)
+    base_url = await stub.start(port=port)
+    # One token a second with no burst, so the trial has to wait for its token
+    governor = CallGovernor(rate_per_minute=60, burst=1, max_attempts=1, failure_threshold=1, reset_timeout=0.3)
+    client = GeminiClient(base_url=base_url, api_key="stub", governor=governor)
+    try:
+        try:
+            await client.generate_content(PAYLOAD)
+        except Exception:
+            pass
+        await asyncio.sleep(0.35)
+        trial = asyncio.ensure_future(client.generate_content(PAYLOAD))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        try:
+            await client.generate_content(PAYLOAD)
+        except CircuitOpenError:
+            return False
+        return governor.breaker.state == governor.breaker.CLOSED
+    finally:
+        await client.close()
+        await stub.stop()
+
+
+def check_single_trial() -> bool:
+    """
+    Start an ordinary call, open the breaker with another, let the trial
+    through, then end the ordinary call without a verdict: the breaker must
+    still refuse a second trial until the first one is released.
+    """
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    ordinary = breaker.before_call()
+    breaker.before_call()
+    breaker.record_failure()
+    trial = breaker.before_call()
+    breaker.release(ordinary)
+    try:
+        breaker.before_call()
+        return False
+    except CircuitOpenError:
+        pass
+    breaker.release(trial)
+    breaker.before_call()
+    return True
+
+
+async def main(requests: int, rate: float, concurrency: int, port: int, breaker_reset: float, output: str) -> int:
+    results = []
+    for name in SCENARIOS:
+        for governed in (False, True):
+            results.append(await run_scenario(name, governed, requests, rate, concurrency, port, breaker_reset))
+
+    print(f"{'scenario':<10} {'governed':<9} {'success':>8} {'upstream':>9} {'retried':>8} "
+          f"{'short-circ':>10} {'p50 (s)':>8} {'p95 (s)':>8}")
+    for r in results:
+        print(
+            f"{r['scenario']:<10} {str(r['governed']):<9} {r['success_rate']:>8.2f} {r['upstream_requests']:>9} "
+            f"{r['governance']['retried']:>8} {r['governance']['short_circuited']:>10} "
+            f"{r['latency_p50']:>8.3f} {r['latency_p95']:>8.3f}"
+        )
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not await check_cancelled_trial(port):
+        print("A cancelled half-open trial left the circuit breaker stuck", file=sys.stderr)
+        return 1
+    print("Cancelled half-open trial: breaker recovered")
+    if not check_single_trial():
+        print("An ordinary call ending during the half-open trial let a second trial through", file=sys.stderr)
+        return 1
+    print("Half-open breaker: one trial at a time")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario run")
+    parser.add_argument("--rate", type=float, default=10, help="offered requests per second")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at once")
+    parser.add_argument("--port", type=int, default=8766, help="port for the stub server")
+    parser.add_argument("--breaker-reset", type=float, default=1.0, help="circuit breaker reset timeout in seconds")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.requests, args.rate, args.concurrency, args.port, args.breaker_reset, args.output)))
@@ -0,0 +1,123 @@
+"""
+Measure Gemini Vision payload size and OCR latency with and without image preprocessing.
+
+Uses every image in ``--corpus`` (a directory), or a generated set of
+synthetic phone-photo-sized form scans when no corpus is given. With
+``--ocr`` each image is also sent through ``VisionTools`` against the
+configured Gemini endpoint in both configurations.
+
+    python -m benchmarks.bench_image_preprocessing --corpus samples/ --ocr --output images.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from PIL import Image, ImageDraw
+
+from tools.image_preprocessing import ImagePreprocessor
+
+
+def synthetic_corpus(count: int = 4) -> Dict[str, bytes]:
+    """Large skewed form images, alternating noisy JPEG photos and clean PNG scans."""
+    corpus = {}
+    for n in range(count):
+        image = Image.new("RGB", (4032, 3024), (242, 238, 230))
+        draw = ImageDraw.Draw(image)
+        for y in range(250, 2800, 70):
+            draw.rectangle([300, y, 300 + 600 + (y * 7 % 2800), y + 22], fill=(30, 30, 40))
+        image = image.rotate(3 + n, expand=True, fillcolor=(242, 238, 230))
+        if n % 2 == 0:
+            # Camera photos carry sensor noise; flatbed PNG scans are clean
+            noise = Image.effect_noise(image.size, 40).convert("RGB")
+            image = Image.blend(image, noise, 0.15)
+        fmt = "PNG" if n % 2 else "JPEG"
+        out = io.BytesIO()
+        image.save(out, format=fmt, **({"quality": 95} if fmt == "JPEG" else {}))
+        corpus[f"synthetic-{n}.{fmt.lower()}"] = out.getvalue()
+    return corpus
+
+
+def load_corpus(path: str) -> Dict[str, bytes]:
+    corpus = {}
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if os.path.isfile(full):
+            with open(full, "rb") as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+async def ocr_latency(corpus: Dict[str, bytes], preprocess: bool) -> List[float]:
+    from tools.gemini_client import close_gemini_client, init_gemini_client
+    from tools.vision_tools import VisionTools
+
+    tool = VisionTools()
+    tool.preprocessor = ImagePreprocessor(enabled=preprocess)
+    await init_gemini_client()
+    latencies = []
+    try:
+        for image_bytes in corpus.values():
+            start = time.perf_counter()
+            await tool.call(image_bytes=image_bytes)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        await close_gemini_client()
+    return latencies
+
+
+def main(corpus_dir: str, run_ocr: bool, output: str) -> None:
+    load_dotenv()
+    corpus = load_corpus(corpus_dir) if corpus_dir else synthetic_corpus()
+    preprocessor = ImagePreprocessor(enabled=True)
+    rows = []
+    for name, image_bytes in corpus.items():
+        start = time.perf_counter()
+        processed, mime_type, info = preprocessor.process(image_bytes)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "name": name,
+            "format": info.get("format"),
+            "payload_before": len(base64.b64encode(image_bytes)),
+            "payload_after": len(base64.b64encode(processed)),
+            "size_before": info.get("original_size"),
+            "size_after": info.get("output_size"),
+            "deskew_degrees": info.get("deskew_degrees"),
+            "preprocess_seconds": round(elapsed, 4),
+        })
+
+    print(f"{'image':<28} {'before KB':>10} {'after KB':>10} {'ratio':>7} {'prep s':>8}")
+    for r in rows:
+        print(
+            f"{r['name'][:28]:<28} {r['payload_before'] / 1024:>10.1f} {r['payload_after'] / 1024:>10.1f} "
+            f"{r['payload_after'] / r['payload_before']:>7.2f} {r['preprocess_seconds']:>8.3f}"
+        )
+    total_before = sum(r["payload_before"] for r in rows)
+    total_after = sum(r["payload_after"] for r in rows)
+    summary = {"images": len(rows), "payload_before": total_before, "payload_after": total_after}
+    print(f"Total payload: {total_before / 1024:.1f} KB -> {total_after / 1024:.1f} KB ({total_after / total_before:.2%})")
+
+    if run_ocr:
+        for label, enabled in (("raw", False), ("preprocessed", True)):
+            latencies = asyncio.run(ocr_latency(corpus, enabled))
+            summary[f"ocr_latency_mean_{label}"] = statistics.mean(latencies)
+            print(f"OCR latency ({label}): mean {statistics.mean(latencies):.3f}s, max {max(latencies):.3f}s")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"summary": summary, "images": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="", help="directory of sample images (default: synthetic scans)")
+    parser.add_argument("--ocr", action="store_true", help="also measure OCR latency against the Gemini endpoint")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+    main(args.corpus, args.ocr, args.output)
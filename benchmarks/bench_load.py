@@ -0,0 +1,287 @@
+"""
+Load-test the API end to end against the local stub Gemini server.
+
+The app is started with uvicorn in a subprocess, pointed at the stub (so no
+API key or quota is needed), with the result cache and request coalescing off
+so every request runs the pipeline. Each scenario is driven by ``--concurrency`` closed-loop clients
+at each level in turn, for ``--duration`` seconds or ``--requests`` requests:
+
+- ``submit-text``: JSON posts of the sample form texts to ``/submit-text``
+- ``process-form``: a generated form image uploaded to ``/process-form``
+- ``batch``: ``--batch-size`` texts per ``/process-batch`` request
+- ``coalesced`` (opt-in): every client posts the same text to ``/submit-text``
+  against an app started separately with ``PIPELINE_COALESCE=true``, so
+  concurrent duplicates share one pipeline run
+
+For each scenario and level it reports throughput, p50/p95/p99 latency, the
+status mix and the server's resident memory, and writes them with the commit
+and settings as JSON.
+
+    python -m benchmarks.bench_load --concurrency 1,8,32 --duration 20 --output load.json
+    python -m benchmarks.bench_load --scenarios submit-text,coalesced
+
+With ``--baseline`` an earlier output file is compared against: the script
+prints the change per scenario and exits non-zero when throughput drops or
+p95 latency rises by more than ``--max-regression``. ``--stub-latency``,
+``--stub-jitter`` and ``--stub-error-rate`` shape the stand-in's responses,
+and ``--app-env KEY=VALUE`` (repeatable) overrides the app's environment.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import aiohttp
+from PIL import Image, ImageDraw
+
+from benchmarks.harness import (
+    REPO_ROOT, environment_info, percentile, post_file, rss_mb, run_servers, sample_peak_rss, wait_ready,
+)
+from benchmarks.samples import SAMPLE_TEXTS
+
+TEXTS = list(SAMPLE_TEXTS.values())
+SCENARIOS = ("submit-text", "process-form", "batch", "coalesced")
+DEFAULT_SCENARIOS = ("submit-text", "process-form", "batch")
+# App environment on top of the defaults for scenarios that need their own app
+SCENARIO_ENV: Dict[str, Dict[str, str]] = {"coalesced": {"PIPELINE_COALESCE": "true"}}
+
+
+def write_form_image() -> str:
+    """A scan-sized PNG with a few lines of form text, written to a temp file."""
+    image = Image.new("L", (1240, 1754), color=255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(TEXTS[0].splitlines()):
+        draw.text((80, 120 + 40 * i), line, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    fd, path = tempfile.mkstemp(prefix="bench-form-", suffix=".png")
+    with os.fdopen(fd, "wb") as f:
+        f.write(buffer.getvalue())
+    return path
+
+
+def make_request(
+    scenario: str, session: aiohttp.ClientSession, base_url: str, image: str, batch_size: int
+) -> Callable[[int], Awaitable[int]]:
+    """A coroutine function sending request ``i`` of ``scenario``; returns the status (0 on a failed batch item)."""
+
+    async def submit_text(i: int) -> int:
+        async with session.post(base_url + "/submit-text", json={"text": TEXTS[i % len(TEXTS)]}) as response:
+            await response.read()
+            return response.status
+
+    async def coalesced(i: int) -> int:
+        async with session.post(base_url + "/submit-text", json={"text": TEXTS[0]}) as response:
+            await response.read()
+            return response.status
+
+    async def process_form(i: int) -> int:
+        return await post_file(session, base_url + "/process-form", image, content_type="image/png")
+
+    async def batch(i: int) -> int:
+        texts = [TEXTS[(i + j) % len(TEXTS)] for j in range(batch_size)]
+        form = aiohttp.FormData()
+        form.add_field("texts", json.dumps(texts))
+        async with session.post(base_url + "/process-batch", data=form) as response:
+            if response.status != 200:
+                await response.read()
+                return response.status
+            summary = {}
+            async for line in response.content:
+                if line.strip():
+                    summary = json.loads(line)
+            return 200 if summary.get("type") == "summary" and not summary.get("failed") else 0
+
+    return {
+        "submit-text": submit_text, "process-form": process_form, "batch": batch, "coalesced": coalesced,
+    }[scenario]
+
+
+async def run_level(
+    request: Callable[[int], Awaitable[int]], concurrency: int, duration: float, requests: int, app_pid: int
+) -> Dict:
+    """Drive ``request`` from ``concurrency`` closed-loop clients and summarise the run."""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    issued = 0
+    deadline = time.perf_counter() + duration
+
+    def more() -> bool:
+        return issued < requests if requests else time.perf_counter() < deadline
+
+    async def client() -> None:
+        nonlocal issued
+        while more():
+            index = issued
+            issued += 1
+            start = time.perf_counter()
+            try:
+                status = str(await request(index))
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    baseline = rss_mb(app_pid)
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(sample_peak_rss(app_pid, stop, interval=0.05))
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    stop.set()
+    peak = await sampler
+
+    latencies.sort()
+    ok = statuses.get("200", 0)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": statuses,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(ok / wall, 2),
+        "latency_p50": round(percentile(latencies, 0.50) or 0.0, 4),
+        "latency_p95": round(percentile(latencies, 0.95) or 0.0, 4),
+        "latency_p99": round(percentile(latencies, 0.99) or 0.0, 4),
+        "rss_start_mb": round(baseline, 1),
+        "rss_peak_mb": round(max(peak, baseline), 1),
+    }
+
+
+async def measure(args: argparse.Namespace, scenarios: List[str], app_pid: int, base_url: str) -> List[Dict]:
+    image = write_form_image()
+    results = []
+    try:
+        timeout = aiohttp.ClientTimeout(total=300)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await wait_ready(session, base_url + "/")
+            for scenario in scenarios:
+                request = make_request(scenario, session, base_url, image, args.batch_size)
+                await asyncio.gather(*(request(i) for i in range(2)))  # warm up imports and pools
+                for concurrency in args.concurrency:
+                    result = await run_level(request, concurrency, args.duration, args.requests, app_pid)
+                    documents = args.batch_size if scenario == "batch" else 1
+                    result["documents_per_second"] = round(result["throughput_rps"] * documents, 2)
+                    results.append({"scenario": scenario, **result})
+                    print_row(results[-1])
+    finally:
+        os.unlink(image)
+    return results
+
+
+def print_row(r: Dict) -> None:
+    print(
+        f"{r['scenario']:<13} {r['concurrency']:>5} {r['requests']:>7} {r['errors']:>6} {r['throughput_rps']:>8.2f} "
+        f"{r['latency_p50'] * 1000:>9.1f} {r['latency_p95'] * 1000:>9.1f} {r['latency_p99'] * 1000:>9.1f} "
+        f"{r['rss_peak_mb']:>9.1f}"
+    )
+
+
+def compare(results: List[Dict], baseline: Dict, max_regression: float) -> List[str]:
+    """Print the change against ``baseline`` and return the regressions beyond ``max_regression``."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nAgainst {baseline['environment']['commit']} ({baseline['environment']['timestamp']}):")
+    for r in results:
+        old = previous.get((r["scenario"], r["concurrency"]))
+        if not old or not old["throughput_rps"] or not old["latency_p95"]:
+            continue
+        throughput = r["throughput_rps"] / old["throughput_rps"] - 1
+        p95 = r["latency_p95"] / old["latency_p95"] - 1
+        print(f"{r['scenario']:<13} {r['concurrency']:>5}  throughput {throughput:+.1%}  p95 {p95:+.1%}")
+        if throughput < -max_regression:
+            regressions.append(f"{r['scenario']} x{r['concurrency']}: throughput {throughput:+.1%}")
+        if p95 > max_regression:
+            regressions.append(f"{r['scenario']} x{r['concurrency']}: p95 latency {p95:+.1%}")
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    app_env = {
+        "OCR_BACKEND": "gemini",
+        "CACHE_ENABLED": "false",
+        "PIPELINE_COALESCE": "false",
+        "LOG_STORE_ENABLED": "false",
+        **dict(pair.split("=", 1) for pair in args.app_env),
+    }
+    # One app per distinct environment, in the order the scenarios were asked for
+    runs: Dict[tuple, List[str]] = {}
+    for scenario in args.scenarios:
+        runs.setdefault(tuple(sorted(SCENARIO_ENV.get(scenario, {}).items())), []).append(scenario)
+    stub_args = [
+        "--latency", str(args.stub_latency), "--jitter", str(args.stub_jitter),
+        "--error-rate", str(args.stub_error_rate), "--seed", "0",
+    ]
+    print(f"{'scenario':<13} {'conc':>5} {'reqs':>7} {'errors':>6} {'req/s':>8} {'p50 (ms)':>9} "
+          f"{'p95 (ms)':>9} {'p99 (ms)':>9} {'peak MB':>9}")
+    results = []
+    for overrides, group in runs.items():
+        with run_servers(args.port, args.stub_port, stub_args, {**app_env, **dict(overrides)}, args.app_dir) as app:
+            results += asyncio.run(measure(args, group, app.pid, f"http://127.0.0.1:{args.port}"))
+
+    report = {
+        "benchmark": "load",
+        "environment": environment_info(args.app_dir),
+        "settings": {
+            "scenarios": args.scenarios,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "requests": args.requests,
+            "batch_size": args.batch_size,
+            "stub_latency": args.stub_latency,
+            "stub_jitter": args.stub_jitter,
+            "stub_error_rate": args.stub_error_rate,
+            "app_env": app_env,
+            "scenario_env": {scenario: SCENARIO_ENV[scenario] for scenario in args.scenarios if scenario in SCENARIO_ENV},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressions beyond the allowed margin:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+def levels(value: str) -> List[int]:
+    return [int(level) for level in value.split(",")]
+
+
+def scenarios(value: str) -> List[str]:
+    names = value.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenarios {unknown}, expected some of {list(SCENARIOS)}")
+    return names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=scenarios, default=list(DEFAULT_SCENARIOS),
+                        help=f"comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=levels, default=[1, 8, 32], help="comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per scenario and level")
+    parser.add_argument("--requests", type=int, default=0, help="requests per level instead of --duration")
+    parser.add_argument("--batch-size", type=int, default=8, help="texts per /process-batch request")
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="seconds per stub Gemini response")
+    parser.add_argument("--stub-jitter", type=float, default=0.25, help="stub latency varies by this fraction")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="fraction of stub responses that fail")
+    parser.add_argument("--app-env", action="append", default=[], help="KEY=VALUE for the app (repeatable)")
+    parser.add_argument("--app-dir", default=REPO_ROOT, help="checkout of the app to run")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--stub-port", type=int, default=8769)
+    parser.add_argument("--baseline", default="", help="earlier --output file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="allowed fractional slowdown")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,150 @@
+"""
+Compare request throughput with the old print-based logging and the
+structured, queued logging layer.
+
+Requests are simulated: each one awaits three fake Gemini calls and emits the
+log lines the pipeline used to print (full prompts, raw responses, entity
+dicts and the complete result) or, for the new layer, its structured events.
+Output goes to a sink that costs ``--write-latency-us`` per write, standing in
+for a busy stdout pipe or container log driver. Blocking writes stall the
+event loop, which shows up as lost throughput and as event-loop lag.
+
+    python -m benchmarks.bench_logging --requests 500 --concurrency 50 --output logging.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import time
+
+from benchmarks.samples import SAMPLE_TEXTS
+from tools.log import configure_logging, correlation_scope, get_logger, shutdown_logging
+
+TEXTS = list(SAMPLE_TEXTS.values())
+ENTITIES = {"name": "Rahul Sharma", "address": "12/B Shanti Nagar, Andheri East, Mumbai 400069", "age": "34"}
+
+
+class SlowSink(io.TextIOBase):
+    """Discards writes after sleeping ``latency`` seconds per call."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, data: str) -> int:
+        time.sleep(self.latency)
+        self.writes += 1
+        self.bytes += len(data)
+        return len(data)
+
+
+async def old_request(index: int, upstream_latency: float) -> None:
+    text = TEXTS[index % len(TEXTS)]
+    print(f"Processing text: {text[:50]}...")
+    print("Calling orchestrator.run()...")
+    for tool in ("NERTool", "ClassifierTool", "RouterTool"):
+        print(f"{tool}.call started with text of length: {len(text)}")
+        prompt = f"Extract the following fields from the text below. Text: {text}"
+        print(f"Created prompt of length: {len(prompt)}")
+        print("Prepared request payload for Gemini API")
+        print("Making API request to Gemini at: https://generativelanguage.googleapis.com/v1/models/x")
+        await asyncio.sleep(upstream_latency)
+        print("Successfully parsed JSON response")
+        print(f"Raw response text: {json.dumps(ENTITIES)[:100]}...")
+        print(f"Extracted entities: {ENTITIES}")
+    result = {"form_type": "FIR", "extracted_fields": ENTITIES, "suggested_route": "Police", "ocr_text": text}
+    print(f"Orchestrator run completed: {result}")
+
+
+async def new_request(index: int, upstream_latency: float) -> None:
+    logger = get_logger("bench")
+    text = TEXTS[index % len(TEXTS)]
+    with correlation_scope():
+        logger.info("text_received", length=len(text))
+        logger.info("pipeline_started", mode="staged", input="text", input_length=len(text))
+        for tool in ("gemini_ner_tool", "gemini_classify_tool", "gemini_routing_tool"):
+            logger.debug("stage_started", stage=tool)
+            logger.debug("tool_call_started", tool=tool, text_length=len(text))
+            logger.debug("prompt_built", tool=tool, prompt_length=len(text) + 60)
+            await asyncio.sleep(upstream_latency)
+            logger.debug("response_received", tool=tool, response_length=80)
+            logger.debug("tool_call_completed", tool=tool, fields=sorted(ENTITIES))
+            logger.debug("stage_completed", stage=tool, duration=upstream_latency)
+        logger.info("pipeline_completed", mode="staged", status="ok", form_type="FIR", department="Police")
+        logger.info("request_completed", method="POST", route="/submit-text", status=200)
+
+
+async def measure_lag(stop: asyncio.Event, lags: list, interval: float = 0.005) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def drive(request, requests: int, concurrency: int, upstream_latency: float) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    lag_task = asyncio.ensure_future(measure_lag(stop, lags))
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await request(index, upstream_latency)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    latencies.sort()
+    return {
+        "throughput_rps": requests / wall,
+        "latency_p50": statistics.median(latencies),
+        "latency_p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "loop_lag_max_ms": max(lags) * 1000 if lags else 0.0,
+    }
+
+
+def run(name: str, args: argparse.Namespace) -> dict:
+    sink = SlowSink(args.write_latency_us / 1e6)
+    if name == "print":
+        with contextlib.redirect_stdout(sink):
+            stats = asyncio.run(drive(old_request, args.requests, args.concurrency, args.upstream_latency))
+        dropped = 0
+    else:
+        level, rate = {"structlog": ("INFO", 0.0), "structlog-debug": ("DEBUG", args.debug_sample_rate)}[name]
+        handler = configure_logging(level=level, fmt="json", debug_sample_rate=rate, stream=sink)
+        stats = asyncio.run(drive(new_request, args.requests, args.concurrency, args.upstream_latency))
+        shutdown_logging()  # drain the queue so the written byte count is complete
+        dropped = handler.dropped
+    return {"logging": name, **stats, "writes": sink.writes, "bytes_written": sink.bytes, "dropped": dropped}
+
+
+def main(args: argparse.Namespace) -> None:
+    results = [run(name, args) for name in ("print", "structlog", "structlog-debug")]
+    print(f"{'logging':<16} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'lag max (ms)':>13} {'bytes':>10} {'dropped':>8}")
+    for r in results:
+        print(
+            f"{r['logging']:<16} {r['throughput_rps']:>8.1f} {r['latency_p50'] * 1000:>9.1f} "
+            f"{r['latency_p95'] * 1000:>9.1f} {r['loop_lag_max_ms']:>13.1f} {r['bytes_written']:>10} {r['dropped']:>8}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--upstream-latency", type=float, default=0.02, help="seconds per simulated Gemini call")
+    parser.add_argument("--write-latency-us", type=float, default=100, help="cost of each write to the log sink")
+    parser.add_argument("--debug-sample-rate", type=float, default=0.1, help="for the structlog-debug run")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    main(parser.parse_args())
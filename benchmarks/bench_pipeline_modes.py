@@ -0,0 +1,78 @@
+"""
+Compare the staged and fused pipeline modes on latency and token usage.
+
+Runs every sample text through ``OrchestratorAgent.run`` in both modes against
+the Gemini endpoint configured by ``GEMINI_BASE_URL`` / ``GEMINI_API_KEY``.
+
+    python -m benchmarks.bench_pipeline_modes --repeat 3 --output modes.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from agents.orchestrator import OrchestratorAgent, PIPELINE_MODES
+from benchmarks.samples import SAMPLE_TEXTS
+from tools.gemini_client import close_gemini_client, init_gemini_client
+
+
+async def bench_mode(orchestrator: OrchestratorAgent, mode: str, repeat: int) -> dict:
+    client = await init_gemini_client()
+    before = dict(client.stats)
+    latencies, fallbacks, failures = [], 0, 0
+    for _ in range(repeat):
+        for text in SAMPLE_TEXTS.values():
+            start = time.perf_counter()
+            try:
+                result = await orchestrator.run(text=text, mode=mode)
+                fallbacks += int(result["fallback"])
+            except Exception:
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    docs = repeat * len(SAMPLE_TEXTS)
+    delta = {key: client.stats[key] - before[key] for key in client.stats}
+    return {
+        "mode": mode,
+        "documents": docs,
+        "failures": failures,
+        "fallbacks": fallbacks,
+        "requests_per_doc": delta["requests"] / docs,
+        "prompt_tokens_per_doc": delta["prompt_tokens"] / docs,
+        "output_tokens_per_doc": delta["output_tokens"] / docs,
+        "latency_mean": statistics.mean(latencies) if latencies else None,
+        "latency_p50": statistics.median(latencies) if latencies else None,
+    }
+
+
+async def main(repeat: int, output: str) -> None:
+    load_dotenv()
+    orchestrator = OrchestratorAgent()
+    results = []
+    try:
+        for mode in PIPELINE_MODES:
+            results.append(await bench_mode(orchestrator, mode, repeat))
+    finally:
+        await close_gemini_client()
+
+    print(f"{'mode':<8} {'req/doc':>8} {'prompt tok':>11} {'output tok':>11} {'mean s':>8} {'p50 s':>8} {'fallbacks':>10}")
+    for r in results:
+        print(
+            f"{r['mode']:<8} {r['requests_per_doc']:>8.2f} {r['prompt_tokens_per_doc']:>11.1f} "
+            f"{r['output_tokens_per_doc']:>11.1f} {r['latency_mean'] or 0:>8.3f} {r['latency_p50'] or 0:>8.3f} "
+            f"{r['fallbacks']:>10}"
+        )
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the sample corpus per mode")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+    asyncio.run(main(args.repeat, args.output))
@@ -0,0 +1,272 @@
+"""
+Compare prompt versions on prompt size and accuracy.
+
+Each sample form is used as-is and as a long, noisy scan (OCR debris, an
+instructions page, a declaration and page footers around the same form).
+For every stage, the prompts built by each version are measured locally,
+with no API calls:
+
+- ``tokens``: estimated prompt tokens per document
+- ``classify_accuracy``: the fast-path classifier's answer from the text in
+  the classify prompt matches the true form type
+- ``title_kept``: the form's title line is still in the classify and route
+  prompts
+- ``field_recall``: share of the form's ``label: value`` values still in the
+  NER prompt
+
+    python -m benchmarks.bench_prompts --versions v1,v2 --output prompts.json
+
+With ``--live`` every document is also run through the staged pipeline
+against the Gemini endpoint configured by ``GEMINI_BASE_URL`` /
+``GEMINI_API_KEY``, with the fast path and cache off so every stage calls
+Gemini. That run reports the prompt and output tokens each stage used (from
+``usageMetadata``), form type accuracy, the share of documents routed to the
+same department as with the first version, and the share of the form's
+values found in the extracted fields. The script exits non-zero when a
+version's accuracy or recall falls more than ``--max-accuracy-drop`` below
+the first version's.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+from typing import Dict, List, Tuple
+
+from benchmarks.harness import REPO_ROOT, environment_info
+from benchmarks.samples import SAMPLE_TEXTS
+from tools.fast_path import get_fast_path_classifier
+from tools.prompts import estimate_tokens, field_schema, get_prompt, prompt_versions
+from tools.text_tools import FORM_TYPES
+
+STAGES = ("classify", "route", "ner")
+# Quality measures per stage, higher is better
+MEASURES = {
+    "classify": ("classify_accuracy", "title_kept"), "route": ("title_kept",), "ner": ("field_recall",), "total": (),
+}
+
+INSTRUCTIONS = [
+    "INSTRUCTIONS FOR FILLING THE FORM",
+    "1. The form must be filled in block letters with blue or black ink only.",
+    "2. Attach self-attested copies of the documents listed in the checklist overleaf.",
+    "3. Incomplete applications are liable to be rejected without further notice.",
+    "4. Applicants must produce the original documents for verification when asked.",
+    "5. The office does not accept applications sent by fax or courier.",
+    "6. Overwriting or use of correction fluid will invalidate the application.",
+    "7. Fees once paid are not refundable under any circumstances.",
+    "8. The acknowledgement slip must be preserved for future correspondence.",
+    "9. Applications are processed in the order in which they are received.",
+    "10. Furnishing false information is a punishable offence under the applicable law.",
+]
+DECLARATION = (
+    "DECLARATION: I hereby declare that the information furnished above is true, complete and correct "
+    "to the best of my knowledge and belief, and that nothing material has been concealed. I understand "
+    "that in the event of any information being found false or incorrect, action may be taken against me "
+    "as per the rules in force and any benefit granted on its basis shall be withdrawn."
+)
+DEBRIS = ["|||| ---- ~~~ ||", "l1| .. ,, '|", "=======  ====", "_ _ _ _ _ _ _", "*  .  *  .  |", "~ ~ ^^ ~"]
+# "Name of applicant: Savitri Deshpande", split at commas into separate pairs
+_PAIR = re.compile(r"^\s*([A-Za-z][A-Za-z .'/()]{1,40}?)\s*:\s*(.+?)\s*$")
+
+
+def noisy(text: str, rng: random.Random) -> str:
+    """``text`` as a long multi-page scan: debris between lines, boilerplate before and after."""
+    lines = []
+    for line in text.splitlines():
+        lines.append(line)
+        if rng.random() < 0.5:
+            lines.append(rng.choice(DEBRIS))
+    footer = f"Page {{}} of 3   Form No. {rng.randint(100, 999)}/GEN   Printed at the Government Press"
+    return "\n".join(
+        [rng.choice(DEBRIS), "GOVERNMENT OF MAHARASHTRA", *lines, rng.choice(DEBRIS), footer.format(1),
+         *INSTRUCTIONS, footer.format(2), DECLARATION, "Signature of applicant ............",
+         "Place: ........   Date: ........", *rng.sample(DEBRIS, 3), footer.format(3)]
+    )
+
+
+def corpus(seed: int) -> List[Tuple[str, str, str, str]]:
+    """(name, form type, clean text, document text) per document."""
+    rng = random.Random(seed)
+    documents = []
+    for form_type, text in SAMPLE_TEXTS.items():
+        documents.append((f"{form_type} (clean)", form_type, text, text))
+        documents.append((f"{form_type} (noisy scan)", form_type, text, noisy(text, rng)))
+    return documents
+
+
+def form_values(text: str) -> List[str]:
+    values = []
+    for line in text.splitlines():
+        for segment in line.split(","):
+            match = _PAIR.match(segment)
+            if match and len(match.group(2)) > 1:
+                values.append(match.group(2).lower())
+    return values
+
+
+def render(stage: str, version: str, text: str, form_type: str) -> Tuple[str, str]:
+    """The full prompt and the document text it carries."""
+    prompt = get_prompt(stage, version)
+    values = {
+        "classify": {"categories": ", ".join(FORM_TYPES)},
+        "route": {"form_type": form_type},
+        "ner": {"form_type": form_type, "fields": ", ".join(field_schema(form_type))},
+    }[stage]
+    return prompt.render(text, **values), prompt.fit(text)
+
+
+def measure_offline(documents: List[Tuple[str, str, str, str]], versions: List[str]) -> Dict[str, Dict]:
+    classifier = get_fast_path_classifier()
+    results: Dict[str, Dict] = {}
+    for version in versions:
+        per_stage = {}
+        for stage in STAGES:
+            tokens, scores = [], {measure: [] for measure in MEASURES[stage]}
+            for _, form_type, clean, text in documents:
+                prompt, fitted = render(stage, version, text, form_type)
+                tokens.append(estimate_tokens(prompt))
+                lowered = fitted.lower()
+                if "classify_accuracy" in scores:
+                    scores["classify_accuracy"].append(float(classifier.classify(fitted)[0] == form_type))
+                if "title_kept" in scores:
+                    scores["title_kept"].append(float(clean.splitlines()[0].lower() in lowered))
+                if "field_recall" in scores:
+                    values = form_values(clean)
+                    scores["field_recall"].append(sum(v in lowered for v in values) / len(values) if values else 1.0)
+            per_stage[stage] = {
+                "tokens": round(statistics.mean(tokens), 1),
+                **{measure: round(statistics.mean(s), 4) for measure, s in scores.items()},
+            }
+        per_stage["total"] = {"tokens": round(sum(r["tokens"] for r in per_stage.values()), 1)}
+        results[version] = per_stage
+    return results
+
+
+async def measure_live(documents: List[Tuple[str, str, str, str]], versions: List[str]) -> Dict[str, Dict]:
+    from dotenv import load_dotenv
+    from agents.orchestrator import OrchestratorAgent
+    from tools.gemini_client import close_gemini_client, init_gemini_client
+
+    load_dotenv()
+    os.environ["FAST_PATH_ENABLED"] = "false"
+    os.environ["CACHE_ENABLED"] = "false"
+    orchestrator = OrchestratorAgent()
+    await init_gemini_client()
+    departments: Dict[str, str] = {}
+    results: Dict[str, Dict] = {}
+    try:
+        for version in versions:
+            for stage in STAGES:
+                os.environ[f"PROMPT_VERSION_{stage.upper()}"] = version
+            usage = {stage: {"prompt_tokens": [], "output_tokens": []} for stage in STAGES}
+            correct, same_route, recall, failures = [], [], [], 0
+            for name, form_type, clean, text in documents:
+                try:
+                    result = await orchestrator.run(text=text)
+                except Exception:
+                    failures += 1
+                    continue
+                for timing in result["stage_timings"]:
+                    for kind in ("prompt_tokens", "output_tokens"):
+                        usage[timing["stage"]][kind].append(timing[kind])
+                correct.append(float(result["form_type"].strip() == form_type))
+                department = result["suggested_route"].strip().lower()
+                same_route.append(float(departments.setdefault(name, department) == department))
+                extracted = json.dumps(result["extracted_fields"]).lower()
+                values = form_values(clean)
+                recall.append(sum(v in extracted for v in values) / len(values) if values else 1.0)
+            results[version] = {
+                "failures": failures,
+                "stages": {
+                    stage: {kind: round(statistics.mean(n), 1) if n else None for kind, n in counts.items()}
+                    for stage, counts in usage.items()
+                },
+                "form_type_accuracy": round(statistics.mean(correct), 4) if correct else None,
+                "route_agreement": round(statistics.mean(same_route), 4) if same_route else None,
+                "field_recall": round(statistics.mean(recall), 4) if recall else None,
+            }
+    finally:
+        for stage in STAGES:
+            os.environ.pop(f"PROMPT_VERSION_{stage.upper()}", None)
+        await close_gemini_client()
+    return results
+
+
+def check_parity(offline: Dict[str, Dict], live: Dict[str, Dict], versions: List[str], max_drop: float) -> List[str]:
+    """Quality measures where a version falls more than ``max_drop`` below the first version."""
+    base, drops = versions[0], []
+    for version in versions[1:]:
+        for stage in STAGES:
+            for measure in MEASURES[stage]:
+                if offline[version][stage][measure] < offline[base][stage][measure] - max_drop:
+                    drops.append(f"{version} {stage} {measure}: {offline[version][stage][measure]:.3f} "
+                                 f"vs {offline[base][stage][measure]:.3f}")
+        for measure in ("form_type_accuracy", "field_recall"):
+            if live and live[version][measure] is not None and live[base][measure] is not None:
+                if live[version][measure] < live[base][measure] - max_drop:
+                    drops.append(f"{version} live {measure}: {live[version][measure]:.3f} vs {live[base][measure]:.3f}")
+    return drops
+
+
+def main(args: argparse.Namespace) -> int:
+    documents = corpus(args.seed)
+    offline = measure_offline(documents, args.versions)
+    base = offline[args.versions[0]]
+    print(f"{'version':<8} {'stage':<9} {'tokens/doc':>10} {'vs ' + args.versions[0]:>8}  quality")
+    for version, stages in offline.items():
+        for stage, r in stages.items():
+            change = r["tokens"] / base[stage]["tokens"] - 1
+            quality = "  ".join(f"{m}={r[m]:.3f}" for m in MEASURES[stage])
+            print(f"{version:<8} {stage:<9} {r['tokens']:>10.1f} {change:>+8.1%}  {quality}".rstrip())
+
+    live: Dict[str, Dict] = {}
+    if args.live:
+        live = asyncio.run(measure_live(documents, args.versions))
+        print(f"\n{'version':<8} {'stage':<9} {'prompt tok':>10} {'output tok':>10}")
+        for version, r in live.items():
+            for stage, usage in r["stages"].items():
+                print(f"{version:<8} {stage:<9} {usage['prompt_tokens'] or 0:>10.1f} {usage['output_tokens'] or 0:>10.1f}")
+            print(f"{version:<8} form_type_accuracy={r['form_type_accuracy']}  route_agreement={r['route_agreement']}  "
+                  f"field_recall={r['field_recall']}  failures={r['failures']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "benchmark": "prompts",
+                "environment": environment_info(REPO_ROOT),
+                "settings": {
+                    "versions": args.versions,
+                    "documents": len(documents),
+                    "seed": args.seed,
+                    "budgets": {stage: get_prompt(stage, args.versions[-1]).budget for stage in STAGES},
+                },
+                "offline": offline,
+                "live": live,
+            }, f, indent=2)
+    drops = check_parity(offline, live, args.versions, args.max_accuracy_drop)
+    if drops:
+        print("Accuracy below the first version:\n  " + "\n  ".join(drops), file=sys.stderr)
+        return 1
+    return 0
+
+
+def versions_arg(value: str) -> List[str]:
+    versions = value.split(",")
+    known = set.intersection(*(set(prompt_versions(stage)) for stage in STAGES))
+    unknown = [version for version in versions if version not in known]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown versions {unknown}, expected some of {sorted(known)}")
+    return versions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--versions", type=versions_arg, default=["v1", "v2"], help="first one is the baseline")
+    parser.add_argument("--live", action="store_true", help="also run the pipeline against the Gemini endpoint")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.0, help="allowed drop below the baseline")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the noisy scans")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    sys.exit(main(parser.parse_args()))
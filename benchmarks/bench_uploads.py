@@ -0,0 +1,137 @@
+"""
+Measure the API server's peak memory while it handles concurrent large
+uploads end to end.
+
+The app is started with uvicorn in a subprocess, pointed at the local stub
+Gemini server, with preprocessing off and Gemini OCR forced so every upload is
+sent to Gemini as-is (the worst case for memory). ``--concurrency`` clients
+post ``--size-mb`` files to ``/process-form`` at once while the server's
+resident set size is sampled from ``/proc``. The per-request figure is the
+peak above the idle baseline divided by the number of requests in flight.
+Finally one upload over ``UPLOAD_MAX_BYTES`` is sent to check it is refused.
+
+    python -m benchmarks.bench_uploads --size-mb 15 --concurrency 8 --output uploads.json
+
+``--app-dir`` runs another checkout of the app (e.g. a ``git worktree`` of an
+older commit) for comparison. With ``--max-mb-per-request`` the script exits
+non-zero when the per-request peak is over that budget.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.harness import REPO_ROOT, post_file, rss_mb, run_servers, sample_peak_rss, wait_ready
+
+
+def write_upload(size: int) -> str:
+    """A file of incompressible bytes on disk, so the client never holds it in memory."""
+    fd, path = tempfile.mkstemp(prefix="bench-upload-", suffix=".jpg")
+    with os.fdopen(fd, "wb") as f:
+        remaining = size
+        while remaining:
+            chunk = os.urandom(min(remaining, 1024 * 1024))
+            f.write(chunk)
+            remaining -= len(chunk)
+    return path
+
+
+async def measure(args: argparse.Namespace, app_pid: int, base_url: str) -> dict:
+    size = int(args.size_mb * 1024 * 1024)
+    upload = write_upload(size)
+    oversize = write_upload(args.upload_limit_mb * 1024 * 1024 + 1024 * 1024)
+    timeout = aiohttp.ClientTimeout(total=600)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await wait_ready(session, base_url + "/")
+            small = write_upload(64 * 1024)
+            await post_file(session, base_url + "/process-form", small)  # warm up imports and pools
+            os.unlink(small)
+            await asyncio.sleep(0.5)
+            baseline = rss_mb(app_pid)
+
+            stop = asyncio.Event()
+            sampler = asyncio.ensure_future(sample_peak_rss(app_pid, stop))
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies, statuses = [], {}
+
+            async def one() -> None:
+                async with semaphore:
+                    start = time.perf_counter()
+                    status = await post_file(session, base_url + "/process-form", upload)
+                    latencies.append(time.perf_counter() - start)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.requests)))
+            wall = time.perf_counter() - start
+            stop.set()
+            peak = await sampler
+
+            before = rss_mb(app_pid)
+            oversize_status = await post_file(session, base_url + "/process-form", oversize)
+            oversize_growth = rss_mb(app_pid) - before
+    finally:
+        os.unlink(upload)
+        os.unlink(oversize)
+
+    latencies.sort()
+    return {
+        "upload_mb": args.size_mb,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "statuses": statuses,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak, 1),
+        "peak_mb_per_request": round((peak - baseline) / args.concurrency, 1),
+        "peak_per_request_over_upload": round((peak - baseline) / args.concurrency / args.size_mb, 2),
+        "latency_p50": round(statistics.median(latencies), 3),
+        "latency_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+        "throughput_mb_s": round(args.requests * args.size_mb / wall, 1),
+        "oversize_status": oversize_status,
+        "oversize_rss_growth_mb": round(oversize_growth, 1),
+    }
+
+
+def main(args: argparse.Namespace) -> int:
+    app_env = {
+        "OCR_BACKEND": "gemini",
+        "IMAGE_PREPROCESS": "false",
+        "CACHE_ENABLED": "false",
+        "PIPELINE_COALESCE": "false",
+        "LOG_STORE_ENABLED": "false",
+        "UPLOAD_MAX_BYTES": str(args.upload_limit_mb * 1024 * 1024),
+    }
+    with run_servers(args.port, args.stub_port, ["--latency", str(args.latency)], app_env, args.app_dir) as app:
+        result = asyncio.run(measure(args, app.pid, f"http://127.0.0.1:{args.port}"))
+
+    for key, value in result.items():
+        print(f"{key:<30} {value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.max_mb_per_request and result["peak_mb_per_request"] > args.max_mb_per_request:
+        print(f"Peak memory per request above the budget of {args.max_mb_per_request} MB", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=15, help="size of each upload")
+    parser.add_argument("--concurrency", type=int, default=8, help="uploads in flight at once")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub Gemini latency, keeps requests overlapping")
+    parser.add_argument("--upload-limit-mb", type=int, default=20, help="UPLOAD_MAX_BYTES for the app, in MiB")
+    parser.add_argument("--max-mb-per-request", type=float, default=0, help="fail above this per-request peak")
+    parser.add_argument("--app-dir", default=REPO_ROOT, help="checkout of the app to run")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--stub-port", type=int, default=8767)
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,164 @@
+"""
+Measure worker startup time and per-worker memory for each worker count and
+``AGENT_INIT`` mode.
+
+The app is started with ``--workers N`` against the local stub Gemini server
+(no API key needed). For each run it reports, from process launch:
+
+- ``ready_s``: every worker has finished startup and accepts requests
+- ``first_result_s``: the first ``/submit-text`` request has returned
+- ``agents_built_s``: every worker has built the orchestrator and its tools
+
+and the resident memory of each worker when idle (once the agents are
+built, or right after startup for ``lazy``) and after ``--requests``
+requests. ``eager`` is the old behaviour, building everything before the
+worker accepts requests.
+
+    python -m benchmarks.bench_workers --workers 1,2,4 --init eager,background,lazy --output workers.json
+
+``--app-env KEY=VALUE`` (repeatable) overrides the app's environment, e.g.
+``REDIS_URL`` to include the shared-state connections.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+import aiohttp
+
+from benchmarks.harness import REPO_ROOT, environment_info, rss_mb, run_servers, worker_pids
+from benchmarks.samples import SAMPLE_TEXTS
+from agents.loader import AGENT_INIT_MODES
+
+TEXTS = list(SAMPLE_TEXTS.values())
+
+
+def count_lines(path: str, needle: str) -> int:
+    with open(path) as f:
+        return sum(needle in line for line in f)
+
+
+async def wait_for_lines(path: str, needle: str, count: int, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while count_lines(path, needle) < count:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {count} x {needle!r} in {path}")
+        await asyncio.sleep(0.02)
+
+
+def worker_memory(app_pid: int) -> Dict[str, float]:
+    per_worker = [rss_mb(pid) for pid in worker_pids(app_pid)]
+    return {
+        "per_worker_mb": round(statistics.mean(per_worker), 1),
+        "max_worker_mb": round(max(per_worker), 1),
+        "total_mb": round(sum(per_worker) + (rss_mb(app_pid) if len(per_worker) > 1 else 0.0), 1),
+    }
+
+
+async def measure(args: argparse.Namespace, workers: int, init: str, app_pid: int, log: str, launched: float) -> Dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    await wait_for_lines(log, "Application startup complete", workers)
+    ready = time.perf_counter() - launched
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
+        async def submit(i: int) -> int:
+            async with session.post(base_url + "/submit-text", json={"text": TEXTS[i % len(TEXTS)]}) as response:
+                await response.read()
+                return response.status
+
+        first_status = await submit(0)
+        first_result = time.perf_counter() - launched
+        agents_built = None
+        if init != "lazy":
+            await wait_for_lines(log, "orchestrator_initialized", workers)
+            agents_built = round(time.perf_counter() - launched, 3)
+        await asyncio.sleep(0.5)
+        idle = worker_memory(app_pid)
+
+        semaphore = asyncio.Semaphore(4 * workers)
+
+        async def limited(i: int) -> int:
+            async with semaphore:
+                return await submit(i)
+
+        statuses = await asyncio.gather(*(limited(i) for i in range(args.requests)))
+        loaded = worker_memory(app_pid)
+    return {
+        "workers": workers,
+        "init": init,
+        "ready_s": round(ready, 3),
+        "first_result_s": round(first_result, 3),
+        "first_status": first_status,
+        "agents_built_s": agents_built,
+        "idle": idle,
+        "after_requests": loaded,
+        "errors": sum(status != 200 for status in statuses),
+    }
+
+
+def run(args: argparse.Namespace, workers: int, init: str) -> Dict:
+    app_env = {
+        "AGENT_INIT": init,
+        "OCR_BACKEND": "gemini",
+        "CACHE_ENABLED": "false",
+        "PIPELINE_COALESCE": "false",
+        "LOG_STORE_ENABLED": "false",
+        "LOG_LEVEL": "INFO",
+        **dict(pair.split("=", 1) for pair in args.app_env),
+    }
+    fd, log = tempfile.mkstemp(prefix="bench-workers-", suffix=".log")
+    os.close(fd)
+    try:
+        launched = time.perf_counter()
+        with run_servers(args.port, args.stub_port, ["--latency", str(args.stub_latency)], app_env,
+                         args.app_dir, workers=workers, log_path=log) as app:
+            return asyncio.run(measure(args, workers, init, app.pid, log, launched))
+    finally:
+        os.unlink(log)
+
+
+def main(args: argparse.Namespace) -> None:
+    results = []
+    print(f"{'workers':>7} {'init':<10} {'ready (s)':>9} {'first (s)':>9} {'built (s)':>9} "
+          f"{'idle MB/worker':>14} {'loaded MB/worker':>16} {'total MB':>9}")
+    for workers in args.workers:
+        for init in args.init:
+            r = run(args, workers, init)
+            results.append(r)
+            built = f"{r['agents_built_s']:.2f}" if r["agents_built_s"] is not None else "-"
+            print(f"{workers:>7} {init:<10} {r['ready_s']:>9.2f} {r['first_result_s']:>9.2f} {built:>9} "
+                  f"{r['idle']['per_worker_mb']:>14.1f} {r['after_requests']['per_worker_mb']:>16.1f} "
+                  f"{r['after_requests']['total_mb']:>9.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "benchmark": "workers",
+                "environment": environment_info(args.app_dir),
+                "settings": {"requests": args.requests, "stub_latency": args.stub_latency, "app_env": args.app_env},
+                "results": results,
+            }, f, indent=2)
+
+
+def init_modes(value: str) -> List[str]:
+    modes = value.split(",")
+    unknown = [mode for mode in modes if mode not in AGENT_INIT_MODES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown modes {unknown}, expected some of {list(AGENT_INIT_MODES)}")
+    return modes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=lambda v: [int(n) for n in v.split(",")], default=[1, 2, 4])
+    parser.add_argument("--init", type=init_modes, default=list(AGENT_INIT_MODES), help="AGENT_INIT modes to compare")
+    parser.add_argument("--requests", type=int, default=40, help="requests sent before the loaded measurement")
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--app-env", action="append", default=[], help="KEY=VALUE for the app (repeatable)")
+    parser.add_argument("--app-dir", default=REPO_ROOT, help="checkout of the app to run")
+    parser.add_argument("--port", type=int, default=8776)
+    parser.add_argument("--stub-port", type=int, default=8775)
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    main(parser.parse_args())
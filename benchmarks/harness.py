@@ -0,0 +1,139 @@
+"""
+Helpers for benchmarks that drive the real API: start the app and the stub
+Gemini server as subprocesses, post requests, and sample the server's memory.
+"""
+import asyncio
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import aiohttp
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of ``pid`` in MiB, from ``/proc`` (Linux only)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker_pids(pid: int) -> List[int]:
+    """The uvicorn worker processes under ``pid``, or ``pid`` itself when it serves alone."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        children = []
+    workers = []
+    for child in children:
+        with open(f"/proc/{child}/cmdline", "rb") as f:
+            if b"resource_tracker" not in f.read():
+                workers.append(child)
+    return workers or [pid]
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+
+def environment_info(app_dir: str = REPO_ROOT) -> Dict[str, str]:
+    """Where and on what a benchmark ran, stored with its results."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=app_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+@contextmanager
+def run_servers(
+    port: int,
+    stub_port: int,
+    stub_args: List[str],
+    app_env: Dict[str, str],
+    app_dir: str = REPO_ROOT,
+    workers: int = 1,
+    log_path: Optional[str] = None,
+) -> Iterator[subprocess.Popen]:
+    """
+    Start the stub Gemini server and the app (uvicorn with ``workers``
+    processes) pointed at it; yields the app process. The app's output goes
+    to ``log_path`` if given. Both are stopped on exit.
+    """
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_gemini", "--port", str(stub_port), *stub_args],
+        cwd=REPO_ROOT,
+    )
+    env = {
+        **os.environ,
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "LOG_LEVEL": "WARNING",
+        **app_env,
+    }
+    log = open(log_path, "w") if log_path else None
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--no-access-log", "--workers", str(workers)],
+        cwd=app_dir, env=env, stdout=log, stderr=subprocess.STDOUT if log else None,
+    )
+    try:
+        yield app
+    finally:
+        app.terminate()
+        stub.terminate()
+        app.wait()
+        stub.wait()
+        if log is not None:
+            log.close()
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"App did not start at {url}")
+        await asyncio.sleep(0.2)
+
+
+async def post_file(session: aiohttp.ClientSession, url: str, path: str, content_type: str = "image/jpeg") -> int:
+    """Upload ``path`` as the ``file`` field, streamed from disk; returns the status."""
+    with open(path, "rb") as f:
+        form = aiohttp.FormData()
+        form.add_field("file", f, filename=os.path.basename(path), content_type=content_type)
+        async with session.post(url, data=form) as response:
+            await response.read()
+            return response.status
+
+
+async def sample_peak_rss(pid: int, stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Highest RSS of ``pid`` seen until ``stop`` is set."""
+    peak = 0.0
+    while not stop.is_set():
+        peak = max(peak, rss_mb(pid))
+        await asyncio.sleep(interval)
+    return peak
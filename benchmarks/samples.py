@@ -0,0 +1,75 @@
+"""Small corpus of representative form texts shared by the benchmark scripts."""
+
+SAMPLE_TEXTS = {
+    "FIR": (
+        "FIRST INFORMATION REPORT (Under Section 154 Cr.P.C.)\n"
+        "Police Station: Andheri East, District: Mumbai Suburban\n"
+        "Complainant: Rahul Sharma, S/o Vinod Sharma, Age 34\n"
+        "Address: 12/B Shanti Nagar, Andheri East, Mumbai 400069\n"
+        "Date of occurrence: 14/05/2025, Time: 21:30\n"
+        "Nature of offence: Theft of motorcycle MH-02-AB-1234 parked outside residence.\n"
+        "Details: The complainant states that his black Honda Shine was stolen from the gate "
+        "of his building between 9:30 PM and 6:00 AM. No suspects are known."
+    ),
+    "Pension": (
+        "APPLICATION FOR OLD AGE PENSION\n"
+        "To, The District Social Welfare Officer, Pune\n"
+        "Name of applicant: Savitri Deshpande\n"
+        "Date of birth: 02/03/1955, Age: 70\n"
+        "Aadhaar No: 4567 8901 2345\n"
+        "Bank account: State Bank of India, A/c 30211234567, IFSC SBIN0000456\n"
+        "Annual family income: Rs. 38,000\n"
+        "I request that I be sanctioned a monthly pension under the state old age pension scheme."
+    ),
+    "Ration Card": (
+        "APPLICATION FOR NEW RATION CARD\n"
+        "Head of family: Mohammed Irfan Khan\n"
+        "Address: House 44, Ward 7, Nagpur 440012\n"
+        "Family members: 5 (Irfan Khan 41, Shabana Khan 37, Ayaan 14, Zoya 11, Fatima Bi 68)\n"
+        "Category requested: BPL\n"
+        "Gas connection: Yes, HP Gas consumer no. 778812\n"
+        "Previous ration card: None"
+    ),
+    "Birth Certificate": (
+        "APPLICATION FOR BIRTH CERTIFICATE\n"
+        "Name of child: Ananya Rao\n"
+        "Sex: Female\n"
+        "Date of birth: 21/01/2025, Place of birth: City General Hospital, Hyderabad\n"
+        "Father's name: Kiran Rao, Mother's name: Lakshmi Rao\n"
+        "Permanent address: Flat 302, Lake View Apartments, Begumpet, Hyderabad 500016\n"
+        "Informant: Kiran Rao (father)"
+    ),
+    "Income Certificate": (
+        "APPLICATION FOR INCOME CERTIFICATE\n"
+        "To, The Tehsildar, Haveli Taluka\n"
+        "Applicant: Sunil Patil, Occupation: Farmer\n"
+        "Address: At post Wagholi, Pune 412207\n"
+        "Annual family income from all sources: Rs. 1,20,000\n"
+        "Purpose: Scholarship application for son\n"
+        "Enclosures: 7/12 extract, ration card copy, self declaration"
+    ),
+    "Death Certificate": (
+        "APPLICATION FOR DEATH CERTIFICATE\n"
+        "Name of deceased: Late Shri Ramesh Gupta, Age 78, Male\n"
+        "Date of death: 03/04/2025, Place of death: Residence, 17 Civil Lines, Jaipur\n"
+        "Cause of death: Cardiac arrest\n"
+        "Informant: Anil Gupta (son), Mobile 9876543210\n"
+        "Cremation ground: Adarsh Nagar"
+    ),
+    "Marriage Certificate": (
+        "APPLICATION FOR REGISTRATION OF MARRIAGE\n"
+        "Bridegroom: Arjun Nair, Age 29, Kochi\n"
+        "Bride: Meera Pillai, Age 27, Thrissur\n"
+        "Date of marriage: 10/02/2025, Place of marriage: Guruvayur Temple\n"
+        "Witnesses: 1. K. Menon 2. S. Varma 3. R. Das\n"
+        "Request issue of marriage certificate."
+    ),
+    "General Complaint": (
+        "To the Municipal Commissioner,\n"
+        "Subject: Complaint regarding broken street lights and garbage collection\n"
+        "Respected Sir/Madam, the street lights on MG Road near Sector 9 bus stop have not been "
+        "working for three weeks and garbage has not been collected for ten days. Residents are "
+        "facing great difficulty. Kindly take necessary action.\n"
+        "Yours faithfully, Priya Menon, 9 MG Road, Sector 9, Navi Mumbai"
+    ),
+}
@@ -0,0 +1,183 @@
+"""
+Local stand-in for the Gemini ``generateContent`` endpoint with configurable
+latency, failures and answers, for exercising retries, rate limiting, the
+circuit breaker and load tests without spending quota.
+
+    python -m benchmarks.stub_gemini --port 8765 --error-rate 0.2 --error-status 429 --retry-after 1
+
+then point the app at it with ``GEMINI_BASE_URL=http://127.0.0.1:8765/v1``.
+
+``--responses`` takes a JSON file mapping prompt prefixes to answer text (the
+key ``"image"`` answers OCR requests); prompts that match no prefix get the
+built-in answers. ``GET /stats`` returns the request and error counts.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Dict, Optional, Sequence
+
+from aiohttp import web
+
+
+def canned_text(prompt: str, has_image: bool) -> str:
+    """A plausible answer for each of the pipeline's prompts."""
+    if has_image:
+        return "FIRST INFORMATION REPORT\nComplainant: Rahul Sharma\nPolice Station: Andheri East"
+    if prompt.startswith("Classify"):
+        return "FIR"
+    if prompt.startswith("Given the form type"):
+        return "Police Department"
+    if prompt.startswith("You process"):
+        return json.dumps({"form_type": "FIR", "fields": {"name": "Rahul Sharma"}, "department": "Police Department"})
+    return json.dumps({"name": "Rahul Sharma", "police_station": "Andheri East"})
+
+
+class StubGemini:
+    """
+    Serves ``POST /v1/models/{model}:generateContent``.
+
+    Each response takes ``latency`` seconds, varied uniformly by ``jitter``
+    (a fraction of ``latency``), and answers with the first ``responses``
+    entry whose key prefixes the prompt, falling back to ``canned_text``.
+    A fraction ``error_rate`` of requests fail with a status drawn from
+    ``error_statuses`` (with a ``Retry-After`` header when ``retry_after`` is
+    set), every request fails with 503 between ``outage_start`` and
+    ``outage_start + outage_seconds`` seconds after startup, and requests
+    beyond ``quota_rpm`` (enforced per second) get a 429.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        error_rate: float = 0.0,
+        error_statuses: Sequence[int] = (429, 503),
+        retry_after: Optional[float] = None,
+        outage_start: float = 0.0,
+        outage_seconds: float = 0.0,
+        quota_rpm: float = 0.0,
+        seed: Optional[int] = None,
+        jitter: float = 0.0,
+        responses: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.responses = dict(responses or {})
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.retry_after = retry_after
+        self.outage_start = outage_start
+        self.outage_seconds = outage_seconds
+        self.quota_rpm = quota_rpm
+        self._recent: deque = deque()
+        self.random = random.Random(seed)
+        self.started_at = time.monotonic()
+        self.stats = {"requests": 0, "ok": 0, "errors": {}}
+        self._runner: Optional[web.AppRunner] = None
+
+    def _over_quota(self) -> bool:
+        now = time.monotonic()
+        while self._recent and self._recent[0] <= now - 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.quota_rpm / 60:
+            return True
+        self._recent.append(now)
+        return False
+
+    def _error_status(self) -> Optional[int]:
+        elapsed = time.monotonic() - self.started_at
+        if self.outage_seconds and self.outage_start <= elapsed < self.outage_start + self.outage_seconds:
+            return 503
+        if self.quota_rpm and self._over_quota():
+            return 429
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self.random.choice(self.error_statuses)
+        return None
+
+    def _delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    def _answer(self, prompt: str, has_image: bool) -> str:
+        if has_image and "image" in self.responses:
+            return self.responses["image"]
+        if not has_image:
+            for prefix, text in self.responses.items():
+                if prefix != "image" and prompt.startswith(prefix):
+                    return text
+        return canned_text(prompt, has_image)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        body = await request.json()
+        await asyncio.sleep(self._delay())
+        status = self._error_status()
+        if status is not None:
+            self.stats["errors"][status] = self.stats["errors"].get(status, 0) + 1
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            error = {"error": {"code": status, "message": "Injected failure", "status": "UNAVAILABLE"}}
+            return web.json_response(error, status=status, headers=headers)
+        self.stats["ok"] += 1
+        parts = body["contents"][0]["parts"]
+        prompt = parts[0].get("text", "")
+        text = self._answer(prompt, has_image=any("inline_data" in part for part in parts))
+        prompt_tokens = len(prompt) // 4
+        output_tokens = len(text) // 4
+        return web.json_response({
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens,
+            },
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/models/{model}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> str:
+        """Start serving and return the base URL to use as ``GEMINI_BASE_URL``."""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.started_at = time.monotonic()
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency varies by up to this fraction either way")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, action="append", help="status for injected failures (repeatable)")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds on injected failures")
+    parser.add_argument("--quota-rpm", type=float, default=0.0, help="requests per minute before answering 429")
+    parser.add_argument("--responses", default="", help="JSON file mapping prompt prefixes to answer text")
+    parser.add_argument("--seed", type=int, default=None, help="seed for injected failures and jitter")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses) as f:
+            responses = json.load(f)
+    stub = StubGemini(
+        args.latency, args.error_rate, args.error_status or (429, 503), args.retry_after, quota_rpm=args.quota_rpm,
+        seed=args.seed, jitter=args.jitter, responses=responses,
+    )
+    web.run_app(stub.app(), host=args.host, port=args.port)
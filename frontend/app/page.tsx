@@ -76,7 +76,7 @@ export default function AutoPilotGov() {
       const response = await fetch("/api/logs/")
       if (response.ok) {
         const logsData = await response.json()
-        setLogs(logsData)
+        setLogs(logsData.items)
       }
     } catch (err) {
       console.error("Failed to fetch logs:", err)
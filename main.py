@@ -1,14 +1,38 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Query, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from agents.orchestrator import OrchestratorAgent
+from agents.loader import LazyOrchestrator
+from agents.pipeline import PIPELINE_MODES
+from agents.scheduler import BatchScheduler, BatchItem
+from agents.jobs import QueueFullError, create_job_manager
+from tools.gemini_client import init_gemini_client, close_gemini_client, get_gemini_client
+from tools.governance import UpstreamUnavailableError
+from tools.cache import get_result_cache, close_result_cache
+from tools.log_store import get_log_store, close_log_store
+from tools.uploads import UploadLimitMiddleware, UploadRoute, UploadTooLargeError, spool_upload
+from tools.shared_state import close_shared_redis
+from tools.metrics import (
+    HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS, mark_worker_dead, metrics_registry, register_stats,
+)
+from tools.log import configure_logging, correlation_scope, get_logger, shutdown_logging
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import math
 import os
+import json
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
 from dotenv import load_dotenv
 
-print("Starting application...")
 load_dotenv()  # Load environment variables from .env file
-print("Environment variables loaded.")
+configure_logging()
+logger = get_logger("main")
+logger.info("application_starting")
 
 app = FastAPI(title="Multi-Agent Form Processing System")
+# Multipart files are spooled to UPLOAD_SPOOL_DIR as they arrive, capped at UPLOAD_MAX_BYTES each
+app.router.route_class = UploadRoute
 
 # Add CORS middleware
 app.add_middleware(
@@ -18,11 +42,84 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Rejects oversized request bodies while they stream in, before they are spooled
+app.add_middleware(UploadLimitMiddleware)
+
+# The agent and its tools are built after the worker starts (see AGENT_INIT)
+orchestrator = LazyOrchestrator()
+batch_scheduler = BatchScheduler(orchestrator)
+job_manager = create_job_manager(orchestrator)
+
+# Expose the components' own counters on /metrics, read at scrape time
+register_stats(
+    "form_cache", lambda: get_result_cache().stats(),
+    counters=("hits", "misses", "local_hits", "redis_hits", "redis_errors", "evictions"),
+    labelled={"stages": "stage"},
+)
+register_stats(
+    "form_jobs", job_manager.local_stats,
+    counters=("submitted", "rejected", "completed", "failed"),
+)
+register_stats("form_batch", lambda: batch_scheduler.stats, counters=("batches", "completed", "failed"))
+register_stats(
+    "form_log_store", lambda: get_log_store().stats(),
+    counters=("recorded", "written", "dropped", "batches", "write_errors"),
+)
+register_stats(
+    "gemini_governance",
+    lambda: {
+        **get_gemini_client().governor.stats(),
+        "circuit_open": int(get_gemini_client().governor.breaker.state != "closed"),
+    },
+    counters=(
+        "calls", "succeeded", "failed", "retried", "rate_limited",
+        "throttled", "throttle_wait_seconds", "short_circuited",
+    ),
+)
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """
+    Record in-flight API requests and their latency per route, and tag every
+    log event of the request with a correlation id (the caller's
+    ``X-Request-ID`` if given), echoed back in the response headers.
+    """
+    start = time.perf_counter()
+    with correlation_scope(request.headers.get("X-Request-ID", "")[:128] or None) as correlation_id:
+        with HTTP_REQUESTS_IN_PROGRESS.labels(request.method).track_inprogress():
+            response = await call_next(request)
+    response.headers["X-Request-ID"] = correlation_id
+    # Label by route template, not raw path, to keep job ids out of the label set
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    duration = time.perf_counter() - start
+    HTTP_REQUEST_DURATION.labels(request.method, route, str(response.status_code)).observe(duration)
+    # Replaces uvicorn's synchronous access log (disabled in the Dockerfile)
+    logger.info(
+        "request_completed", correlation_id=correlation_id, method=request.method, route=route,
+        status=response.status_code, duration=round(duration, 4),
+    )
+    return response
+
+@app.on_event("startup")
+async def startup():
+    """Open the shared, pooled Gemini client used by every tool."""
+    await init_gemini_client()
+    await orchestrator.start()
+    await job_manager.start()
 
-print("Initializing Orchestrator Agent...")
-# Initialize the Orchestrator Agent
-orchestrator = OrchestratorAgent()
-print("Orchestrator Agent initialized.")
+@app.on_event("shutdown")
+async def shutdown():
+    # Finish in-flight jobs while the client and stores they use are still open
+    await job_manager.stop()
+    await close_gemini_client()
+    await close_result_cache()
+    await close_log_store()
+    await close_shared_redis()
+    if orchestrator.loaded:
+        from tools.ocr_tools import shutdown_ocr_process_pool
+        shutdown_ocr_process_pool()
+    mark_worker_dead()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -34,111 +131,273 @@ async def root():
         "docs": "/docs"
     }
 
+# Orchestrator routing decision -> department "method" reported to the frontend
+ROUTE_METHODS = {
+    "llm": "adk-routing",
+    "llm-fused": "adk-fused-extraction",
+    "department-table": "fast-path-table",
+}
+
+def to_frontend_result(result: dict) -> dict:
+    """Transform an orchestrator result to match frontend expectations."""
+    route = result["decisions"].get("route", {"method": "llm", "confidence": None})
+    return {
+        "form_type": result["form_type"],
+        "fields": result["extracted_fields"],  # Rename to fields
+        "department": {  # Convert suggested_route to department object
+            "department_id": "auto-generated",
+            "department_name": result["suggested_route"],
+            "confidence": route["confidence"],
+            "method": ROUTE_METHODS.get(route["method"], route["method"])
+        },
+        "classification": result["decisions"].get("classify"),
+        "auto_fill_results": result["extracted_fields"],  # Use same fields for auto-fill
+        "agent_workflow": result["agent_workflow"],
+        "stage_timings": result["stage_timings"],
+        "pipeline_mode": result["pipeline_mode"],
+        "fallback": result["fallback"],
+        "status": "completed"
+    }
+
+def upstream_unavailable(e: UpstreamUnavailableError) -> HTTPException:
+    """Report a throttled or unavailable Gemini upstream as a retryable 503."""
+    retry_after = math.ceil(e.retry_after) if e.retry_after else 5
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
+
+async def spool(file: UploadFile):
+    """The upload's spooled file, answering 413 if it is over ``UPLOAD_MAX_BYTES``."""
+    try:
+        return await spool_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+def check_mode(mode: str) -> None:
+    if mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}'. Expected one of {list(PIPELINE_MODES)}.")
+
 @app.post("/process-form")
-async def process_form(file: UploadFile = File(...)):
+async def process_form(file: UploadFile = File(...), mode: str = Form("staged")):
     """
-    Process a form from an uploaded image.
+    Process a form from an uploaded image or multi-page PDF.
+
+    Set ``mode`` to ``fused`` to extract type, fields and route in a single LLM request.
     """
+    check_mode(mode)
+    upload = await spool(file)
     try:
-        print(f"Processing file: {file.filename}")
-        image_bytes = await file.read()
-        print(f"File read, size: {len(image_bytes)} bytes")
-        print("Calling orchestrator.run()...")
-        result = await orchestrator.run(image_bytes=image_bytes)
-        print(f"Orchestrator run completed: {result}")
-        
-        # Transform the result to match frontend expectations
-        frontend_result = {
-            "form_type": result["form_type"],
-            "fields": result["extracted_fields"],  # Rename to fields
-            "ocr_text": result.get("ocr_text", ""),  # Include OCR text if available
-            "department": {  # Convert suggested_route to department object
-                "department_id": "auto-generated",
-                "department_name": result["suggested_route"],
-                "confidence": 0.9,
-                "method": "adk-routing"
-            },
-            "auto_fill_results": result["extracted_fields"],  # Use same fields for auto-fill
-            "agent_workflow": result["agent_workflow"],
-            "status": "completed"
-        }
-        
+        logger.info("form_received", filename=file.filename, size=upload.size)
+        result = await orchestrator.run(image_bytes=upload, mode=mode, filename=file.filename)
+
+        frontend_result = to_frontend_result(result)
+        frontend_result["ocr_text"] = result.get("ocr_text", "")  # Include OCR text if available
+        frontend_result["ocr_pages"] = result.get("ocr_pages", [])  # Which OCR backend read each page
         return frontend_result
+    except UpstreamUnavailableError as e:
+        logger.warning("gemini_unavailable", error=str(e), retry_after=e.retry_after)
+        raise upstream_unavailable(e)
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"ERROR: {str(e)}")
-        print(f"TRACEBACK: {error_trace}")
+        logger.exception("request_failed")
         raise HTTPException(status_code=500, detail=f"{str(e)} - {error_trace}")
+    finally:
+        upload.close()
 
 @app.post("/submit-text")
-async def submit_text(text: str = Body(..., embed=True)):
+async def submit_text(text: str = Body(..., embed=True), mode: str = Body("staged", embed=True)):
     """
     Process a form from a text description.
+
+    Set ``mode`` to ``fused`` to extract type, fields and route in a single LLM request.
     """
+    check_mode(mode)
     try:
-        print(f"Processing text: {text[:50]}...")
-        print("Calling orchestrator.run()...")
-        result = await orchestrator.run(text=text)
-        print(f"Orchestrator run completed: {result}")
-        
-        # Transform the result to match frontend expectations
-        frontend_result = {
-            "form_type": result["form_type"],
-            "fields": result["extracted_fields"],  # Rename to fields
-            "input_text": text,  # Include the original text
-            "department": {  # Convert suggested_route to department object
-                "department_id": "auto-generated",
-                "department_name": result["suggested_route"],
-                "confidence": 0.9,
-                "method": "adk-routing"
-            },
-            "auto_fill_results": result["extracted_fields"],  # Use same fields for auto-fill
-            "agent_workflow": result["agent_workflow"],
-            "status": "completed"
-        }
-        
+        logger.info("text_received", length=len(text))
+        result = await orchestrator.run(text=text, mode=mode)
+
+        frontend_result = to_frontend_result(result)
+        frontend_result["input_text"] = text  # Include the original text
         return frontend_result
+    except UpstreamUnavailableError as e:
+        logger.warning("gemini_unavailable", error=str(e), retry_after=e.retry_after)
+        raise upstream_unavailable(e)
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"ERROR: {str(e)}")
-        print(f"TRACEBACK: {error_trace}")
+        logger.exception("request_failed")
         raise HTTPException(status_code=500, detail=f"{str(e)} - {error_trace}")
 
-@app.get("/api/logs")
-async def get_logs():
-    """
-    Get processing logs (mock implementation for demo).
-    """
-    # For the hackathon demo, we'll return mock logs
-    # In a real implementation, this would fetch from a database
-    return [
-        {
-            "id": "log1",
-            "timestamp": "2025-06-24T09:30:00Z",
-            "filename": "complaint.jpg",
-            "form_type": "General Complaint",
-            "department": "Police Department",
-            "status": "completed",
-            "processing_time": 4.2
-        },
-        {
-            "id": "log2",
-            "timestamp": "2025-06-24T08:15:00Z",
-            "filename": "fir.jpg",
-            "form_type": "FIR",
-            "department": "Mumbai Police Department, Andheri East Police Station",
-            "status": "completed",
-            "processing_time": 3.8
-        },
-        {
-            "id": "log3",
-            "timestamp": "2025-06-24T07:45:00Z", 
-            "filename": "pension.jpg",
-            "form_type": "Pension",
-            "department": "Pension Department",
-            "status": "completed",
-            "processing_time": 5.1
-        }
+@app.post("/process-batch")
+async def process_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    texts: Optional[str] = Form(None),
+    mode: str = Form("staged"),
+):
+    """
+    Process many forms at once: any number of uploaded images plus an optional
+    JSON-encoded list of texts. Results are streamed back as newline-delimited
+    JSON, one line per document as it completes, followed by a summary line
+    with aggregate throughput.
+    """
+    check_mode(mode)
+    text_list = []
+    if texts:
+        try:
+            text_list = json.loads(texts)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="'texts' must be a JSON list of strings.")
+        if not isinstance(text_list, list) or not all(isinstance(t, str) for t in text_list):
+            raise HTTPException(status_code=400, detail="'texts' must be a JSON list of strings.")
+    files = files or []
+    if not files and not text_list:
+        raise HTTPException(status_code=400, detail="Provide at least one file or text.")
+
+    items = [
+        BatchItem(i, f.filename or f"file-{i}", load=lambda f=f: spool_upload(f)) for i, f in enumerate(files)
     ]
+    items += [BatchItem(len(files) + i, f"text-{i}", text=t) for i, t in enumerate(text_list)]
+    logger.info("batch_received", documents=len(items), files=len(files), texts=len(text_list))
+
+    async def stream():
+        async for event in batch_scheduler.run(items, mode=mode):
+            if "result" in event:
+                event["result"] = to_frontend_result(event["result"])
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: Optional[UploadFile] = File(None),
+    text: Optional[str] = Form(None),
+    mode: str = Form("staged"),
+):
+    """
+    Queue a form image or text for background processing and return a job id
+    immediately. Poll ``GET /jobs/{job_id}`` or stream ``GET /jobs/{job_id}/events``
+    for progress. Returns 429 when the queue is full.
+    """
+    check_mode(mode)
+    if file is None and not text:
+        raise HTTPException(status_code=400, detail="Provide a file or text.")
+    upload = await spool(file) if file is not None else None
+    try:
+        job = await job_manager.submit(image_bytes=upload, text=text, mode=mode, filename=file.filename if file else None)
+    except QueueFullError as e:
+        if upload is not None:
+            upload.close()
+        return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": "5"})
+    logger.info("job_queued", job_id=job.id)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """
+    Queue depth and lifetime counters for background jobs.
+    """
+    return await job_manager.summary()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Current status, progress events and (once completed) result of a job.
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    data = job.to_dict()
+    if job.result is not None:
+        data["result"] = to_frontend_result(job.result)
+    return data
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events with stage-by-stage progress of a job. The stream ends
+    after the ``completed`` or ``failed`` event.
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+
+    async def stream():
+        async for event in job_manager.subscribe(job):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/batch/stats")
+async def batch_stats():
+    """
+    Lifetime counters for the batch scheduler.
+    """
+    return {"max_concurrency": batch_scheduler.max_concurrency, **batch_scheduler.stats}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters for the stage result cache.
+    """
+    return get_result_cache().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, Gemini request status,
+    size and token counters, in-flight gauges, and cache/queue statistics.
+    """
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/gemini/stats")
+async def gemini_stats():
+    """
+    Request and token usage of the Gemini client, plus rate limiting, retry
+    and circuit breaker counters.
+    """
+    client = get_gemini_client()
+    return {**client.stats, "governance": client.governor.stats()}
+
+def epoch(value: Optional[datetime]) -> Optional[float]:
+    """Query-string datetime -> epoch seconds; naive values are taken as UTC."""
+    if value is None:
+        return None
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+@app.get("/api/logs")
+async def get_logs(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    form_type: Optional[str] = None,
+    department: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    Processing history, newest first, optionally filtered by form type,
+    department, status and time range. Returns ``items`` and a
+    ``next_cursor`` to pass back as ``cursor`` for the next page.
+    """
+    try:
+        return await get_log_store().query(
+            limit=limit, cursor=cursor, form_type=form_type, department=department,
+            status=status, since=epoch(since), until=epoch(until),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/logs/stats")
+async def get_log_stats(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Count and p50/p95 processing time per form type for completed runs in
+    the given time range (whole hours), plus the log writer's counters.
+    """
+    return {
+        "form_types": await get_log_store().processing_time_stats(since=epoch(since), until=epoch(until)),
+        "writer": get_log_store().stats(),
+    }
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import urlparse
+from tools.log import get_logger
+
+logger = get_logger(__name__)
+
+_MISS = object()
+
+
+def content_hash(data: Union[bytes, str]) -> str:
+    """SHA-256 hex digest of raw bytes or of a string's UTF-8 encoding."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially reformatted resubmissions share a cache key."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_version(*parts: str) -> str:
+    """
+    Short digest of everything that changes a stage's output for the same input,
+    e.g. the prompt template and the model name. Changing any part changes every
+    key for that stage, which invalidates its cached results.
+    """
+    return content_hash("\x00".join(parts))[:12]
+
+
+class LRUCache:
+    """In-process LRU tier with a per-entry TTL and entry-count and size limits."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISS
+        expires_at, size, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return _MISS
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes += size
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+
+class ResultCache:
+    """
+    Two-tier cache for pipeline stage results, keyed by content hash.
+
+    Lookups go to the in-process LRU tier first and then, if configured, to
+    Redis; Redis hits are promoted into the LRU tier. Values must be
+    JSON-serializable. Both tiers hold the JSON form, so every hit decodes a
+    fresh copy and callers may change the results they get without touching
+    the cached entry. Redis failures are counted and treated as misses so
+    that a cache outage never fails a request.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        redis_url: Optional[str] = None,
+    ) -> None:
+        self.enabled = enabled if enabled is not None else os.environ.get("CACHE_ENABLED", "true").lower() == "true"
+        self.ttl = ttl if ttl is not None else float(os.environ.get("CACHE_TTL_SECONDS", "3600"))
+        self.local = LRUCache(
+            max_entries=max_entries if max_entries is not None else int(os.environ.get("CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=max_bytes if max_bytes is not None else int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=self.ttl,
+        )
+        self.redis_url = (
+            redis_url if redis_url is not None else os.environ.get("CACHE_REDIS_URL") or os.environ.get("REDIS_URL", "")
+        )
+        self._redis = None
+        if self.enabled and self.redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(self.redis_url)
+                logger.info("cache_redis_enabled", host=urlparse(self.redis_url).hostname)
+            except ImportError:
+                logger.warning("cache_redis_unavailable", reason="redis package not installed")
+        self.counters = {"hits": 0, "misses": 0, "local_hits": 0, "redis_hits": 0, "redis_errors": 0}
+        self.stage_counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, stage: str, outcome: str) -> None:
+        self.counters[outcome] += 1
+        per_stage = self.stage_counters.setdefault(stage, {"hits": 0, "misses": 0})
+        per_stage[outcome] += 1
+
+    async def get(self, key: str) -> Any:
+        raw = self.local.get(key)
+        if raw is not _MISS:
+            self.counters["local_hits"] += 1
+            return json.loads(raw)
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(key)
+            except Exception as e:
+                self.counters["redis_errors"] += 1
+                logger.warning("cache_redis_error", operation="get", error=str(e))
+                return _MISS
+            if raw is not None:
+                self.counters["redis_hits"] += 1
+                self.local.set(key, raw, len(raw))
+                return json.loads(raw)
+        return _MISS
+
+    async def set(self, key: str, value: Any) -> None:
+        raw = json.dumps(value)
+        self.local.set(key, raw, len(raw))
+        if self._redis is not None:
+            try:
+                await self._redis.set(key, raw, ex=int(self.ttl))
+            except Exception as e:
+                self.counters["redis_errors"] += 1
+                logger.warning("cache_redis_error", operation="set", error=str(e))
+
+    async def get_or_compute(self, stage: str, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached result for ``key`` or run ``compute`` and cache its result."""
+        if not self.enabled:
+            return await compute()
+        key = f"formcache:{stage}:{key}"
+        value = await self.get(key)
+        if value is not _MISS:
+            self._count(stage, "hits")
+            return value
+        self._count(stage, "misses")
+        value = await compute()
+        await self.set(key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "redis": bool(self._redis),
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self.local),
+            "bytes": self.local.bytes,
+            "evictions": self.local.evictions,
+            "stages": self.stage_counters,
+        }
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
+
+
+async def close_result_cache() -> None:
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
@@ -0,0 +1,174 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from tools.text_tools import FORM_TYPES
+
+# (pattern, weight) pairs per form type; strong title phrases carry the most weight
+FORM_TYPE_RULES: Dict[str, List[Tuple[str, float]]] = {
+    "FIR": [
+        (r"\bfirst\s+information\s+report\b", 4),
+        (r"\bF\.?I\.?R\.?\b", 2),
+        (r"\bsection\s+154\b|\bcr\.?\s*p\.?\s*c\b", 2),
+        (r"\bpolice\s+station\b", 1),
+        (r"\b(theft|stolen|robbery|assault|offen[cs]e|accused|suspect)\b", 1),
+    ],
+    "Pension": [
+        (r"\bpension\b", 3),
+        (r"\b(old\s+age|widow|retire(d|ment)|superannuation)\b", 1.5),
+        (r"\bmonthly\s+(pension|allowance)\b", 1),
+        (r"\b(pensioner|PPO)\b", 1.5),
+    ],
+    "Ration Card": [
+        (r"\bration\s+card\b", 4),
+        (r"\b(BPL|APL|AAY|antyodaya)\b", 1.5),
+        (r"\b(fair\s+price\s+shop|public\s+distribution|PDS)\b", 1.5),
+        (r"\bhead\s+of\s+(the\s+)?family\b", 1),
+    ],
+    "Income Certificate": [
+        (r"\bincome\s+certificate\b", 4),
+        (r"\bannual\s+(family\s+)?income\b", 1.5),
+        (r"\b(salary|earnings|source\s+of\s+income)\b", 1),
+    ],
+    "Birth Certificate": [
+        (r"\bbirth\s+certificate\b", 4),
+        (r"\b(date|place)\s+of\s+birth\b", 1),
+        (r"\bname\s+of\s+(the\s+)?child\b", 2),
+        (r"\b(new\s*born|hospital|delivery|informant)\b", 1),
+    ],
+    "Death Certificate": [
+        (r"\bdeath\s+certificate\b", 4),
+        (r"\b(date|place|cause)\s+of\s+death\b", 2),
+        (r"\b(deceased|late\s+shri|late\s+smt|cremation|burial)\b", 1.5),
+    ],
+    "Marriage Certificate": [
+        (r"\bmarriage\s+certificate\b", 4),
+        (r"\b(registration\s+of\s+marriage|date\s+of\s+marriage)\b", 2),
+        (r"\b(bride|bridegroom|groom|husband|wife|spouse)\b", 1),
+        (r"\bwitness(es)?\b", 0.5),
+    ],
+    "General Complaint": [
+        (r"\bcomplaint\b", 2),
+        (r"\b(grievance|kindly\s+take\s+(necessary\s+)?action|not\s+working|not\s+been\s+collected)\b", 1.5),
+        (r"\b(municipal|street\s+light|garbage|water\s+supply|pothole|drainage)\b", 1),
+    ],
+}
+
+# Short descriptions of each form type used as TF-IDF prototypes
+FORM_TYPE_PROTOTYPES: Dict[str, str] = {
+    "FIR": "first information report police station complainant accused offence theft stolen crime incident occurrence section cr p c",
+    "Pension": "pension application old age widow retirement pensioner monthly pension bank account scheme social welfare age",
+    "Ration Card": "ration card head of family family members bpl apl gas connection fair price shop public distribution food supply",
+    "Income Certificate": "income certificate annual income family income salary occupation earnings tehsildar revenue proof",
+    "Birth Certificate": "birth certificate name of child date of birth place of birth hospital father mother sex informant registration",
+    "Death Certificate": "death certificate deceased date of death place of death cause of death informant relation cremation",
+    "Marriage Certificate": "marriage certificate bride groom husband wife date of marriage place of marriage witnesses registration",
+    "General Complaint": "complaint grievance municipal commissioner street lights garbage collection water supply road repair kindly take action",
+}
+
+# Default form type -> department table; override with FAST_PATH_DEPARTMENTS_FILE
+DEFAULT_DEPARTMENTS: Dict[str, str] = {
+    "FIR": "Police Department",
+    "Pension": "Pension Department",
+    "Ration Card": "Food and Civil Supplies Department",
+    "Income Certificate": "Revenue Department",
+    "Birth Certificate": "Municipal Registrar of Births and Deaths",
+    "Death Certificate": "Municipal Registrar of Births and Deaths",
+    "Marriage Certificate": "Marriage Registration Office",
+    "General Complaint": "Municipal Corporation",
+}
+
+_TOKEN = re.compile(r"[a-z]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class FastPathClassifier:
+    """
+    Local form-type classifier combining precompiled keyword/regex rules with
+    TF-IDF similarity to a prototype description of each form type.
+
+    ``classify`` returns the best form type and a confidence in [0, 1] that
+    grows with the absolute strength of the evidence and with the margin over
+    the runner-up; callers answer locally only above ``threshold``.
+    """
+
+    # Combined score at which evidence is considered saturated
+    SATURATION = 4.0
+    TFIDF_WEIGHT = 2.0
+
+    def __init__(self, threshold: Optional[float] = None) -> None:
+        self.threshold = threshold if threshold is not None else float(os.environ.get("FAST_PATH_THRESHOLD", "0.6"))
+        self.rules = {
+            form_type: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in rules]
+            for form_type, rules in FORM_TYPE_RULES.items()
+        }
+        docs = {form_type: Counter(_tokens(text)) for form_type, text in FORM_TYPE_PROTOTYPES.items()}
+        df = Counter(token for counts in docs.values() for token in counts)
+        self.idf = {token: math.log((1 + len(docs)) / (1 + n)) + 1 for token, n in df.items()}
+        self.prototypes = {form_type: self._vector(counts) for form_type, counts in docs.items()}
+
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        vector = {token: (1 + math.log(n)) * self.idf[token] for token, n in counts.items() if token in self.idf}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {token: v / norm for token, v in vector.items()}
+
+    def scores(self, text: str) -> Dict[str, float]:
+        doc = self._vector(Counter(_tokens(text)))
+        scores = {}
+        for form_type in FORM_TYPES:
+            rule_score = sum(weight for pattern, weight in self.rules.get(form_type, []) if pattern.search(text))
+            prototype = self.prototypes.get(form_type, {})
+            cosine = sum(v * prototype.get(token, 0.0) for token, v in doc.items())
+            scores[form_type] = rule_score + self.TFIDF_WEIGHT * cosine
+        return scores
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        ranked = sorted(self.scores(text).items(), key=lambda item: item[1], reverse=True)
+        (best, top), (_, second) = ranked[0], ranked[1]
+        if top <= 0:
+            return best, 0.0
+        confidence = (top - second) / top * min(1.0, top / self.SATURATION)
+        return best, round(confidence, 4)
+
+
+class DepartmentTable:
+    """Configurable form type -> department mapping used to route without an LLM call."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.departments = dict(DEFAULT_DEPARTMENTS)
+        path = path if path is not None else os.environ.get("FAST_PATH_DEPARTMENTS_FILE", "")
+        if path:
+            with open(path) as f:
+                self.departments.update(json.load(f))
+
+    def lookup(self, form_type: str) -> Optional[str]:
+        return self.departments.get(form_type)
+
+
+def fast_path_enabled() -> bool:
+    return os.environ.get("FAST_PATH_ENABLED", "true").lower() == "true"
+
+
+_classifier: Optional[FastPathClassifier] = None
+_departments: Optional[DepartmentTable] = None
+
+
+def get_fast_path_classifier() -> FastPathClassifier:
+    """Return the process-wide fast-path classifier, building it on first use."""
+    global _classifier
+    if _classifier is None:
+        _classifier = FastPathClassifier()
+    return _classifier
+
+
+def get_department_table() -> DepartmentTable:
+    """Return the process-wide department table, loading it on first use."""
+    global _departments
+    if _departments is None:
+        _departments = DepartmentTable()
+    return _departments
@@ -0,0 +1,327 @@
+import aiohttp
+import asyncio
+import base64
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+from tools.governance import CallGovernor
+from tools.log import get_logger
+from tools.uploads import ImageData
+from tools.metrics import (
+    GEMINI_IN_PROGRESS,
+    GEMINI_REQUEST_BYTES,
+    GEMINI_REQUEST_DURATION,
+    GEMINI_REQUESTS,
+    GEMINI_RESPONSE_BYTES,
+    GEMINI_TOKENS,
+)
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1"
+DEFAULT_MODEL = "gemini-1.5-flash"
+# Multiple of 3 so every chunk base64-encodes without padding
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+logger = get_logger(__name__)
+
+
+# Token counts of the pipeline stage running in this context, see ``stage_usage``
+_stage_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("gemini_stage_usage", default=None)
+
+
+@contextmanager
+def stage_usage() -> Iterator[Dict[str, int]]:
+    """
+    Add up the tokens reported by every Gemini call made in this context,
+    including tasks started from it, into the yielded dict.
+    """
+    usage = {"prompt_tokens": 0, "output_tokens": 0}
+    token = _stage_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _stage_usage.reset(token)
+
+
+class GeminiAPIError(Exception):
+    """Raised when the Gemini endpoint answers with a non-200 status."""
+
+    def __init__(self, status: int, body: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"Gemini API error: {status} - {body}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+
+# google.rpc.RetryInfo as serialized in Gemini 429 bodies, e.g. "retryDelay": "13s"
+_RETRY_DELAY = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+def parse_retry_after(header: Optional[str], body: str = "") -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delta or HTTP date) or a RetryInfo body."""
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    match = _RETRY_DELAY.search(body)
+    return float(match.group(1)) if match else None
+
+
+class InlineData:
+    """
+    Binary content to embed base64-encoded in a JSON request body without
+    materializing the encoded string (see ``StreamingJSONBody``).
+    """
+
+    def __init__(self, data: ImageData) -> None:
+        self.data = data
+
+    @property
+    def encoded_size(self) -> int:
+        return 4 * ((len(self.data) + 2) // 3)
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        if isinstance(self.data, bytes):
+            view = memoryview(self.data)
+            for offset in range(0, len(view), BASE64_CHUNK_SIZE):
+                yield base64.b64encode(view[offset:offset + BASE64_CHUNK_SIZE])
+            return
+        loop = asyncio.get_running_loop()
+        f = await loop.run_in_executor(None, self.data.open)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, BASE64_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield base64.b64encode(chunk)
+        finally:
+            f.close()
+
+
+class StreamingJSONBody:
+    """
+    JSON serialization of ``payload`` produced in chunks, with every
+    ``InlineData`` value streamed as a base64 string. ``size`` is known up
+    front so the request can carry a ``Content-Length``; ``chunks()`` can be
+    iterated again for a retry.
+    """
+
+    def __init__(self, payload: Any) -> None:
+        self.inline = []
+        self._nonce = uuid.uuid4().hex
+
+        def placeholder(value: Any) -> str:
+            if not isinstance(value, InlineData):
+                raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+            self.inline.append(value)
+            return self._marker(len(self.inline) - 1)
+
+        text = json.dumps(payload, default=placeholder)
+        self.segments = []
+        for index in range(len(self.inline)):
+            before, text = text.split(self._marker(index), 1)
+            self.segments.append(before.encode("utf-8"))
+        self.segments.append(text.encode("utf-8"))
+        self.size = sum(len(s) for s in self.segments) + sum(i.encoded_size for i in self.inline)
+
+    def _marker(self, index: int) -> str:
+        # Random per body, so no prompt text can be mistaken for a placeholder
+        return f"inline-data-{self._nonce}-{index}"
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        for segment, inline in zip(self.segments, self.inline):
+            yield segment
+            async for chunk in inline.chunks():
+                yield chunk
+        yield self.segments[-1]
+
+
+class GeminiClient:
+    """
+    Shared async client for the Gemini ``generateContent`` endpoint.
+
+    A single ``aiohttp.ClientSession`` is kept open for the lifetime of the
+    application so that every tool call reuses pooled keep-alive connections
+    instead of paying a fresh TCP+TLS handshake. Every request goes through
+    a ``CallGovernor`` that rate-limits, retries and circuit-breaks calls.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        limit: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
+        governor: Optional[CallGovernor] = None,
+    ) -> None:
+        self.base_url = (base_url or os.environ.get("GEMINI_BASE_URL", DEFAULT_BASE_URL)).rstrip("/")
+        self.model = model or os.environ.get("GEMINI_MODEL", DEFAULT_MODEL)
+        self._api_key = api_key
+        self.limit = limit if limit is not None else int(os.environ.get("GEMINI_POOL_LIMIT", "100"))
+        self.limit_per_host = (
+            limit_per_host if limit_per_host is not None else int(os.environ.get("GEMINI_POOL_LIMIT_PER_HOST", "20"))
+        )
+        self.keepalive_timeout = (
+            keepalive_timeout if keepalive_timeout is not None else float(os.environ.get("GEMINI_KEEPALIVE_TIMEOUT", "60"))
+        )
+        self.connect_timeout = (
+            connect_timeout if connect_timeout is not None else float(os.environ.get("GEMINI_CONNECT_TIMEOUT", "10"))
+        )
+        self.total_timeout = (
+            total_timeout if total_timeout is not None else float(os.environ.get("GEMINI_TIMEOUT", "120"))
+        )
+        self.governor = governor or CallGovernor()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+    @property
+    def api_key(self) -> str:
+        api_key = self._api_key or os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set.")
+        return api_key
+
+    @property
+    def endpoint(self) -> str:
+        return f"{self.base_url}/models/{self.model}:generateContent"
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    async def start(self) -> None:
+        """Open the pooled session. Safe to call more than once."""
+        async with self._lock:
+            if not self.closed:
+                return
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            logger.info(
+                "gemini_client_started", endpoint=self.endpoint, limit=self.limit, limit_per_host=self.limit_per_host
+            )
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+                logger.info("gemini_client_closed")
+            self._session = None
+
+    async def generate_content(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        POST a ``generateContent`` payload and return the decoded JSON response.
+
+        Throttling and server errors are retried with backoff (see
+        ``CallGovernor``).
+
+        Raises:
+            GeminiAPIError: if the endpoint answers with a non-retryable status.
+            UpstreamUnavailableError: if the circuit breaker is open or
+                retryable errors persisted through every attempt.
+        """
+        if self.closed:
+            await self.start()
+        resp_json = await self.governor.call(lambda: self._post(payload))
+        self._record_usage(resp_json)
+        return resp_json
+
+    async def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        params = {"key": self.api_key}
+        # Serialized here rather than by aiohttp so the body size can be recorded
+        body = StreamingJSONBody(payload)
+        headers = {"Content-Type": "application/json"}
+        if body.inline:
+            # Streamed with an explicit length: a multi-megabyte image is never held base64-encoded
+            data: Any = body.chunks()
+            headers["Content-Length"] = str(body.size)
+        else:
+            data = b"".join(body.segments)
+        GEMINI_REQUEST_BYTES.observe(body.size)
+        status = "cancelled"
+        start = time.perf_counter()
+        try:
+            with GEMINI_IN_PROGRESS.track_inprogress():
+                async with self._session.post(self.endpoint, params=params, data=data, headers=headers) as response:
+                    status = str(response.status)
+                    raw = await response.read()
+        except asyncio.TimeoutError:
+            status = "timeout"
+            raise
+        except aiohttp.ClientError:
+            status = "connection_error"
+            raise
+        finally:
+            GEMINI_REQUESTS.labels(status).inc()
+            GEMINI_REQUEST_DURATION.labels(status).observe(time.perf_counter() - start)
+        GEMINI_RESPONSE_BYTES.observe(len(raw))
+        if response.status != 200:
+            body = raw.decode("utf-8", errors="replace")
+            raise GeminiAPIError(response.status, body, parse_retry_after(response.headers.get("Retry-After"), body))
+        return json.loads(raw)
+
+    def _record_usage(self, resp_json: Dict[str, Any]) -> None:
+        usage = resp_json.get("usageMetadata") or {}
+        self.stats["requests"] += 1
+        self.stats["prompt_tokens"] += usage.get("promptTokenCount", 0)
+        self.stats["output_tokens"] += usage.get("candidatesTokenCount", 0)
+        self.stats["total_tokens"] += usage.get("totalTokenCount", 0)
+        GEMINI_TOKENS.labels("prompt").inc(usage.get("promptTokenCount", 0))
+        GEMINI_TOKENS.labels("output").inc(usage.get("candidatesTokenCount", 0))
+        stage = _stage_usage.get()
+        if stage is not None:
+            stage["prompt_tokens"] += usage.get("promptTokenCount", 0)
+            stage["output_tokens"] += usage.get("candidatesTokenCount", 0)
+
+    @staticmethod
+    def response_text(resp_json: Dict[str, Any]) -> str:
+        """Return the text of the first candidate in a ``generateContent`` response."""
+        return resp_json['candidates'][0]['content']['parts'][0]['text']
+
+
+_client: Optional[GeminiClient] = None
+
+
+def get_gemini_client() -> GeminiClient:
+    """Return the process-wide client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = GeminiClient()
+    return _client
+
+
+async def init_gemini_client(client: Optional[GeminiClient] = None) -> GeminiClient:
+    """Install (optionally a custom) client and open its connection pool."""
+    global _client
+    if client is not None:
+        if _client is not None and _client is not client:
+            await _client.close()
+        _client = client
+    client = get_gemini_client()
+    await client.start()
+    return client
+
+
+async def close_gemini_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
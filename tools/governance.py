@@ -0,0 +1,467 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar, Union
+
+import aiohttp
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, wait_random_exponential
+
+from tools.log import get_logger
+from tools.shared_state import get_shared_redis, worker_count
+
+T = TypeVar("T")
+
+logger = get_logger(__name__)
+
+# Upstream statuses worth retrying; anything else is the caller's fault
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class UpstreamUnavailableError(Exception):
+    """
+    Raised when the upstream cannot serve a call right now, either because
+    retries were exhausted on throttling/server errors or because the circuit
+    breaker is open. ``retry_after`` suggests when to try again, in seconds.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Raised without calling the upstream while the circuit breaker is open."""
+
+
+def _status(error: BaseException) -> Optional[int]:
+    return getattr(error, "status", None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return True
+    return _status(error) in RETRYABLE_STATUSES
+
+
+def is_outage(error: BaseException) -> bool:
+    """Errors that count against the circuit breaker: the upstream is down, not busy."""
+    if isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return True
+    status = _status(error)
+    return status is not None and status >= 500
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled at ``rate`` tokens per second, holding at most
+    ``burst`` tokens.
+
+    The rate adapts to the upstream (AIMD): a 429 halves it, down to
+    ``min_rate``, and every success adds back a twentieth of the configured
+    rate, so a quota we over-estimated is discovered and respected instead
+    of being hammered. 429s arriving within ``cooldown`` seconds of a
+    decrease belong to the same burst and do not lower the rate again.
+    """
+
+    def __init__(self, rate: float, burst: float, min_rate: Optional[float] = None, cooldown: float = 1.0) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.min_rate = min_rate if min_rate is not None else rate / 20
+        self.cooldown = cooldown
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._throttled_at = float("-inf")
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created on first use so it binds to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Take one token, waiting for it if necessary. Returns the seconds waited."""
+        waited = 0.0
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self.lock:
+            self._refill()
+            while self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= 1
+        return waited
+
+    async def throttle(self) -> None:
+        if time.monotonic() - self._throttled_at < self.cooldown:
+            return
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._throttled_at = time.monotonic()
+
+    async def recover(self) -> None:
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+# Refill, then take a token if one is there; otherwise report how long until one is.
+# Wall-clock time comes from the caller so every worker on the host agrees on it.
+_ACQUIRE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'rate')
+local now, burst = tonumber(ARGV[1]), tonumber(ARGV[3])
+local rate = tonumber(state[3]) or tonumber(ARGV[2])
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {tostring(wait), tostring(rate)}
+"""
+
+# Refill at the old rate, then apply the AIMD step: ARGV[5] == 'throttle' halves
+# the rate (once per cooldown), anything else adds back a twentieth of the maximum.
+_ADJUST_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'rate', 'throttled_at')
+local now, max_rate, min_rate = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local rate = tonumber(state[3]) or max_rate
+local throttled_at = tonumber(state[4]) or 0
+if ARGV[5] == 'throttle' then
+  if now - throttled_at < tonumber(ARGV[4]) then return tostring(rate) end
+  throttled_at = now
+elseif rate >= max_rate then
+  return tostring(rate)
+end
+local tokens = tonumber(state[1]) or 0
+local updated = tonumber(state[2]) or now
+tokens = math.min(tonumber(ARGV[6]), tokens + math.max(0, now - updated) * rate)
+if ARGV[5] == 'throttle' then
+  rate = math.max(min_rate, rate / 2)
+else
+  rate = math.min(max_rate, rate + max_rate / 20)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now, 'rate', rate, 'throttled_at', throttled_at)
+return tostring(rate)
+"""
+
+
+class RedisTokenBucket:
+    """
+    ``TokenBucket`` whose tokens and adaptive rate live in Redis, so every
+    worker process draws on one budget and a 429 seen by any worker slows
+    them all down.
+
+    Each acquire is one atomic script call. If Redis fails, the worker falls
+    back to a local bucket with its ``1 / WEB_CONCURRENCY`` share of the
+    budget until Redis answers again.
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        rate: float,
+        burst: float,
+        min_rate: Optional[float] = None,
+        cooldown: float = 1.0,
+        key: str = "gemini:ratelimit",
+    ) -> None:
+        self.redis = redis
+        self.key = key
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.min_rate = min_rate if min_rate is not None else rate / 20
+        self.cooldown = cooldown
+        workers = worker_count()
+        self.fallback = TokenBucket(rate / workers, burst / workers, cooldown=cooldown)
+        self.redis_errors = 0
+        self._acquire = redis.register_script(_ACQUIRE_SCRIPT)
+        self._adjust = redis.register_script(_ADJUST_SCRIPT)
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _failed(self, operation: str, error: Exception) -> None:
+        self.redis_errors += 1
+        logger.warning("rate_limit_redis_error", operation=operation, error=str(error))
+
+    async def acquire(self) -> float:
+        waited = 0.0
+        # This worker's callers still queue in arrival order; workers race fairly in Redis
+        async with self.lock:
+            while True:
+                try:
+                    wait, rate = await self._acquire(
+                        keys=[self.key], args=[time.time(), self.max_rate, self.burst, 3600]
+                    )
+                except Exception as e:
+                    self._failed("acquire", e)
+                    return waited + await self.fallback.acquire()
+                self.rate = float(rate)
+                wait = float(wait)
+                if wait <= 0:
+                    return waited
+                await asyncio.sleep(wait)
+                waited += wait
+
+    async def _adjust_rate(self, direction: str) -> None:
+        try:
+            rate = await self._adjust(
+                keys=[self.key], args=[time.time(), self.max_rate, self.min_rate, self.cooldown, direction, self.burst]
+            )
+        except Exception as e:
+            self._failed(direction, e)
+            await (self.fallback.throttle() if direction == "throttle" else self.fallback.recover())
+            return
+        self.rate = float(rate)
+
+    async def throttle(self) -> None:
+        await self._adjust_rate("throttle")
+
+    async def recover(self) -> None:
+        # Skips the round trip in the common case of a bucket already at full rate
+        if self.rate < self.max_rate:
+            await self._adjust_rate("recover")
+
+
+def create_token_bucket(rate: float, burst: float) -> Union[TokenBucket, RedisTokenBucket]:
+    """
+    A bucket for ``rate`` calls per second across every worker process: shared
+    through Redis when ``REDIS_URL`` is set, otherwise split evenly between the
+    ``WEB_CONCURRENCY`` workers so their total stays within the budget.
+    """
+    redis = get_shared_redis()
+    if redis is not None:
+        return RedisTokenBucket(redis, rate, burst)
+    workers = worker_count()
+    if workers > 1:
+        logger.info("rate_limit_partitioned", workers=workers, rate_per_minute=round(rate * 60 / workers, 1))
+    return TokenBucket(rate / workers, burst / workers)
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while the upstream is down.
+
+    After ``failure_threshold`` consecutive outage errors the circuit opens
+    and calls are rejected for ``reset_timeout`` seconds. It then half-opens
+    and lets a single trial call through: success closes the circuit, failure
+    opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # Token held by the half-open trial call while it is in flight
+        self._trial: Optional[object] = None
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self) -> Optional[object]:
+        """
+        Raise ``CircuitOpenError`` unless the call may go through. Returns a
+        token if the call is the half-open trial, else ``None``; hand it back
+        to ``release``.
+        """
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                raise CircuitOpenError("Gemini circuit breaker is open", self.retry_after())
+            self.state = self.HALF_OPEN
+            logger.info("circuit_half_open")
+        if self.state == self.HALF_OPEN:
+            if self._trial is not None:
+                raise CircuitOpenError("Gemini circuit breaker is half-open, trial request in flight", 1.0)
+            self._trial = object()
+            return self._trial
+        return None
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("circuit_closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial = None
+
+    def release(self, trial: Optional[object]) -> None:
+        """
+        Forget a call that ended without a verdict (e.g. it was cancelled).
+        Only the trial call itself, identified by its token, frees the
+        half-open slot for another trial.
+        """
+        if trial is not None and trial is self._trial:
+            self._trial = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial = None
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("circuit_opened", consecutive_failures=self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class CallGovernor:
+    """
+    Admission control for calls to a rate-limited upstream.
+
+    Each call first passes the circuit breaker, then waits for a token from
+    the rate limiter, and is retried with jittered exponential backoff on
+    throttling and server errors. A ``Retry-After`` hint on the error sets a
+    lower bound on the wait; hints longer than ``max_delay`` end the retries
+    immediately. Once retries are exhausted the caller gets an
+    ``UpstreamUnavailableError``.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+    ) -> None:
+        rate_per_minute = (
+            rate_per_minute if rate_per_minute is not None else float(os.environ.get("GEMINI_RATE_LIMIT_RPM", "1000"))
+        )
+        burst = burst if burst is not None else float(os.environ.get("GEMINI_RATE_LIMIT_BURST", "10"))
+        # A rate of 0 disables client-side rate limiting
+        self.bucket = create_token_bucket(rate_per_minute / 60, burst) if rate_per_minute > 0 else None
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.environ.get("GEMINI_RETRY_ATTEMPTS", "4"))
+        self.base_delay = base_delay if base_delay is not None else float(os.environ.get("GEMINI_RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = max_delay if max_delay is not None else float(os.environ.get("GEMINI_RETRY_MAX_DELAY", "20"))
+        self.breaker = CircuitBreaker(
+            failure_threshold if failure_threshold is not None else int(os.environ.get("GEMINI_BREAKER_FAILURES", "5")),
+            reset_timeout if reset_timeout is not None else float(os.environ.get("GEMINI_BREAKER_RESET_SECONDS", "30")),
+        )
+        self._backoff = wait_random_exponential(multiplier=self.base_delay, max=self.max_delay)
+        self.counters = {
+            "calls": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retried": 0,
+            "rate_limited": 0,  # 429 responses received from the upstream
+            "throttled": 0,  # calls that had to wait for a rate-limit token
+            "throttle_wait_seconds": 0.0,
+            "short_circuited": 0,
+        }
+
+    def _wait(self, retry_state: RetryCallState) -> float:
+        delay = self._backoff(retry_state)
+        retry_after = getattr(retry_state.outcome.exception(), "retry_after", None)
+        return max(delay, retry_after) if retry_after else delay
+
+    def _stop(self, retry_state: RetryCallState) -> bool:
+        if retry_state.attempt_number >= self.max_attempts:
+            return True
+        retry_after = getattr(retry_state.outcome.exception(), "retry_after", None)
+        return retry_after is not None and retry_after > self.max_delay
+
+    def _before_sleep(self, retry_state: RetryCallState) -> None:
+        self.counters["retried"] += 1
+        logger.info(
+            "gemini_retry", attempt=retry_state.attempt_number + 1, max_attempts=self.max_attempts,
+            delay=round(retry_state.next_action.sleep, 3), error=str(retry_state.outcome.exception())[:200],
+        )
+
+    async def _attempt(self, func: Callable[[], Awaitable[T]]) -> T:
+        trial = self.breaker.before_call()
+        if self.bucket is not None:
+            try:
+                waited = await self.bucket.acquire()
+            except BaseException:
+                # Nothing was sent, so a half-open trial is free for the next caller
+                self.breaker.release(trial)
+                raise
+            if waited:
+                self.counters["throttled"] += 1
+                self.counters["throttle_wait_seconds"] += waited
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            self.breaker.release(trial)
+            raise
+        except Exception as e:
+            if _status(e) == 429:
+                self.counters["rate_limited"] += 1
+                if self.bucket is not None:
+                    await self.bucket.throttle()
+            if is_outage(e):
+                self.breaker.record_failure()
+            else:
+                # The upstream answered, so it is up even if the call failed
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        if self.bucket is not None:
+            await self.bucket.recover()
+        return result
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``func`` under rate limiting, retries and the circuit breaker.
+
+        Raises:
+            UpstreamUnavailableError: if the breaker is open or retryable
+                errors persisted through every attempt.
+        """
+        self.counters["calls"] += 1
+        retrying = AsyncRetrying(
+            stop=self._stop,
+            wait=self._wait,
+            retry=retry_if_exception(is_retryable),
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    result = await self._attempt(func)
+        except CircuitOpenError:
+            self.counters["short_circuited"] += 1
+            self.counters["failed"] += 1
+            raise
+        except Exception as e:
+            self.counters["failed"] += 1
+            if is_retryable(e):
+                retry_after = getattr(e, "retry_after", None) or self.breaker.retry_after() or None
+                raise UpstreamUnavailableError(f"Gemini unavailable after retries: {e}", retry_after) from e
+            raise
+        self.counters["succeeded"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rate_limit_per_minute": round(self.bucket.rate * 60, 1) if self.bucket is not None else None,
+            "rate_limit_shared": isinstance(self.bucket, RedisTokenBucket),
+            "rate_limit_redis_errors": getattr(self.bucket, "redis_errors", 0),
+        }
@@ -0,0 +1,160 @@
+import asyncio
+import io
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from tools.uploads import ImageData, data_head, open_data
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:  # deskewing is skipped without OpenCV
+    cv2 = None
+    np = None
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+    "TIFF": "image/tiff",
+    "HEIF": "image/heif",
+}
+
+# Formats Gemini accepts as inline image data without conversion
+GEMINI_IMAGE_FORMATS = ("JPEG", "PNG", "WEBP", "HEIF")
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).lower() == "true"
+
+
+class ImagePreprocessor:
+    """
+    Prepares uploaded images for Gemini Vision.
+
+    The real format is detected from the image data, EXIF orientation is
+    applied, the page is converted to grayscale, small scan skews are
+    corrected and the image is downsampled to ``max_dimension`` pixels on its
+    longest side before being re-encoded (as JPEG, or PNG when that is smaller
+    for a PNG source). Images that cannot be
+    decoded are passed through unchanged with their sniffed MIME type.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        max_dimension: Optional[int] = None,
+        jpeg_quality: Optional[int] = None,
+        grayscale: Optional[bool] = None,
+        deskew: Optional[bool] = None,
+    ) -> None:
+        self.enabled = enabled if enabled is not None else _env_flag("IMAGE_PREPROCESS", "true")
+        self.max_dimension = max_dimension if max_dimension is not None else int(os.environ.get("IMAGE_MAX_DIMENSION", "2048"))
+        self.jpeg_quality = jpeg_quality if jpeg_quality is not None else int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))
+        self.grayscale = grayscale if grayscale is not None else _env_flag("IMAGE_GRAYSCALE", "true")
+        self.deskew = deskew if deskew is not None else _env_flag("IMAGE_DESKEW", "true")
+
+    def signature(self) -> str:
+        """Settings that change the bytes sent to Gemini, used to version cached OCR results."""
+        return (
+            f"pre={self.enabled},dim={self.max_dimension},q={self.jpeg_quality},"
+            f"gray={self.grayscale},deskew={self.deskew and cv2 is not None}"
+        )
+
+    @staticmethod
+    def sniff_mime_type(image_bytes: bytes) -> str:
+        if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+            return "image/png"
+        if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+            return "image/webp"
+        if image_bytes[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1", b"ftypmsf1"):
+            return "image/heif"
+        return "image/jpeg"
+
+    @staticmethod
+    def _skew_angle(image: Image.Image) -> float:
+        """Estimate the skew of the text block in degrees (clockwise positive)."""
+        gray = np.asarray(image.convert("L"))
+        _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        coords = cv2.findNonZero(mask)
+        if coords is None or len(coords) < 100:
+            return 0.0
+        angle = cv2.minAreaRect(coords)[-1]
+        # OpenCV versions disagree on the angle range; fold it into (-45, 45]
+        while angle > 45:
+            angle -= 90
+        while angle <= -45:
+            angle += 90
+        return float(angle)
+
+    def process(self, image_bytes: ImageData) -> Tuple[ImageData, str, Dict[str, Any]]:
+        """
+        Returns the bytes to upload, their MIME type and a dict describing what
+        was done (original format, sizes, dimensions, applied skew correction).
+        When the original is kept, it is returned as given, so a spooled
+        upload stays on disk.
+        """
+        info: Dict[str, Any] = {"original_bytes": len(image_bytes)}
+        try:
+            with open_data(image_bytes) as f:
+                image = Image.open(f)
+                image.load()
+        except Exception as e:
+            mime_type = self.sniff_mime_type(data_head(image_bytes))
+            info.update({"format": None, "mime_type": mime_type, "output_bytes": len(image_bytes), "error": str(e)})
+            return image_bytes, mime_type, info
+
+        fmt = image.format or "JPEG"
+        info.update({"format": fmt, "original_size": list(image.size)})
+        if not self.enabled:
+            if fmt in GEMINI_IMAGE_FORMATS:
+                mime_type = MIME_TYPES[fmt]
+                info.update({"mime_type": mime_type, "output_bytes": len(image_bytes)})
+                return image_bytes, mime_type, info
+
+        original_size = image.size
+        reoriented = image.getexif().get(0x0112, 1) != 1  # EXIF orientation tag
+        image = ImageOps.exif_transpose(image)
+        if self.enabled and self.grayscale:
+            image = image.convert("L")
+        elif image.mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+
+        if self.enabled and self.max_dimension and max(image.size) > self.max_dimension:
+            image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+
+        if self.enabled and self.deskew and cv2 is not None:
+            angle = self._skew_angle(image)
+            if 0.5 <= abs(angle) <= 15:
+                fill = 255 if image.mode == "L" else (255, 255, 255)
+                image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+                info["deskew_degrees"] = round(angle, 2)
+
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=self.jpeg_quality, optimize=True)
+        output, output_mime = out.getvalue(), "image/jpeg"
+        if fmt == "PNG":
+            # Clean lossless scans often stay smaller as PNG than as JPEG
+            out = io.BytesIO()
+            image.save(out, format="PNG", optimize=True)
+            if len(out.getvalue()) < len(output):
+                output, output_mime = out.getvalue(), "image/png"
+        corrected = reoriented or "deskew_degrees" in info
+        if not corrected and fmt in GEMINI_IMAGE_FORMATS and len(output) >= len(image_bytes):
+            # Clean, flat scans can grow once resampling adds antialiased edges; upload cost
+            # is driven by payload size, so keep whichever encoding is smaller. A rotated
+            # or deskewed image is always sent: the original's geometry is what OCR trips on
+            info["kept_original"] = True
+            mime_type = MIME_TYPES[fmt]
+            info.update({"mime_type": mime_type, "output_size": list(original_size), "output_bytes": len(image_bytes)})
+            return image_bytes, mime_type, info
+        info.update({"mime_type": output_mime, "output_size": list(image.size), "output_bytes": len(output)})
+        return output, output_mime, info
+
+    async def aprocess(self, image_bytes: ImageData) -> Tuple[ImageData, str, Dict[str, Any]]:
+        """``process`` in a worker thread so decoding and resizing don't block the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.process, image_bytes)
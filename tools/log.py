@@ -0,0 +1,147 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import structlog
+from structlog.contextvars import bind_contextvars, get_contextvars, reset_contextvars
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    ``QueueHandler`` over a bounded queue that drops records instead of
+    blocking the event loop when the writer thread falls behind.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # structlog has already rendered the message; skip the default
+        # re-formatting and copying of the record
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DebugSampler:
+    """
+    structlog processor keeping debug events for a ``rate`` fraction of
+    correlation ids. Sampling per id rather than per event keeps every debug
+    line of a sampled request, so its trace stays complete.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.threshold = int(max(0.0, min(1.0, rate)) * 2 ** 32)
+
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        if method_name != "debug" or self.threshold >= 2 ** 32:
+            return event_dict
+        correlation_id = event_dict.get("correlation_id", "")
+        if zlib.crc32(correlation_id.encode("utf-8")) < self.threshold:
+            return event_dict
+        raise structlog.DropEvent
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    debug_sample_rate: Optional[float] = None,
+    queue_size: Optional[int] = None,
+    stream: Any = None,
+) -> DroppingQueueHandler:
+    """
+    Route structlog through a bounded in-memory queue drained by a background
+    thread, so logging never does blocking I/O on the event loop.
+
+    ``LOG_LEVEL`` sets the level, ``LOG_FORMAT`` picks ``json`` (default) or
+    ``console`` output, ``LOG_DEBUG_SAMPLE_RATE`` the fraction of requests
+    whose debug events are kept and ``LOG_QUEUE_SIZE`` how many records may
+    wait before new ones are dropped.
+    """
+    global _listener
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.environ.get("LOG_FORMAT", "json")
+    debug_sample_rate = (
+        debug_sample_rate if debug_sample_rate is not None else float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+    )
+    queue_size = queue_size if queue_size is not None else int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+    shutdown_logging()
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(log_queue)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    renderer = structlog.dev.ConsoleRenderer() if fmt == "console" else structlog.processors.JSONRenderer()
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.contextvars.merge_contextvars,
+            DebugSampler(debug_sample_rate),
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso", utc=True),
+            structlog.processors.format_exc_info,
+            renderer,
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+    return handler
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name: Optional[str] = None) -> Any:
+    return structlog.get_logger(name)
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def correlation_scope(correlation_id: Optional[str] = None, **context: Any) -> Iterator[str]:
+    """
+    Bind a correlation id (and any extra ``context``) to every log event
+    emitted in this task and the tasks it spawns. An id already bound by an
+    outer scope is kept unless one is passed explicitly.
+    """
+    correlation_id = correlation_id or get_contextvars().get("correlation_id") or new_correlation_id()
+    tokens = bind_contextvars(correlation_id=correlation_id, **context)
+    try:
+        yield correlation_id
+    finally:
+        reset_contextvars(**tokens)
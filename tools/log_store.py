@@ -0,0 +1,466 @@
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from tools.log import get_logger
+
+logger = get_logger(__name__)
+
+# Processing times are rolled up into log-spaced buckets, each 5% wider than
+# the previous, so percentiles come out within 5% of the exact value
+BUCKET_GROWTH = 1.05
+MIN_PROCESSING_TIME = 0.001
+STATS_QUANTILES = {"p50": 0.5, "p95": 0.95}
+
+
+def time_bucket(seconds: float) -> int:
+    return math.ceil(math.log(max(seconds, MIN_PROCESSING_TIME)) / math.log(BUCKET_GROWTH))
+
+
+def bucket_upper_bound(bucket: int) -> float:
+    return BUCKET_GROWTH ** bucket
+
+
+def quantiles(buckets: Dict[int, int]) -> Dict[str, float]:
+    """Nearest-rank quantiles of a ``{bucket: count}`` histogram, as bucket upper bounds."""
+    total = sum(buckets.values())
+    ordered = sorted(buckets.items())
+    result = {}
+    for name, q in STATS_QUANTILES.items():
+        rank, seen = max(1, math.ceil(q * total)), 0
+        for bucket, count in ordered:
+            seen += count
+            if seen >= rank:
+                result[name] = round(bucket_upper_bound(bucket), 3)
+                break
+    return result
+
+
+def encode_cursor(timestamp: float, entry_id: str) -> str:
+    return f"{timestamp!r}:{entry_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Raises ``ValueError`` for a malformed cursor."""
+    timestamp, sep, entry_id = cursor.partition(":")
+    if not sep or not entry_id:
+        raise ValueError(f"Invalid cursor '{cursor}'.")
+    return float(timestamp), entry_id
+
+
+def rollup(entries: List[Dict[str, Any]]) -> Dict[Tuple[int, str, int], int]:
+    """``(hour, form_type, bucket) -> count`` increments for the completed runs in ``entries``."""
+    counts: Dict[Tuple[int, str, int], int] = {}
+    for entry in entries:
+        if entry["status"] != "completed":
+            continue
+        key = (int(entry["timestamp"] // 3600), entry["form_type"] or "unknown", time_bucket(entry["processing_time"]))
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def to_api(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Stored entry -> API representation with an ISO 8601 timestamp."""
+    return {
+        **entry,
+        "timestamp": datetime.fromtimestamp(entry["timestamp"], timezone.utc).isoformat().replace("+00:00", "Z"),
+    }
+
+
+class SQLiteLogBackend:
+    """
+    Processing logs in a local SQLite database (WAL mode).
+
+    All statements run on one dedicated thread that owns the connection, so
+    the event loop never blocks on disk I/O and writes are serialized.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS processing_logs (
+            id TEXT PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            correlation_id TEXT,
+            filename TEXT,
+            input_type TEXT,
+            mode TEXT,
+            form_type TEXT,
+            department TEXT,
+            status TEXT NOT NULL,
+            fallback INTEGER NOT NULL DEFAULT 0,
+            processing_time REAL NOT NULL,
+            stage_timings TEXT NOT NULL,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_processing_logs_timestamp ON processing_logs (timestamp, id);
+        CREATE INDEX IF NOT EXISTS idx_processing_logs_form_type ON processing_logs (form_type, timestamp, id);
+        CREATE INDEX IF NOT EXISTS idx_processing_logs_department ON processing_logs (department, timestamp, id);
+        CREATE TABLE IF NOT EXISTS processing_log_rollups (
+            hour INTEGER NOT NULL,
+            form_type TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, form_type, bucket)
+        ) WITHOUT ROWID;
+    """
+    COLUMNS = (
+        "id", "timestamp", "correlation_id", "filename", "input_type", "mode", "form_type",
+        "department", "status", "fallback", "processing_time", "stage_timings", "error",
+    )
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-store")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    async def open(self) -> None:
+        await self._run(self._open)
+
+    def _write(self, entries: List[Dict[str, Any]]) -> None:
+        rows = [
+            tuple(json.dumps(e[c]) if c == "stage_timings" else e[c] for c in self.COLUMNS) for e in entries
+        ]
+        with self._conn:  # one transaction per batch
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO processing_logs ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO processing_log_rollups (hour, form_type, bucket, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (hour, form_type, bucket) DO UPDATE SET count = count + excluded.count",
+                [(*key, count) for key, count in rollup(entries).items()],
+            )
+
+    async def write(self, entries: List[Dict[str, Any]]) -> None:
+        await self._run(self._write, entries)
+
+    def _query(self, filters: Dict[str, Any], limit: int, cursor: Optional[Tuple[float, str]]) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        for column in ("form_type", "department", "status"):
+            if filters.get(column) is not None:
+                clauses.append(f"{column} = ?")
+                params.append(filters[column])
+        if filters.get("since") is not None:
+            clauses.append("timestamp >= ?")
+            params.append(filters["since"])
+        if filters.get("until") is not None:
+            clauses.append("timestamp < ?")
+            params.append(filters["until"])
+        if cursor is not None:
+            clauses.append("(timestamp, id) < (?, ?)")
+            params.extend(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn.execute(
+            f"SELECT * FROM processing_logs {where} ORDER BY timestamp DESC, id DESC LIMIT ?", (*params, limit)
+        ).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["fallback"] = bool(entry["fallback"])
+            entry["stage_timings"] = json.loads(entry["stage_timings"])
+            entries.append(entry)
+        return entries
+
+    async def query(self, filters: Dict[str, Any], limit: int, cursor: Optional[Tuple[float, str]]) -> List[Dict[str, Any]]:
+        return await self._run(self._query, filters, limit, cursor)
+
+    def _histograms(self, start_hour: int, end_hour: int) -> Dict[str, Dict[int, int]]:
+        rows = self._conn.execute(
+            "SELECT form_type, bucket, SUM(count) FROM processing_log_rollups "
+            "WHERE hour >= ? AND hour < ? GROUP BY form_type, bucket",
+            (start_hour, end_hour),
+        ).fetchall()
+        histograms: Dict[str, Dict[int, int]] = {}
+        for form_type, bucket, count in rows:
+            histograms.setdefault(form_type, {})[bucket] = count
+        return histograms
+
+    async def histograms(self, start_hour: int, end_hour: int) -> Dict[str, Dict[int, int]]:
+        return await self._run(self._histograms, start_hour, end_hour)
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self) -> None:
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+
+
+class MongoLogBackend:
+    """Processing logs in MongoDB through ``motor``."""
+
+    def __init__(self, url: str, database: Optional[str] = None) -> None:
+        from motor.motor_asyncio import AsyncIOMotorClient  # optional dependency
+
+        self._client = AsyncIOMotorClient(url)
+        db = self._client[database or urlparse(url).path.lstrip("/") or "form_processing"]
+        self.logs = db["processing_logs"]
+        self.rollups = db["processing_log_rollups"]
+
+    async def open(self) -> None:
+        await self.logs.create_index([("timestamp", -1), ("_id", -1)])
+        await self.logs.create_index([("form_type", 1), ("timestamp", -1), ("_id", -1)])
+        await self.logs.create_index([("department", 1), ("timestamp", -1), ("_id", -1)])
+        await self.rollups.create_index([("hour", 1), ("form_type", 1), ("bucket", 1)], unique=True)
+
+    async def write(self, entries: List[Dict[str, Any]]) -> None:
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        docs = [{"_id": e["id"], **{k: v for k, v in e.items() if k != "id"}} for e in entries]
+        try:
+            await self.logs.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate ids from a retried batch are fine; anything else is not
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        updates = [
+            UpdateOne({"hour": hour, "form_type": form_type, "bucket": bucket}, {"$inc": {"count": count}}, upsert=True)
+            for (hour, form_type, bucket), count in rollup(entries).items()
+        ]
+        if updates:
+            await self.rollups.bulk_write(updates, ordered=False)
+
+    async def query(self, filters: Dict[str, Any], limit: int, cursor: Optional[Tuple[float, str]]) -> List[Dict[str, Any]]:
+        spec: Dict[str, Any] = {
+            column: filters[column] for column in ("form_type", "department", "status") if filters.get(column) is not None
+        }
+        window = {}
+        if filters.get("since") is not None:
+            window["$gte"] = filters["since"]
+        if filters.get("until") is not None:
+            window["$lt"] = filters["until"]
+        if window:
+            spec["timestamp"] = window
+        if cursor is not None:
+            timestamp, entry_id = cursor
+            spec["$or"] = [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "_id": {"$lt": entry_id}}]
+        docs = await self.logs.find(spec).sort([("timestamp", -1), ("_id", -1)]).limit(limit).to_list(limit)
+        return [{"id": doc.pop("_id"), **doc} for doc in docs]
+
+    async def histograms(self, start_hour: int, end_hour: int) -> Dict[str, Dict[int, int]]:
+        pipeline = [
+            {"$match": {"hour": {"$gte": start_hour, "$lt": end_hour}}},
+            {"$group": {"_id": {"form_type": "$form_type", "bucket": "$bucket"}, "count": {"$sum": "$count"}}},
+        ]
+        histograms: Dict[str, Dict[int, int]] = {}
+        async for doc in self.rollups.aggregate(pipeline):
+            histograms.setdefault(doc["_id"]["form_type"], {})[doc["_id"]["bucket"]] = doc["count"]
+        return histograms
+
+    async def close(self) -> None:
+        self._client.close()
+
+
+def default_url() -> str:
+    """A SQLite file in ``APP_DATA_DIR`` (by default under the system temp dir, not the working directory)."""
+    data_dir = os.environ.get("APP_DATA_DIR") or os.path.join(tempfile.gettempdir(), "form-processing")
+    return f"sqlite:///{os.path.abspath(os.path.join(data_dir, 'processing_logs.db'))}"
+
+
+def create_backend(url: str) -> Any:
+    """``sqlite:///relative/path.db``, ``sqlite:////absolute/path.db`` or a ``mongodb://`` URL."""
+    scheme = urlparse(url).scheme
+    if scheme == "sqlite":
+        return SQLiteLogBackend(url[len("sqlite:///"):])
+    if scheme in ("mongodb", "mongodb+srv"):
+        return MongoLogBackend(url)
+    raise ValueError(f"Unsupported LOG_STORE_URL scheme '{scheme}'. Expected sqlite or mongodb.")
+
+
+class ProcessingLogStore:
+    """
+    History of orchestrator runs behind ``/api/logs``.
+
+    ``record`` only appends to an in-memory buffer, so it costs nothing on
+    the request path. A background task writes the buffer to the backend in
+    batches of up to ``LOG_STORE_BATCH_SIZE`` entries, at least every
+    ``LOG_STORE_FLUSH_SECONDS``. Once ``LOG_STORE_MAX_PENDING`` entries are
+    waiting, new ones are dropped and counted. A failed batch write is logged
+    and dropped, so a store outage never fails a request.
+
+    Each batch also updates hourly per-form-type histograms of processing
+    time, which answer percentile queries without reading the log rows.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        enabled: Optional[bool] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        self.enabled = enabled if enabled is not None else os.environ.get("LOG_STORE_ENABLED", "true").lower() == "true"
+        self.url = url or os.environ.get("LOG_STORE_URL") or default_url()
+        self.batch_size = batch_size if batch_size is not None else int(os.environ.get("LOG_STORE_BATCH_SIZE", "200"))
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else float(os.environ.get("LOG_STORE_FLUSH_SECONDS", "1.0"))
+        )
+        self.max_pending = (
+            max_pending if max_pending is not None else int(os.environ.get("LOG_STORE_MAX_PENDING", "10000"))
+        )
+        self.backend = create_backend(self.url) if self.enabled else None
+        self._pending: List[Dict[str, Any]] = []
+        # Created on first use so they bind to the running event loop
+        self._opened: Optional[asyncio.Future] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+        self.counters = {"recorded": 0, "written": 0, "dropped": 0, "batches": 0, "write_errors": 0}
+
+    async def _open(self) -> None:
+        await self.backend.open()
+        logger.info("log_store_opened", backend=type(self.backend).__name__, scheme=urlparse(self.url).scheme)
+
+    async def _ready(self) -> None:
+        if self._opened is None:
+            self._opened = asyncio.ensure_future(self._open())
+        try:
+            await asyncio.shield(self._opened)
+        except Exception:
+            self._opened = None  # try again on the next flush
+            raise
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Queue ``entry`` for writing. Must be called from the event loop."""
+        if not self.enabled:
+            return
+        if len(self._pending) >= self.max_pending:
+            self.counters["dropped"] += 1
+            return
+        self._pending.append(entry)
+        self.counters["recorded"] += 1
+        if self._flusher is None:
+            self._wake = asyncio.Event()
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    async def _flush_loop(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything buffered so far."""
+        if not self.enabled:
+            return
+        try:
+            await self._ready()
+        except Exception as e:
+            # Entries stay buffered (up to the pending limit) until the backend is reachable
+            self.counters["write_errors"] += 1
+            logger.warning("log_store_unavailable", error=str(e))
+            return
+        while self._pending:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            try:
+                await self.backend.write(batch)
+                self.counters["written"] += len(batch)
+                self.counters["batches"] += 1
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                self.counters["dropped"] += len(batch)
+                logger.warning("log_store_write_failed", entries=len(batch), error=str(e))
+
+    async def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        form_type: Optional[str] = None,
+        department: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        One page of entries, newest first. Pass the returned ``next_cursor``
+        back to get the following page; it is ``None`` on the last page.
+        Raises ``ValueError`` for a malformed cursor.
+        """
+        position = decode_cursor(cursor) if cursor else None
+        if not self.enabled:
+            return {"items": [], "next_cursor": None}
+        await self.flush()
+        filters = {"form_type": form_type, "department": department, "status": status, "since": since, "until": until}
+        entries = await self.backend.query(filters, limit + 1, position)
+        page = entries[:limit]
+        next_cursor = encode_cursor(page[-1]["timestamp"], page[-1]["id"]) if len(entries) > limit else None
+        return {"items": [to_api(entry) for entry in page], "next_cursor": next_cursor}
+
+    async def processing_time_stats(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Count and p50/p95 processing time (seconds) of completed runs per form
+        type, from the hourly histograms: ``since`` and ``until`` are rounded
+        to whole hours, and percentiles are accurate to within 5%.
+        """
+        if not self.enabled:
+            return {}
+        await self.flush()
+        start_hour = int(since // 3600) if since is not None else 0
+        end_hour = int(until // 3600) + 1 if until is not None else int(time.time() // 3600) + 1
+        histograms = await self.backend.histograms(start_hour, end_hour)
+        return {
+            form_type: {"count": sum(buckets.values()), **quantiles(buckets)}
+            for form_type, buckets in sorted(histograms.items())
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "pending": len(self._pending), **self.counters}
+
+    async def close(self) -> None:
+        """Stop the background writer, write what is still buffered and close the backend."""
+        if self._flusher is not None:
+            self._closing = True
+            self._wake.set()
+            await self._flusher
+            self._flusher = None
+        if self._pending:
+            await self.flush()
+        if self.backend is not None:
+            await self.backend.close()
+
+
+_store: Optional[ProcessingLogStore] = None
+
+
+def get_log_store() -> ProcessingLogStore:
+    """Return the process-wide processing log store, creating it on first use."""
+    global _store
+    if _store is None:
+        _store = ProcessingLogStore()
+    return _store
+
+
+async def close_log_store() -> None:
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
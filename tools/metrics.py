@@ -0,0 +1,158 @@
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Gemini calls take from tens of milliseconds (cache-warm classify) to
+# tens of seconds (multi-page vision), so the buckets span both ends
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 1 KiB to 16 MiB in powers of four
+SIZE_BUCKETS = tuple(float(4 ** i * 1024) for i in range(8))
+
+STAGE_DURATION = Histogram(
+    "form_pipeline_stage_duration_seconds",
+    "Duration of completed pipeline stages.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_FAILURES = Counter("form_pipeline_stage_failures_total", "Pipeline stages that raised.", ["stage"])
+# In-progress gauges are summed over live workers in multiprocess mode
+STAGES_IN_PROGRESS = Gauge(
+    "form_pipeline_stages_in_progress", "Pipeline stages currently running.", ["stage"], multiprocess_mode="livesum"
+)
+PIPELINE_DURATION = Histogram(
+    "form_pipeline_duration_seconds",
+    "End-to-end OrchestratorAgent.run duration.",
+    ["mode", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+PIPELINES_IN_PROGRESS = Gauge(
+    "form_pipelines_in_progress", "OrchestratorAgent.run calls in progress.", multiprocess_mode="livesum"
+)
+PIPELINES_COALESCED = Counter(
+    "form_pipelines_coalesced_total",
+    "OrchestratorAgent.run calls that shared an identical run already in flight instead of starting their own.",
+)
+
+GEMINI_REQUESTS = Counter(
+    "gemini_requests_total",
+    "HTTP requests sent to Gemini, by response status (or timeout/connection_error/cancelled).",
+    ["status"],
+)
+GEMINI_REQUEST_DURATION = Histogram(
+    "gemini_request_duration_seconds",
+    "Duration of individual Gemini HTTP requests, retries counted separately.",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
+GEMINI_IN_PROGRESS = Gauge("gemini_requests_in_progress", "Gemini HTTP requests in flight.", multiprocess_mode="livesum")
+GEMINI_REQUEST_BYTES = Histogram("gemini_request_bytes", "Size of Gemini request bodies.", buckets=SIZE_BUCKETS)
+GEMINI_RESPONSE_BYTES = Histogram("gemini_response_bytes", "Size of Gemini response bodies.", buckets=SIZE_BUCKETS)
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Tokens reported in Gemini usageMetadata.", ["kind"])
+STAGE_TOKENS = Counter(
+    "form_pipeline_stage_tokens_total", "Gemini tokens used by pipeline stages (cache hits use none).", ["stage", "kind"]
+)
+
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "API requests in progress.", ["method"], multiprocess_mode="livesum"
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "API request duration until the response starts (streaming bodies excluded).",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class StatsCollector:
+    """
+    Exposes an existing ``stats()``-style dict as Prometheus metrics at scrape
+    time, so components keep their plain counters and nothing is counted twice.
+
+    Numeric values become ``<prefix>_<key>`` gauges, or counters for keys in
+    ``counters``. Keys in ``labelled`` hold ``{label_value: {key: number}}``
+    dicts and become ``<prefix>_<key>_<subkey>`` metrics labelled with the
+    given label name (e.g. per-stage cache hits).
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        source: Callable[[], Dict[str, Any]],
+        counters: Iterable[str] = (),
+        labelled: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.prefix = prefix
+        self.source = source
+        self.counters = set(counters)
+        self.labelled = labelled or {}
+
+    def describe(self) -> Iterator[Any]:
+        # Nothing up front, so registering does not call ``source`` early
+        return iter(())
+
+    def _family(self, name: str, key: str, labels: Iterable[str] = ()):
+        documentation = f"{key.replace('_', ' ').capitalize()} ({self.prefix})."
+        if key in self.counters:
+            return CounterMetricFamily(name, documentation, labels=list(labels))
+        return GaugeMetricFamily(name, documentation, labels=list(labels))
+
+    def collect(self) -> Iterator[Any]:
+        stats = self.source()
+        for key, value in stats.items():
+            if key in self.labelled:
+                families: Dict[str, Any] = {}
+                for label_value, values in value.items():
+                    for subkey, number in values.items():
+                        name = f"{self.prefix}_{key}_{subkey}"
+                        if name not in families:
+                            families[name] = self._family(name, subkey, [self.labelled[key]])
+                        families[name].add_metric([label_value], number)
+                yield from families.values()
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                family = self._family(f"{self.prefix}_{key}", key)
+                family.add_metric([], value)
+                yield family
+
+
+def register_stats(
+    prefix: str,
+    source: Callable[[], Dict[str, Any]],
+    counters: Iterable[str] = (),
+    labelled: Optional[Dict[str, str]] = None,
+) -> StatsCollector:
+    """Register a ``StatsCollector`` with the default registry."""
+    collector = StatsCollector(prefix, source, counters, labelled)
+    REGISTRY.register(collector)
+    _stats_collectors.append(collector)
+    return collector
+
+
+_stats_collectors: List[StatsCollector] = []
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    The registry to expose on ``/metrics``. With several workers and
+    ``PROMETHEUS_MULTIPROC_DIR`` set, the metrics above are read from every
+    worker's files and aggregated; the ``register_stats`` components are still
+    those of the worker answering the scrape.
+    """
+    if not multiprocess_enabled():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _stats_collectors:
+        registry.register(collector)
+    return registry
+
+
+def mark_worker_dead() -> None:
+    """Drop this worker's live gauges from the multiprocess files on shutdown."""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,214 @@
+from google.adk.tools import BaseTool as Tool
+import asyncio
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+from tools.vision_tools import VisionTools
+from tools.governance import UpstreamUnavailableError
+from tools.log import get_logger
+from tools.uploads import ImageData, open_data
+
+try:
+    import pytesseract
+except ImportError:  # local OCR is unavailable without pytesseract
+    pytesseract = None
+
+logger = get_logger(__name__)
+
+OCR_POLICIES = ("auto", "gemini", "tesseract")
+
+
+class OCRResult:
+    """Text recognized from one page and which backend produced it."""
+
+    def __init__(self, text: str, backend: str, confidence: Optional[float] = None, escalated: bool = False) -> None:
+        self.text = text
+        self.backend = backend
+        self.confidence = confidence
+        self.escalated = escalated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "text": self.text,
+            "backend": self.backend,
+            "confidence": self.confidence,
+            "escalated": self.escalated,
+        }
+
+
+class OCRBackend:
+    """Interface for OCR engines used by ``OCRTool``."""
+
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    async def recognize(self, image_bytes: ImageData, mime_type: str) -> OCRResult:
+        raise NotImplementedError
+
+    def signature(self) -> str:
+        """Settings that change this backend's output, used to version cached OCR results."""
+        return self.name
+
+
+class GeminiVisionBackend(OCRBackend):
+    name = "gemini"
+
+    def __init__(self, vision_tool: VisionTools) -> None:
+        self.vision_tool = vision_tool
+
+    async def recognize(self, image_bytes: ImageData, mime_type: str) -> OCRResult:
+        text = await self.vision_tool.call(image_bytes=image_bytes, mime_type=mime_type)
+        return OCRResult(text, self.name)
+
+    def signature(self) -> str:
+        return f"gemini:{self.vision_tool.PROMPT_TEMPLATE}"
+
+
+def _run_tesseract(image_bytes: ImageData, lang: str) -> Dict[str, Any]:
+    """
+    Runs in a worker process: recognize text and its mean word confidence
+    (0-1). A spooled upload arrives as its path and is read from disk here.
+    """
+    from PIL import Image
+
+    with open_data(image_bytes) as f:
+        image = Image.open(f)
+        data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    lines: Dict[tuple, list] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if not word.strip() or conf < 0:
+            continue
+        confidences.append(conf)
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    confidence = sum(confidences) / len(confidences) / 100 if confidences else 0.0
+    return {"text": text, "confidence": round(confidence, 4), "words": len(confidences)}
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_ocr_process_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool for local OCR, creating it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        workers = int(os.environ.get("OCR_PROCESS_WORKERS", "0")) or os.cpu_count() or 1
+        _process_pool = ProcessPoolExecutor(max_workers=workers)
+    return _process_pool
+
+
+def shutdown_ocr_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+class TesseractBackend(OCRBackend):
+    name = "tesseract"
+
+    def __init__(self, lang: Optional[str] = None, min_words: Optional[int] = None) -> None:
+        self.lang = lang or os.environ.get("TESSERACT_LANG", "eng")
+        self.min_words = min_words if min_words is not None else int(os.environ.get("OCR_MIN_WORDS", "5"))
+        self._available: Optional[bool] = None
+
+    def available(self) -> bool:
+        if self._available is None:
+            if pytesseract is None:
+                self._available = False
+            else:
+                try:
+                    pytesseract.get_tesseract_version()
+                    self._available = True
+                except Exception as e:
+                    logger.warning("tesseract_unavailable", error=str(e))
+                    self._available = False
+        return self._available
+
+    async def recognize(self, image_bytes: ImageData, mime_type: str) -> OCRResult:
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(get_ocr_process_pool(), _run_tesseract, image_bytes, self.lang)
+        # Too few words means the page is mostly handwriting, photos or noise
+        confidence = data["confidence"] if data["words"] >= self.min_words else 0.0
+        return OCRResult(data["text"], self.name, confidence)
+
+    def signature(self) -> str:
+        return f"tesseract:{self.lang}:{self.min_words}"
+
+
+class OCRTool(Tool):
+    """
+    Extracts text from a page image using a pluggable OCR backend.
+
+    With the ``auto`` policy pages are read locally with Tesseract first and
+    only escalated to Gemini Vision when local confidence is below
+    ``OCR_MIN_CONFIDENCE`` (or Tesseract is unavailable). ``gemini`` and
+    ``tesseract`` force a single backend.
+    """
+
+    def __init__(self, policy: Optional[str] = None, min_confidence: Optional[float] = None) -> None:
+        super().__init__(
+            name="ocr_router_tool",
+            description="Extracts text from an image with local OCR, escalating to Google Gemini Vision when needed.",
+        )
+        self.policy = policy or os.environ.get("OCR_BACKEND", "auto")
+        if self.policy not in OCR_POLICIES:
+            raise ValueError(f"Unknown OCR_BACKEND '{self.policy}'. Expected one of {OCR_POLICIES}.")
+        self.min_confidence = (
+            min_confidence if min_confidence is not None else float(os.environ.get("OCR_MIN_CONFIDENCE", "0.8"))
+        )
+        self.vision_tool = VisionTools()
+        self.preprocessor = self.vision_tool.preprocessor
+        self.gemini = GeminiVisionBackend(self.vision_tool)
+        self.local = TesseractBackend()
+        logger.debug("tool_initialized", tool=self.name, policy=self.policy)
+
+    def signature(self) -> str:
+        return "|".join([
+            self.policy,
+            str(self.min_confidence),
+            self.gemini.signature(),
+            self.local.signature(),
+            self.preprocessor.signature(),
+        ])
+
+    async def call(self, image_bytes: ImageData) -> Dict[str, Any]:
+        """
+        Returns a dict with the page ``text``, the ``backend`` that produced
+        it, the local ``confidence`` (if local OCR ran) and whether the page was
+        ``escalated`` to Gemini.
+        """
+        try:
+            image_bytes, mime_type, info = await self.preprocessor.aprocess(image_bytes)
+            logger.debug("image_preprocessed", **info)
+
+            if self.policy == "gemini" or (self.policy == "auto" and not self.local.available()):
+                return (await self.gemini.recognize(image_bytes, mime_type)).to_dict()
+
+            local = await self.local.recognize(image_bytes, mime_type)
+            if self.policy == "tesseract" or local.confidence >= self.min_confidence:
+                logger.debug("local_ocr_accepted", confidence=local.confidence)
+                return local.to_dict()
+
+            logger.info("local_ocr_escalated", confidence=local.confidence, min_confidence=self.min_confidence)
+            try:
+                result = await self.gemini.recognize(image_bytes, mime_type)
+            except UpstreamUnavailableError as e:
+                # A low-confidence local read beats failing the page outright
+                logger.warning("vision_unavailable_using_local_ocr", error=str(e), confidence=local.confidence)
+                return local.to_dict()
+            result.confidence = local.confidence
+            result.escalated = True
+            return result.to_dict()
+        except UpstreamUnavailableError:
+            raise
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            logger.exception("tool_call_failed", tool=self.name)
+            raise Exception(f"Error in OCRTool.call: {str(e)}\n{error_trace}")
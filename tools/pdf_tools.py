@@ -0,0 +1,83 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from tools.uploads import ImageData, SpooledUpload, data_head
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # PDF uploads are rejected without pypdfium2
+    pdfium = None
+
+T = TypeVar("T")
+
+
+def is_pdf(data: ImageData) -> bool:
+    # The header may be preceded by a little junk, as tolerated by most readers
+    return b"%PDF-" in data_head(data)[:1024]
+
+
+# PDFium is not thread-safe, even across separate documents, so every call
+# into it (open, render, close) for every document runs on this one thread
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_pdfium_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdfium")
+    return _executor
+
+
+async def _run_pdfium(func: Callable[..., T], *args: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(get_pdfium_executor(), func, *args)
+
+
+class PdfDocument:
+    """
+    A PDF whose pages are rasterized one at a time, on demand.
+
+    Open one with ``await PdfDocument.open(data)``. All PDFium work runs on
+    the process-wide PDFium thread, so the event loop never blocks on it;
+    only the pages currently being rendered or OCR'd are ever held in memory.
+    """
+
+    def __init__(self, pdf: Any, dpi: Optional[int] = None, jpeg_quality: Optional[int] = None) -> None:
+        self.dpi = dpi if dpi is not None else int(os.environ.get("PDF_RENDER_DPI", "200"))
+        self.jpeg_quality = jpeg_quality if jpeg_quality is not None else int(os.environ.get("PDF_JPEG_QUALITY", "90"))
+        self._pdf = pdf
+        self.page_count = len(pdf)
+
+    @classmethod
+    async def open(
+        cls, data: ImageData, dpi: Optional[int] = None, jpeg_quality: Optional[int] = None
+    ) -> "PdfDocument":
+        if pdfium is None:
+            raise ValueError("PDF support requires the pypdfium2 package.")
+        # PDFium reads a spooled upload from disk as pages need it
+        pdf = await _run_pdfium(pdfium.PdfDocument, data.path if isinstance(data, SpooledUpload) else data)
+        return cls(pdf, dpi, jpeg_quality)
+
+    def render_page(self, index: int) -> bytes:
+        """Rasterize one page to grayscale JPEG bytes. Call on the PDFium thread."""
+        page = self._pdf[index]
+        try:
+            bitmap = page.render(scale=self.dpi / 72, grayscale=True)
+            try:
+                out = io.BytesIO()
+                bitmap.to_pil().save(out, format="JPEG", quality=self.jpeg_quality)
+                return out.getvalue()
+            finally:
+                # The image shares the bitmap's buffer; free both here rather than on whichever thread collects them
+                bitmap.close()
+        finally:
+            page.close()
+
+    async def arender_page(self, index: int) -> bytes:
+        return await _run_pdfium(self.render_page, index)
+
+    def close(self) -> None:
+        # Queue the close behind any render still running on the PDFium thread
+        get_pdfium_executor().submit(self._pdf.close)
@@ -0,0 +1,240 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+# Rough size of a Gemini token for English/Latin form text; used to budget
+# prompts before sending them (the exact counts come back in usageMetadata)
+CHARS_PER_TOKEN = 4
+
+# Token budget for the document text in each stage's prompt; override with
+# PROMPT_BUDGET_<STAGE> (0 sends the text untrimmed). Only classification and
+# routing are trimmed by default: an excerpt would silently drop field values
+# from extraction, e.g. from a multi-page PDF chunk
+DEFAULT_BUDGETS: Dict[str, int] = {
+    "classify": 96,
+    "route": 64,
+    "ner": 0,
+    "fused": 0,
+}
+
+# Fields asked for per form type by the NER prompt
+FIELD_SCHEMAS: Dict[str, List[str]] = {
+    "FIR": [
+        "complainant_name", "father_name", "age", "address", "police_station", "district",
+        "date_of_occurrence", "time_of_occurrence", "offence", "property_involved", "accused", "details",
+    ],
+    "Pension": [
+        "applicant_name", "date_of_birth", "age", "aadhaar_number", "bank_name", "account_number",
+        "ifsc", "annual_income", "pension_scheme", "addressed_to", "address",
+    ],
+    "Ration Card": [
+        "head_of_family", "address", "family_members", "family_size", "category", "gas_connection",
+        "previous_ration_card",
+    ],
+    "Income Certificate": [
+        "applicant_name", "father_name", "occupation", "address", "annual_income", "purpose",
+        "enclosures", "addressed_to",
+    ],
+    "Birth Certificate": [
+        "child_name", "sex", "date_of_birth", "place_of_birth", "father_name", "mother_name",
+        "address", "informant",
+    ],
+    "Death Certificate": [
+        "deceased_name", "age", "sex", "date_of_death", "place_of_death", "cause_of_death",
+        "address", "informant", "informant_relation", "informant_phone",
+    ],
+    "Marriage Certificate": [
+        "groom_name", "groom_age", "bride_name", "bride_age", "date_of_marriage", "place_of_marriage",
+        "address", "witnesses",
+    ],
+    "General Complaint": [
+        "complainant_name", "address", "phone", "addressed_to", "subject", "location", "complaint_details",
+    ],
+}
+# Used when the form type is not known yet
+GENERIC_FIELDS = ["name", "address", "date", "phone", "id_number", "amount", "addressed_to", "subject", "details"]
+
+# Leading lines kept first in an excerpt: they carry the form title and addressee
+HEADER_LINES = 4
+MAX_LINE_CHARS = 240
+# "Name of applicant: ...", "Age - 70", "IFSC = SBIN..."
+_LABEL_LINE = re.compile(r"^\s*[A-Za-z][A-Za-z .,'/()&]{1,48}\s*[:=\-]\s*\S")
+# Vocabulary that tells the form types and their departments apart
+_KEY_TERMS = re.compile(
+    r"\b(application|certificate|report|complaint|grievance|subject|police|station|offen[cs]e|theft|"
+    r"pension|ration|income|birth|death|deceased|marriage|bride|groom|child|family|municipal|"
+    r"department|officer|commissioner|registrar|tehsildar|scheme|section)\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[A-Za-z0-9]{2,}")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _is_noise(line: str) -> bool:
+    """OCR debris: rules, stamps and speckle read as punctuation or single letters."""
+    letters = sum(ch.isalnum() for ch in line)
+    return letters < 0.5 * len(line) or not _WORD.search(line)
+
+
+def excerpt(text: str, budget: int) -> str:
+    """
+    Trim ``text`` to about ``budget`` tokens. Noise lines are always dropped
+    and runs of whitespace collapsed; if that is not enough, the lines that
+    carry the most signal are kept: the header region first, then lines with
+    form vocabulary or a ``label: value`` shape, then the rest, with long
+    lines cut. Kept lines stay in document order. A budget of 0 returns
+    ``text`` unchanged.
+    """
+    if budget <= 0:
+        return text
+    limit = budget * CHARS_PER_TOKEN
+    lines = []
+    for raw in text.splitlines():
+        line = " ".join(raw.split())
+        if line and not _is_noise(line):
+            lines.append(line)
+    if sum(len(line) + 1 for line in lines) <= limit:
+        return "\n".join(lines)
+    lines = [line[:MAX_LINE_CHARS] for line in lines]
+
+    def score(index: int) -> float:
+        line = lines[index]
+        value = len(_KEY_TERMS.findall(line)) + (1.5 if _LABEL_LINE.match(line) else 0)
+        if index < HEADER_LINES:
+            value += 4 - index * 0.5
+        return value
+
+    kept, used = set(), 0
+    for index in sorted(range(len(lines)), key=lambda i: (-score(i), i)):
+        # +1 for the newline joining it to the next line
+        cost = len(lines[index]) + 1
+        if used + cost > limit:
+            if not kept:
+                lines[index] = lines[index][:limit]
+                kept.add(index)
+            continue
+        kept.add(index)
+        used += cost
+    return "\n".join(lines[i] for i in sorted(kept))
+
+
+def stage_budget(name: str) -> int:
+    return int(os.environ.get(f"PROMPT_BUDGET_{name.upper()}", DEFAULT_BUDGETS.get(name, 0)))
+
+
+class PromptTemplate:
+    """
+    A named, versioned prompt. ``{text}`` is filled with the document text,
+    which is cut down to the stage's token budget with ``excerpt`` when
+    ``trim`` is set; other placeholders come from ``render``'s keyword
+    arguments.
+    """
+
+    def __init__(self, name: str, version: str, template: str, trim: bool = True) -> None:
+        self.name = name
+        self.version = version
+        self.template = template
+        self.trim = trim
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@{self.version}"
+
+    @property
+    def budget(self) -> int:
+        return stage_budget(self.name) if self.trim else 0
+
+    def fit(self, text: str) -> str:
+        return excerpt(text, self.budget)
+
+    def render(self, text: str, **values: str) -> str:
+        return self.template.format(text=self.fit(text), **values)
+
+    def signature(self) -> str:
+        """Everything that changes the rendered prompt, used to version cached results."""
+        return f"{self.id}:{self.budget}:{self.template}"
+
+
+_PROMPTS: Dict[str, Dict[str, PromptTemplate]] = {}
+
+
+def register_prompt(prompt: PromptTemplate) -> PromptTemplate:
+    _PROMPTS.setdefault(prompt.name, {})[prompt.version] = prompt
+    return prompt
+
+
+def prompt_versions(name: str) -> List[str]:
+    # "v10" sorts after "v9"
+    return sorted(_PROMPTS[name], key=lambda v: (len(v), v))
+
+
+def get_prompt(name: str, version: Optional[str] = None) -> PromptTemplate:
+    """
+    Return the ``name`` prompt at ``version``, else the one selected by
+    ``PROMPT_VERSION_<NAME>``, else the latest registered version.
+    """
+    versions = _PROMPTS[name]
+    latest = prompt_versions(name)[-1]
+    version = version or os.environ.get(f"PROMPT_VERSION_{name.upper()}") or latest
+    if version not in versions:
+        raise ValueError(f"Unknown version '{version}' of prompt '{name}'. Expected one of {sorted(versions)}.")
+    return versions[version]
+
+
+def field_schema(form_type: Optional[str]) -> List[str]:
+    return FIELD_SCHEMAS.get(form_type or "", GENERIC_FIELDS)
+
+
+_FUSED_TEMPLATE = (
+    "You process government form submissions. Read the document text below and respond with "
+    "only a JSON object (no markdown) with exactly these keys: "
+    "\"form_type\": one of {form_types}; "
+    "\"fields\": an object mapping each field found in the form (names, dates, addresses, "
+    "identifiers, amounts, etc.) to its value; "
+    "\"department\": the most appropriate government department to route this form to. "
+    "Text: {text}"
+)
+
+# v1: the original prompts, sending the full text
+register_prompt(PromptTemplate(
+    "ner", "v1",
+    "Extract the following fields from the text below. Return the output as a JSON object. "
+    "If a field is not present, use a default value. Text: {text}",
+    trim=False,
+))
+register_prompt(PromptTemplate(
+    "classify", "v1",
+    "Classify the following document text into one of the following categories: {categories}. Text: {text}",
+    trim=False,
+))
+register_prompt(PromptTemplate(
+    "route", "v1",
+    "Given the form type '{form_type}' and the following text, suggest the most appropriate "
+    "government department to route this to. Text: {text}",
+    trim=False,
+))
+register_prompt(PromptTemplate("fused", "v1", _FUSED_TEMPLATE, trim=False))
+
+# v2: budgeted excerpts for classification and routing, a field schema for NER
+register_prompt(PromptTemplate(
+    "ner", "v2",
+    "Extract these fields from the {form_type} text below: {fields}. Respond with only a JSON object "
+    "using these keys, with null for a field that is not present, plus a snake_case key for any other "
+    "labelled identifier, date or amount.\nText:\n{text}",
+))
+register_prompt(PromptTemplate(
+    "classify", "v2",
+    "Classify this government form into exactly one of: {categories}. Answer with the category name only.\n"
+    "Excerpt:\n{text}",
+))
+register_prompt(PromptTemplate(
+    "route", "v2",
+    "Given the form type '{form_type}' and the excerpt below, name the government department this form "
+    "should be routed to. Answer with the department name only.\nExcerpt:\n{text}",
+))
+# Same wording; the text is trimmed only if PROMPT_BUDGET_FUSED is set
+register_prompt(PromptTemplate("fused", "v2", _FUSED_TEMPLATE))
@@ -0,0 +1,44 @@
+import os
+from typing import Any, Optional
+from urllib.parse import urlparse
+from tools.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def worker_count() -> int:
+    """Number of server processes sharing this host's budgets (uvicorn's ``WEB_CONCURRENCY``)."""
+    return max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+
+
+def shared_redis_url() -> str:
+    return os.environ.get("REDIS_URL", "")
+
+
+_redis: Optional[Any] = None
+
+
+def get_shared_redis() -> Optional[Any]:
+    """
+    Return the process-wide Redis client used for state shared between
+    workers (rate-limit budget, job queue), or ``None`` when ``REDIS_URL`` is
+    unset or the redis package is missing. The client connects lazily.
+    """
+    global _redis
+    url = shared_redis_url()
+    if _redis is None and url:
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            logger.warning("shared_state_unavailable", reason="redis package not installed")
+            return None
+        _redis = aioredis.from_url(url)
+        logger.info("shared_state_redis_enabled", host=urlparse(url).hostname)
+    return _redis
+
+
+async def close_shared_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
@@ -1,170 +1,262 @@
 from google.adk.tools import BaseTool as Tool
-import aiohttp
-import os
 import json
 import traceback
 from typing import Dict, Any, Optional
+from tools.gemini_client import GeminiClient, get_gemini_client
+from tools.governance import UpstreamUnavailableError
+from tools.log import get_logger
+from tools.prompts import PromptTemplate, estimate_tokens, field_schema, get_prompt
 
-class NERTool(Tool):
+logger = get_logger(__name__)
+
+FORM_TYPES = [
+    "FIR",
+    "Pension",
+    "Ration Card",
+    "Income Certificate",
+    "Birth Certificate",
+    "Death Certificate",
+    "Marriage Certificate",
+    "General Complaint",
+]
+
+class FusedParseError(ValueError):
+    """Raised when a fused extraction response does not match the expected schema."""
+
+class PromptedTool(Tool):
+    """A Gemini text tool whose prompt comes from the registry in ``tools.prompts``."""
+
+    PROMPT = ""
+
+    @property
+    def prompt(self) -> PromptTemplate:
+        """The active version of this tool's prompt (see ``PROMPT_VERSION_<NAME>``)."""
+        return get_prompt(self.PROMPT)
+
+    def signature(self) -> str:
+        """Prompt id, budget and wording, used to version cached results."""
+        return self.prompt.signature()
+
+    def log_prompt(self, template: PromptTemplate, prompt: str) -> None:
+        logger.debug(
+            "prompt_built", tool=self.name, prompt=template.id,
+            prompt_length=len(prompt), prompt_tokens_estimate=estimate_tokens(prompt),
+        )
+
+class NERTool(PromptedTool):
     def __init__(self) -> None:
         super().__init__(
             name="gemini_ner_tool",
             description="Extracts structured entities from text using Google Gemini.",
         )
-        print(f"NERTool initialized with name: {self.name}")
+        logger.debug("tool_initialized", tool=self.name)
+
+    PROMPT = "ner"
 
     async def call(self, text: str, form_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract entities from ``text``. ``form_type``, when known, picks the
+        field schema the prompt asks for; otherwise a generic one is used.
+        """
         try:
-            print(f"NERTool.call started with text of length: {len(text)}")
-            
-            GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-            if not GEMINI_API_KEY:
-                raise ValueError("GEMINI_API_KEY environment variable not set.")            
-            print("GEMINI_API_KEY found in environment variables")
-            prompt = f"Extract the following fields from the text below. Return the output as a JSON object. If a field is not present, use a default value. Text: {text}"
-            print(f"Created prompt of length: {len(prompt)}")
-            url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-            
+            logger.debug("tool_call_started", tool=self.name, text_length=len(text), form_type=form_type)
+
+            template = self.prompt
+            prompt = template.render(text, form_type=form_type or "form", fields=", ".join(field_schema(form_type)))
+            self.log_prompt(template, prompt)
+
             payload = {
                 "contents": [{"parts": [{"text": prompt}]}],
             }
-            print("Prepared request payload for Gemini API")
-
-            print(f"Making API request to Gemini at: {url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    print(f"Received response with status: {response.status}")
-                    if response.status == 200:
-                        resp_json = await response.json()
-                        print("Successfully parsed JSON response")
-                        
-                        # The response may be plain text, so we need to parse it into JSON
-                        response_text = resp_json['candidates'][0]['content']['parts'][0]['text']
-                        print(f"Raw response text: {response_text[:100]}...")
-                        
-                        try:
-                            # Try to parse the response as JSON
-                            result = json.loads(response_text)
-                        except json.JSONDecodeError:
-                            # If it's not valid JSON, try to extract JSON-like content
-                            print("Response was not valid JSON, attempting to extract structured data")
-                            # Extract anything that looks like key-value pairs
-                            import re
-                            result = {}
-                            lines = response_text.split('\n')
-                            for line in lines:
-                                # Look for "key: value" or "key = value" patterns
-                                match = re.match(r'^\s*["\']?([^"\']+)["\']?\s*[:=]\s*["\']?([^"\']+)["\']?\s*$', line)
-                                if match:
-                                    key, value = match.groups()
-                                    result[key.strip()] = value.strip()
-                            
-                            # If we couldn't extract structured data, create a basic structure
-                            if not result:
-                                result = {"extracted_text": response_text}
-                        
-                        print(f"Extracted entities: {result}")
-                        return result
-                    else:
-                        error_text = await response.text()
-                        print(f"API error: {response.status} - {error_text}")
-                        raise Exception(f"Gemini API error: {response.status} - {error_text}")
+
+            client = get_gemini_client()
+            resp_json = await client.generate_content(payload)
+
+            # The response may be plain text, so we need to parse it into JSON
+            response_text = GeminiClient.response_text(resp_json)
+            logger.debug("response_received", tool=self.name, response_length=len(response_text))
+
+            try:
+                # Try to parse the response as JSON
+                result = json.loads(response_text)
+            except json.JSONDecodeError:
+                # If it's not valid JSON, try to extract JSON-like content
+                logger.info("response_not_json", tool=self.name)
+                # Extract anything that looks like key-value pairs
+                import re
+                result = {}
+                lines = response_text.split('\n')
+                for line in lines:
+                    # Look for "key: value" or "key = value" patterns
+                    match = re.match(r'^\s*["\']?([^"\']+)["\']?\s*[:=]\s*["\']?([^"\']+)["\']?\s*$', line)
+                    if match:
+                        key, value = match.groups()
+                        result[key.strip()] = value.strip()
+
+                # If we couldn't extract structured data, create a basic structure
+                if not result:
+                    result = {"extracted_text": response_text}
+
+            if isinstance(result, dict):
+                # Schema fields the form does not have come back as null
+                result = {key: value for key, value in result.items() if value is not None}
+
+            logger.debug("tool_call_completed", tool=self.name, fields=sorted(result))
+            return result
+        except UpstreamUnavailableError:
+            # Surfaced to the API as 503 with Retry-After instead of a 500
+            raise
         except Exception as e:
             error_trace = traceback.format_exc()
-            print(f"Error in NERTool.call: {str(e)}")
-            print(f"Traceback: {error_trace}")
+            logger.exception("tool_call_failed", tool=self.name)
             raise Exception(f"Error in NERTool.call: {str(e)}\n{error_trace}")
 
-class ClassifierTool(Tool):
+class ClassifierTool(PromptedTool):
     def __init__(self) -> None:
         super().__init__(
             name="gemini_classify_tool",
             description="Determines the type of form or document from text.",
         )
-        print(f"ClassifierTool initialized with name: {self.name}")
+        logger.debug("tool_initialized", tool=self.name)
+
+    PROMPT = "classify"
 
     async def call(self, text: str) -> str:
         try:
-            print(f"ClassifierTool.call started with text of length: {len(text)}")
-            
-            GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-            if not GEMINI_API_KEY:
-                raise ValueError("GEMINI_API_KEY environment variable not set.")
-            print("GEMINI_API_KEY found in environment variables")
-            
-            prompt = f"Classify the following document text into one of the following categories: FIR, Pension, Ration Card, Income Certificate, Birth Certificate, Death Certificate, Marriage Certificate, General Complaint. Text: {text}"
-            print(f"Created prompt of length: {len(prompt)}")
-            
-            url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-            
+            logger.debug("tool_call_started", tool=self.name, text_length=len(text))
+
+            template = self.prompt
+            prompt = template.render(text, categories=", ".join(FORM_TYPES))
+            self.log_prompt(template, prompt)
+
             payload = {
                 "contents": [{"parts": [{"text": prompt}]}],
             }
-            print("Prepared request payload for Gemini API")
-
-            print(f"Making API request to Gemini at: {url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    print(f"Received response with status: {response.status}")
-                    if response.status == 200:
-                        resp_json = await response.json()
-                        print("Successfully parsed JSON response")
-                        form_type = resp_json['candidates'][0]['content']['parts'][0]['text'].strip()
-                        print(f"Classified form type: {form_type}")
-                        return form_type
-                    else:
-                        error_text = await response.text()
-                        print(f"API error: {response.status} - {error_text}")
-                        raise Exception(f"Gemini API error: {response.status} - {error_text}")
+
+            client = get_gemini_client()
+            resp_json = await client.generate_content(payload)
+            form_type = GeminiClient.response_text(resp_json).strip()
+            logger.debug("tool_call_completed", tool=self.name, form_type=form_type)
+            return form_type
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             error_trace = traceback.format_exc()
-            print(f"Error in ClassifierTool.call: {str(e)}")
-            print(f"Traceback: {error_trace}")
+            logger.exception("tool_call_failed", tool=self.name)
             raise Exception(f"Error in ClassifierTool.call: {str(e)}\n{error_trace}")
 
-class RouterTool(Tool):
+class RouterTool(PromptedTool):
     def __init__(self) -> None:
         super().__init__(
             name="gemini_routing_tool",
             description="Suggests the correct government department for routing.",
         )
-        print(f"RouterTool initialized with name: {self.name}")
+        logger.debug("tool_initialized", tool=self.name)
+
+    PROMPT = "route"
 
     async def call(self, text: str, form_type: str) -> str:
         try:
-            print(f"RouterTool.call started with text of length: {len(text)} and form_type: {form_type}")
-            
-            GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-            if not GEMINI_API_KEY:
-                raise ValueError("GEMINI_API_KEY environment variable not set.")
-            print("GEMINI_API_KEY found in environment variables")
-            
-            prompt = f"Given the form type '{form_type}' and the following text, suggest the most appropriate government department to route this to. Text: {text}"
-            print(f"Created prompt of length: {len(prompt)}")
-            
-            url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-            
+            logger.debug("tool_call_started", tool=self.name, text_length=len(text), form_type=form_type)
+
+            template = self.prompt
+            prompt = template.render(text, form_type=form_type)
+            self.log_prompt(template, prompt)
+
             payload = {
                 "contents": [{"parts": [{"text": prompt}]}],
             }
-            print("Prepared request payload for Gemini API")
-
-            print(f"Making API request to Gemini at: {url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    print(f"Received response with status: {response.status}")
-                    if response.status == 200:
-                        resp_json = await response.json()
-                        print("Successfully parsed JSON response")
-                        suggested_route = resp_json['candidates'][0]['content']['parts'][0]['text'].strip()
-                        print(f"Suggested route: {suggested_route}")
-                        return suggested_route
-                    else:
-                        error_text = await response.text()
-                        print(f"API error: {response.status} - {error_text}")
-                        raise Exception(f"Gemini API error: {response.status} - {error_text}")
+
+            client = get_gemini_client()
+            resp_json = await client.generate_content(payload)
+            suggested_route = GeminiClient.response_text(resp_json).strip()
+            logger.debug("tool_call_completed", tool=self.name, form_type=form_type, department=suggested_route)
+            return suggested_route
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             error_trace = traceback.format_exc()
-            print(f"Error in RouterTool.call: {str(e)}")
-            print(f"Traceback: {error_trace}")
+            logger.exception("tool_call_failed", tool=self.name)
             raise Exception(f"Error in RouterTool.call: {str(e)}\n{error_trace}")
+
+class FusedExtractionTool(PromptedTool):
+    """
+    Single-request alternative to NERTool + ClassifierTool + RouterTool.
+
+    The document text is sent once and Gemini is asked for one JSON object
+    holding the form type, the extracted fields and the suggested department.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(
+            name="gemini_fused_extraction_tool",
+            description="Classifies a form, extracts its fields and suggests a department in one Gemini request.",
+        )
+        logger.debug("tool_initialized", tool=self.name)
+
+    PROMPT = "fused"
+
+    @staticmethod
+    def parse_response(response_text: str) -> Dict[str, Any]:
+        """
+        Parse and strictly validate a fused extraction response.
+
+        Raises:
+            FusedParseError: if the text is not a JSON object with a known
+                ``form_type``, an object ``fields`` and a non-empty ``department``.
+        """
+        cleaned = response_text.strip()
+        # Models often wrap JSON in a markdown code fence
+        if cleaned.startswith("```"):
+            cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else ""
+            cleaned = cleaned.rsplit("```", 1)[0]
+        try:
+            data = json.loads(cleaned)
+        except json.JSONDecodeError as e:
+            raise FusedParseError(f"Fused response is not valid JSON: {e}")
+        if not isinstance(data, dict):
+            raise FusedParseError("Fused response is not a JSON object")
+        missing = {"form_type", "fields", "department"} - set(data)
+        if missing:
+            raise FusedParseError(f"Fused response is missing keys: {sorted(missing)}")
+        if data["form_type"] not in FORM_TYPES:
+            raise FusedParseError(f"Fused response has unknown form_type: {data['form_type']!r}")
+        if not isinstance(data["fields"], dict):
+            raise FusedParseError("Fused response 'fields' is not an object")
+        if not isinstance(data["department"], str) or not data["department"].strip():
+            raise FusedParseError("Fused response 'department' is not a non-empty string")
+        return {
+            "form_type": data["form_type"],
+            "fields": data["fields"],
+            "department": data["department"].strip(),
+        }
+
+    async def call(self, text: str) -> Dict[str, Any]:
+        try:
+            logger.debug("tool_call_started", tool=self.name, text_length=len(text))
+
+            template = self.prompt
+            prompt = template.render(text, form_types=json.dumps(FORM_TYPES))
+            self.log_prompt(template, prompt)
+
+            payload = {
+                "contents": [{"parts": [{"text": prompt}]}],
+            }
+
+            client = get_gemini_client()
+            resp_json = await client.generate_content(payload)
+            result = self.parse_response(GeminiClient.response_text(resp_json))
+            logger.debug(
+                "tool_call_completed", tool=self.name, form_type=result["form_type"],
+                department=result["department"], fields=sorted(result["fields"]),
+            )
+            return result
+        except FusedParseError:
+            # Let the orchestrator fall back to the staged pipeline
+            raise
+        except UpstreamUnavailableError:
+            raise
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            logger.exception("tool_call_failed", tool=self.name)
+            raise Exception(f"Error in FusedExtractionTool.call: {str(e)}\n{error_trace}")
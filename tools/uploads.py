@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Any, BinaryIO, Callable, Optional, Union
+from fastapi.routing import APIRoute
+from starlette.datastructures import FormData
+from starlette.exceptions import HTTPException
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from tools.cache import content_hash
+from tools.log import get_logger
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def max_upload_bytes() -> int:
+    return int(os.environ.get("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+
+def max_request_bytes() -> int:
+    return int(os.environ.get("REQUEST_MAX_BYTES", str(100 * 1024 * 1024)))
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload or request body exceeds its size limit."""
+
+    def __init__(self, limit: int) -> None:
+        super().__init__(f"Upload exceeds the limit of {limit} bytes.")
+        self.limit = limit
+
+
+class SpooledUpload:
+    """
+    An uploaded file kept on disk rather than in memory.
+
+    ``sha256`` and the leading ``head`` bytes are captured while spooling, so
+    cache keys and format sniffing never need the whole content. Readers
+    open the file by path, which keeps concurrent readers (and OCR worker
+    processes, which receive the object pickled) independent of each other.
+    """
+
+    HEAD_BYTES = 1024
+
+    def __init__(self, path: str, size: int, sha256: str, head: bytes) -> None:
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.head = head
+
+    def __len__(self) -> int:
+        return self.size
+
+    def open(self) -> BinaryIO:
+        return open(self.path, "rb")
+
+    def read(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    def link(self) -> "SpooledUpload":
+        """
+        Another handle on the same content under its own path, so it stays
+        readable after this one is closed. Hard-linked, or copied where the
+        filesystem does not support links.
+        """
+        path = f"{self.path}-{uuid.uuid4().hex[:12]}"
+        try:
+            os.link(self.path, path)
+        except OSError:
+            shutil.copyfile(self.path, path)
+        return SpooledUpload(path, self.size, self.sha256, self.head)
+
+    def close(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# What the OCR path accepts: the image itself or an upload spooled to disk
+ImageData = Union[bytes, SpooledUpload]
+
+
+def data_head(data: ImageData) -> bytes:
+    return data.head if isinstance(data, SpooledUpload) else data[:SpooledUpload.HEAD_BYTES]
+
+
+def data_hash(data: ImageData) -> str:
+    """Same digest as ``content_hash`` of the bytes, so cache keys match either way."""
+    return data.sha256 if isinstance(data, SpooledUpload) else content_hash(data)
+
+
+def open_data(data: ImageData) -> BinaryIO:
+    return data.open() if isinstance(data, SpooledUpload) else io.BytesIO(data)
+
+
+class SpoolFile:
+    """
+    The file behind a multipart upload as it is received: written straight
+    to ``UPLOAD_SPOOL_DIR`` under its own path, hashed as it goes, and
+    refused with ``UploadTooLargeError`` as soon as it passes ``max_bytes``.
+
+    ``claim`` hands the spooled file over as a ``SpooledUpload`` without
+    copying it; a file nobody claimed is removed when the request's form is
+    closed.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, directory: Optional[str] = None) -> None:
+        self.max_bytes = max_bytes if max_bytes is not None else max_upload_bytes()
+        fd, self.path = tempfile.mkstemp(prefix="upload-", dir=directory or os.environ.get("UPLOAD_SPOOL_DIR") or None)
+        self._file = os.fdopen(fd, "w+b")
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.claimed = False
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        if len(self.head) < SpooledUpload.HEAD_BYTES:
+            self.head += data[:SpooledUpload.HEAD_BYTES - len(self.head)]
+        self._digest.update(data)
+        self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def seek(self, offset: int) -> None:
+        self._file.seek(offset)
+
+    def claim(self) -> SpooledUpload:
+        self._file.flush()
+        self.claimed = True
+        return SpooledUpload(self.path, self.size, self._digest.hexdigest(), self.head)
+
+    def close(self) -> None:
+        self._file.close()
+        if not self.claimed:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+async def spool_upload(source: Any, max_bytes: Optional[int] = None, directory: Optional[str] = None) -> SpooledUpload:
+    """
+    The spooled file behind an ``UploadFile`` parsed by ``SpoolingMultiPartParser``,
+    claimed as is. Anything else with an async ``read(size)`` is copied to a
+    temporary file in ``UPLOAD_SPOOL_DIR`` chunk by chunk, hashing as it goes.
+
+    Raises ``UploadTooLargeError`` as soon as more than ``max_bytes``
+    (``UPLOAD_MAX_BYTES``) have been read; the partial file is removed.
+    """
+    if isinstance(getattr(source, "file", None), SpoolFile):
+        return source.file.claim()
+    max_bytes = max_bytes if max_bytes is not None else max_upload_bytes()
+    directory = directory or os.environ.get("UPLOAD_SPOOL_DIR") or None
+    loop = asyncio.get_running_loop()
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=directory)
+    digest, size, head = hashlib.sha256(), 0, b""
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                if len(head) < SpooledUpload.HEAD_BYTES:
+                    head += chunk[:SpooledUpload.HEAD_BYTES - len(head)]
+                digest.update(chunk)
+                await loop.run_in_executor(None, f.write, chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path, size, digest.hexdigest(), head)
+
+
+class SpoolingMultiPartParser(MultiPartParser):
+    """
+    Starlette's multipart parser, with each file part written to a
+    ``SpoolFile`` instead of a spooled temporary file, so ``UPLOAD_MAX_BYTES``
+    is enforced per file while the body streams in and the spool is reused
+    by the endpoint rather than copied.
+    """
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        upload = self._current_part.file
+        if upload is not None:
+            upload.file.close()
+            upload.file = self._files_to_close_on_error[-1] = SpoolFile()
+
+    async def parse(self) -> FormData:
+        try:
+            return await super().parse()
+        except BaseException:
+            # Starlette only cleans up on malformed bodies; drop the partial spools on any failure
+            for file in self._files_to_close_on_error:
+                file.close()
+            raise
+
+
+class UploadRequest(Request):
+    """A request whose multipart form is parsed by ``SpoolingMultiPartParser``."""
+
+    async def form(self, **kwargs: Any) -> FormData:
+        if self._form is None and self.headers.get("content-type", "").startswith("multipart/form-data"):
+            try:
+                self._form = await SpoolingMultiPartParser(self.headers, self.stream()).parse()
+            except UploadTooLargeError as e:
+                logger.warning("upload_too_large", limit=e.limit)
+                raise HTTPException(status_code=413, detail=str(e))
+            except MultiPartException as e:
+                raise HTTPException(status_code=400, detail=e.message)
+        return await super().form(**kwargs)
+
+
+class UploadRoute(APIRoute):
+    """Route class (``app.router.route_class``) handing endpoints an ``UploadRequest``."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(UploadRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping request bodies at ``REQUEST_MAX_BYTES``.
+
+    Requests whose ``Content-Length`` is over the limit get a 413 before any
+    of the body is read; chunked bodies are counted as they stream in and
+    fail with 413 as soon as they pass the limit, so an oversized upload
+    never finishes spooling to disk.
+    """
+
+    def __init__(self, app: Any, max_bytes: Optional[int] = None) -> None:
+        self.app = app
+        self.max_bytes = max_bytes if max_bytes is not None else max_request_bytes()
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        detail = f"Request body exceeds the limit of {self.max_bytes} bytes."
+        content_length = dict(scope.get("headers") or []).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            logger.warning("request_too_large", content_length=int(content_length), limit=self.max_bytes)
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive() -> Any:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    logger.warning("request_too_large", received=received, limit=self.max_bytes)
+                    # Passed through FastAPI's body parsing unchanged and answered by its exception handler
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
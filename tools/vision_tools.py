@@ -1,8 +1,13 @@
 from google.adk.tools import BaseTool as Tool
-import base64
-import aiohttp
-import os
 import traceback
+from typing import Optional
+from tools.gemini_client import GeminiClient, InlineData, get_gemini_client
+from tools.governance import UpstreamUnavailableError
+from tools.image_preprocessing import ImagePreprocessor
+from tools.log import get_logger
+from tools.uploads import ImageData
+
+logger = get_logger(__name__)
 
 class VisionTools(Tool):
     def __init__(self) -> None:
@@ -10,65 +15,51 @@ class VisionTools(Tool):
             name="gemini_vision_tool",
             description="Extracts text from an image using Google Gemini Vision.",
         )
-        print(f"VisionTools initialized with name: {self.name}")
+        self.preprocessor = ImagePreprocessor()
+        logger.debug("tool_initialized", tool=self.name)
+
+    PROMPT_TEMPLATE = "Extract all text from this document."
 
-    async def call(self, image_bytes: bytes) -> str:
+    async def call(self, image_bytes: ImageData, mime_type: Optional[str] = None) -> str:
         """
         Extracts text from an image using the Google Gemini Vision API.
 
         Args:
-            image_bytes: The raw bytes of the image.
+            image_bytes: The raw bytes of the image, or the upload spooled to
+                disk, which is then streamed to Gemini without being loaded.
+            mime_type: MIME type of ``image_bytes`` if they have already been
+                preprocessed; when omitted the image is preprocessed here.
 
         Returns:
             The extracted text as a string.
         """
         try:
-            print(f"VisionTools.call started with image of size: {len(image_bytes)} bytes")
-            
-            GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-            if not GEMINI_API_KEY:
-                raise ValueError("GEMINI_API_KEY environment variable not set.")
-            print("GEMINI_API_KEY found in environment variables")
-            
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            print(f"Image encoded to base64 string of length: {len(base64_image)}")
-            
-            # Updated URL to use Gemini 1.5 Flash instead of the deprecated Gemini Pro Vision
-            url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
+            logger.debug("tool_call_started", tool=self.name, image_bytes=len(image_bytes))
+
+            if mime_type is None:
+                image_bytes, mime_type, info = await self.preprocessor.aprocess(image_bytes)
+                logger.debug("image_preprocessed", **info)
+
             payload = {
                 "contents": [{
                     "parts": [
-                        {"text": "Extract all text from this document."},
+                        {"text": self.PROMPT_TEMPLATE},
                         {"inline_data": {
-                            "mime_type": "image/jpeg",
-                            "data": base64_image
+                            "mime_type": mime_type,
+                            "data": InlineData(image_bytes)
                         }}
                     ]
                 }]
             }
-            print("Prepared request payload for Gemini API")
 
-            print(f"Making API request to Gemini Vision at: {url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    print(f"Received response with status: {response.status}")
-                    if response.status == 200:
-                        resp_json = await response.json()
-                        print("Successfully parsed JSON response")
-                        text = resp_json['candidates'][0]['content']['parts'][0]['text']
-                        print(f"Extracted text of length: {len(text)}")
-                        return text
-                    else:
-                        error_text = await response.text()
-                        print(f"API error: {response.status} - {error_text}")
-                        raise Exception(f"Gemini API error: {response.status} - {error_text}")
+            client = get_gemini_client()
+            resp_json = await client.generate_content(payload)
+            text = GeminiClient.response_text(resp_json)
+            logger.debug("tool_call_completed", tool=self.name, text_length=len(text))
+            return text
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             error_trace = traceback.format_exc()
-            print(f"Error in VisionTools.call: {str(e)}")
-            print(f"Traceback: {error_trace}")
+            logger.exception("tool_call_failed", tool=self.name)
             raise Exception(f"Error in VisionTools.call: {str(e)}\n{error_trace}")